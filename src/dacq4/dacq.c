@@ -190,8 +190,15 @@
 ** Thu Oct 21 15:18:27 2010 mazer 
 **   new: dacq_clockreset() -- tells comedi_server to reset the internal
 **   timestamp clock.
+**
+** Thu Oct 22 09:48:10 2026 mazer
+**   new: dacq_adbuf_bulk() -- copies a whole slice of one adbuf
+**   channel out of shared memory in a single call (returned as a
+**   python string of native doubles/ints, ready for fromstring()).
+**   Replaces the per-sample dacq_adbuf_xxx(i) loops in pype.py.
 */
 
+#include <Python.h>				/* must come first.. */
 #include <sys/types.h>
 #include <time.h>
 #include <sys/time.h>
@@ -810,6 +817,56 @@ int dacq_adbuf(int n, int ix)
   return(i);
 }
 
+/*
+ * Bulk export of the a/d buffers: returns samples [start, start+count)
+ * of one channel as a python string of raw native values (doubles for
+ * ADBUF_T, ints for everything else). count < 0 means everything up
+ * to the current end of the buffer. The copy is made while holding
+ * the lock, so it's a consistent snapshot even if the server's still
+ * sampling.
+ */
+PyObject *dacq_adbuf_bulk(int which, int start, int count)
+{
+  PyObject *s;
+  char *src;
+  int n, size;
+
+  LOCK(semid);
+  n = dacq_data->adbuf_ptr;
+  if (n > ADBUFLEN) n = ADBUFLEN;
+  if (start < 0) start = 0;
+  if (start > n) start = n;
+  if (count < 0 || start + count > n) count = n - start;
+
+  size = sizeof(int);
+  switch (which) {
+  case ADBUF_T:
+    src = (char *) &dacq_data->adbuf_t[start];
+    size = sizeof(double);
+    break;
+  case ADBUF_X:
+    src = (char *) &dacq_data->adbuf_x[start];
+    break;
+  case ADBUF_Y:
+    src = (char *) &dacq_data->adbuf_y[start];
+    break;
+  case ADBUF_PA:
+    src = (char *) &dacq_data->adbuf_pa[start];
+    break;
+  default:
+    if (which < 0 || which >= NADC) {
+      UNLOCK(semid);
+      PyErr_SetString(PyExc_ValueError, "dacq_adbuf_bulk: bad channel");
+      return(NULL);
+    }
+    src = (char *) &dacq_data->adbufs[which][start];
+    break;
+  }
+  s = PyString_FromStringAndSize(src, count * size);
+  UNLOCK(semid);
+  return(s);
+}
+
 /*
  * these functions are just for backward compatibility
  */
@@ -27,7 +27,18 @@
 **
 ** Wed Oct 20 15:40:26 2010 mazer 
 **   dacq_adbuf_t() returns double instead of unsigned long
+**
+** Thu Oct 22 09:48:10 2026 mazer
+**   added dacq_adbuf_bulk() and ADBUF_xxx channel selectors
+*/
+
+/* channel selectors for dacq_adbuf_bulk(); 0..NADC-1 select the
+** raw a/d channels (same as dacq_adbuf(n, ix))
 */
+#define ADBUF_T		-1
+#define ADBUF_X		-2
+#define ADBUF_Y		-3
+#define ADBUF_PA	-4
 
 extern int dacq_start(char *server, char *tracker, char *port, char *elopt,
 		      char *elcam, char *swapxy, char *usbjs);
@@ -81,6 +92,7 @@ extern int dacq_adbuf_c1(int ix);
 extern int dacq_adbuf_c2(int ix);
 extern int dacq_adbuf_c3(int ix);
 extern int dacq_adbuf_c4(int ix);
+extern PyObject *dacq_adbuf_bulk(int which, int start, int count);
 
 extern int dacq_eye_smooth(int kn);
 extern void dacq_set_pri(int dacq_pri);
@@ -1,6 +1,13 @@
 # -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
 
-import time
+import time, struct
+
+ADBUF_T = -1
+ADBUF_X = -2
+ADBUF_Y = -3
+ADBUF_PA = -4
+
+NADC = 4						# raw a/d channels (same as dacqinfo.h)
 
 def dacq_start(dummy1, dummy2, dummy3, dummy4, dummy5):
 	return 1
@@ -110,6 +117,17 @@ def dacq_adbuf_c3(dummy):
 def dacq_adbuf_c4(dummy):
 	return 1
 
+def dacq_adbuf_bulk(which, start, count):
+	if which not in (ADBUF_T, ADBUF_X, ADBUF_Y, ADBUF_PA) and \
+		   (which < 0 or which >= NADC):
+		raise ValueError, 'dacq_adbuf_bulk: bad channel'
+	n = dacq_adbuf_size() - start
+	if count >= 0:
+		n = max(0, min(count, n))
+	if which == ADBUF_T:
+		return struct.pack('%dd' % n, *([1.0] * n))
+	return struct.pack('%di' % n, *([1] * n))
+
 def dacq_adbuf_photo(dummy):
 	return 1
 
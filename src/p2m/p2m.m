@@ -36,6 +36,10 @@ function pf = p2m(pypefile, oldpf)
 % Fri Oct 22 12:54:54 2010 mazer 
 %   added wildcard support -- pypefile can contain wildcards and each
 %   file will get p2m'd
+%
+% Tue Oct 27 09:48:13 2026 mazer
+%   pype_expander.py now writes a binary .mat file that just gets
+%   load()'d, instead of a script that has to be eval()'d
 %  
 
 if nargin == 0
@@ -61,7 +65,7 @@ elseif ischar(oldpf)
   oldpf = p2mLoad(oldpf);
 end
 
-tmpf = [tempname '.m'];
+tmpf = [tempname '.mat'];
 
 if isempty(oldpf)
   n = 0;
@@ -86,7 +90,7 @@ try
   cd(tempdir)
   try
     tic;
-    eval(strrep(basename(tmpf),'.m',''));
+    load(tmpf);
     et = [et toc];
   catch
     err = lasterror;
@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env pypenv
 # -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
 # $Id: pyplex.py 33 2005-07-13 00:30:26Z mazer $
 
@@ -6,16 +6,20 @@
 Tools for extracting data from Plexon .plx files
 ------------------------------------------------
 
-usage: plx2asc.py  [-i] [-v] [-p outprefix] plxfile
+usage: plx2asc.py  [-i] [-v] [-b] [-n] [-p outprefix] plxfile
 
   -i     list summary info for spike & lfp channels
   -h     just dump header info
   -v     verbose dump (debugging only!)
-  -p str filename/dir prefix for output files
+  -p str filename/dir prefix for output files (default is plxfile,
+         ie, foo.plx --> foo.plx.hdr etc)
           prefix+'.hdr'  --> hdr info
           prefix+'.spk'  --> spike times
           prefix+'.spw'  --> spike waveforms
           prefix+'.lfp'  --> spike lfp signals
+  -b     also write compact binary files to directory prefix+'.bin'
+         (see pypeplx.BinaryWriter for the layout)
+  -n     no ascii .spk/.spw/.lfp files (just .hdr and -b output)
 
 Output Files
 ------------
@@ -77,9 +81,17 @@ Wed May  7 10:46:17 2008 mazer
   - DataRecord.ts was not being correctly computed -- the MSB word was
     typically being set to 1 (val<40 instead of val<<40..) regenerated
 	plx files after fixing..
+Wed Oct 28 10:17:52 2026 mazer
+  - data blocks are decoded in bulk from a memory mapped file by
+    pypeplx.PlxFile (runs of same sized blocks are one Numeric array)
+    and the ascii output is formatted a run at a time -- same output,
+    much faster. Added -b for compact binary output (-n to skip the
+    ascii files).
 """
 
 import sys, struct
+import Numeric
+import pypeplx
 
 class NotPlx(Exception): pass
 
@@ -376,147 +388,137 @@ def info(fname):
 							 (s.SIGName, s.NUnits, ))
 
 
-def xall(fname, prefix):
+def _spikes(h, out, trial, d, t):
+	# one line per spike
+	out.write(''.join(['%d\t%d\t%d\t%f\n' % x for x in
+					   zip(trial.tolist(), d.channel.tolist(),
+						   d.unit.tolist(), (1000.0 * t).tolist())]))
+
+def _volts(w, maxmag, denom):
+	# convert waveform value to voltage (from plexon docs, this is
+	# corret for file version >= 103 ONLY!) -- same arithmetic as the
+	# old sample-by-sample code, so the output doesn't change..
+	return 1000.0 * ((w.astype(Numeric.Float) * maxmag) /
+					 denom[:,Numeric.NewAxis])
+
+def _times(t, nw, freq):
+	return 1000.0 * (t[:,Numeric.NewAxis] +
+					 (Numeric.arange(nw) / freq)[Numeric.NewAxis,:])
+
+def _spikewaves(h, out, trial, d, t):
+	# one line per waveform sample + NaN divider
+	# note that need to -1 to access h.Channels using d.Channel
+	# since 'channel' values are 1-based for spike data..
+	nw = d.waves.shape[1]
+	denom = Numeric.array([0.5 * (2.0**h.BitsPerSpikeSample) *
+						   h.channels[c-1].Gain * h.SpikePreAmpGain
+						   for c in d.channel.tolist()])
+	v = _volts(d.waves, h.SpikeMaxMagnitudeMV, denom).tolist()
+	tt = _times(t, nw, float(h.ADFrequency)).tolist()
+	lines = []
+	for (j, tn, c, u) in zip(range(len(trial)), trial.tolist(),
+							 d.channel.tolist(), d.unit.tolist()):
+		pre = '%d\t%d\t%d\t' % (tn, c, u)
+		(tj, vj) = (tt[j], v[j])
+		lines.extend([pre + '%d\t%f\t%d\n' % (i, tj[i], vj[i])
+					  for i in range(nw)])
+		lines.append(pre + 'NaN\tNaN\tNaN\n')
+	out.write(''.join(lines))
+
+def _lfp(h, out, trial, d, t):
+	# one line per sample; +1 on channel to match spike channels
+	# (refs for h.slow via d.Channel are correct, since 'channel'
+	# values are 0-based for lfp..)
+	nw = d.waves.shape[1]
+	denom = Numeric.array([0.5 * (2.0**h.BitsPerSlowSample) *
+						   h.slows[c].Gain * h.slows[c].PreAmpGain
+						   for c in d.channel.tolist()])
+	v = _volts(d.waves, h.SlowMaxMagnitudeMV, denom).tolist()
+	tt = _times(t, nw, float(h.slow_adfreq)).tolist()
+	lines = []
+	for (j, tn, c) in zip(range(len(trial)), trial.tolist(),
+						  d.channel.tolist()):
+		pre = '%d\t%d\t' % (tn, c+1)
+		(tj, vj) = (tt[j], v[j])
+		lines.extend([pre + '%f\t%f\n' % (tj[i], vj[i])
+					  for i in range(nw)])
+	out.write(''.join(lines))
+
+def xall(fname, prefix, ascii=1, binary=None):
 	spikes = 1
 	lfp = 1
 	
 	if prefix is None:
+		# no -p: outputs go next to the plx file (foo.plx.hdr etc)
 		prefix = fname
 
 	f = open(fname, 'r')
 	h = FileHeader(f)
+	f.close()
 
-	t0 = 0.0;
-	trial_number = 0
-
-	if prefix is None:
-		o = '/dev/null'
-	else:
-		o = prefix + '.hdr'
-		#sys.stderr.write('header -> %s\n' % o)
-	hdrout = open(o, 'w')
+	hdrout = open(prefix + '.hdr', 'w')
 	hdrout.write('% channel nunits lfp\n')
-
-	if prefix is None:
-		o = '/dev/null'
-	else:
-		o = prefix + '.spk'
-		#sys.stderr.write('spikes -> %s\n' % o)
-	spikeout = open(o, 'w')
-	spikeout.write('% trial channel unit time\n')
-	
-	if prefix is None:
-		o = '/dev/null'
-	else:
-		o = prefix + '.spw'
-		#sys.stderr.write('spike waveforms -> %s\n' % o)
-	spwout = open(o, 'w')
-	spwout.write('% trial channel unit index time volt\n')
-
-	if prefix is None:
-		o = '/dev/null'
-	else:
-		o = prefix + '.lfp'
-		#sys.stderr.write('lfp -> %s\n' % o)
-	lfpout = open(o, 'w')
-	lfpout.write('% trial channel time volt\n')
-
 	for i in range(h.NumDspChannels):
 		hdrout.write('%d\t' % (i+1,))
 		hdrout.write('%d\t' % h.channels[i].NUnits)
 		hdrout.write('%d\n' % h.slows[i].Enabled)
+	hdrout.close()
+
+	if ascii:
+		o = prefix
+	else:
+		o = None
+	if o is None:
+		spikeout = spwout = lfpout = None
+	else:
+		spikeout = open(o + '.spk', 'w')
+		spikeout.write('% trial channel unit time\n')
+		spwout = open(o + '.spw', 'w')
+		spwout.write('% trial channel unit index time volt\n')
+		lfpout = open(o + '.lfp', 'w')
+		lfpout.write('% trial channel time volt\n')
 
 	nspikes = 0
 	nsamps = 0
 	nwavesamps = 0
-	nrec = 0
-
-	t0 = None
-	adshift = None
-
-	while 1:
-		try:
-			d = DataRecord(f)
-			nrec = nrec + 1
-		except EOFError:
-			break
-
-		if d.Type == PL_EVENT and d.Channel == PL_XSTART:
-			if t0 is None:
-				t0 = float(d.ts)
-				trial_number = trial_number + 1
+
+	plx = pypeplx.PlxFile(fname)
+	if binary:
+		bout = pypeplx.BinaryWriter(plx, prefix + '.bin')
+	else:
+		bout = None
+	try:
+		for (kind, trial, d, t) in plx.trialdata():
+			if kind == pypeplx.PL_SLOW and lfp:
+				if lfpout:
+					_lfp(h, lfpout, trial, d, t)
+				nsamps += Numeric.size(d.waves)
+			elif kind == pypeplx.PL_SPIKE and spikes:
+				if spikeout:
+					_spikes(h, spikeout, trial, d, t)
+					_spikewaves(h, spwout, trial, d, t)
+				nspikes += len(trial)
+				nwavesamps += Numeric.size(d.waves)
 			else:
-				sys.stderr.write('double XSTART: trial %d\n' % trial_number)
-				sys.exit(1)
-			
-		elif d.Type == PL_EVENT and d.Channel == PL_XSTOP:
-			t0 = None
-
-		elif lfp and d.Type == PL_SLOW and (not t0 is None):
-			if adshift is None:
-				# assume the very first LFP sample in the file starts
-				# at time ZERO (for pype, this is the same time as the
-				# very first PL_XSTART). The assumption here is that
-				# the NIDAQ card lags a bit behind the MAP box (group
-				# delay), so timestamps are later than the actual time
-				# the data came in, but the 1st sample should really be
-				# zero..
-				adshift = d.ts
-				
-			# compute timestamp in secs
-			ts = (float(d.ts) - t0 - adshift) / float(h.ADFrequency)
-			
-			for i in range(len(d.waveform)):
-				# convert waveform value to voltage (from plexon docs,
-				# this is corret for file version >= 103 ONLY!)
-				# note that refs for h.slow via d.Channel are correct, since
-				# 'channel' values are 0-based for lfp..
-				v = float(d.waveform[i])
-				v = (v * h.SlowMaxMagnitudeMV) / \
-					(0.5 * (2.0**h.BitsPerSlowSample) * \
-					 h.slows[d.Channel].Gain * h.slows[d.Channel].PreAmpGain)
-
-				# the +1 on d.Channel
-				lfpout.write("%d\t%d\t%f\t%f\n" % \
-							 (trial_number, d.Channel+1, \
-							  1000.0 * (ts + (float(i) / float(h.slow_adfreq))),
-							  1000.0 * v))
-				nsamps += 1
-
-		elif spikes and d.Type == PL_SPIKE and (not t0 is None):
-			# compute timestamp in secs
-			ts = (float(d.ts) - t0) / float(h.ADFrequency)
-			spikeout.write("%d\t%d\t%d\t%f\n" % 
-						   (trial_number, d.Channel, d.Unit, 1000.0 * ts))
-			nspikes += 1
-			for i in range(len(d.waveform)):
-				# convert waveform value to voltage (from plexon docs,
-				# this is corret for file version >= 103 ONLY!)
-				# note that need to -1 to access h.Channels using d.Channel
-				# since 'channel' values are 1-based for spike data..
-				v = float(d.waveform[i])
-				v = (v * h.SpikeMaxMagnitudeMV) / \
-					(0.5 * (2.0**h.BitsPerSpikeSample) * \
-					 h.channels[d.Channel-1].Gain * h.SpikePreAmpGain)
-				spwout.write("%d\t%d\t%d\t%d\t%f\t%d\n" % \
-						  (trial_number, d.Channel, d.Unit, \
-							  i, 1000.0 * (ts + (i / float(h.ADFrequency))),
-							  1000.0 * v))
-				nwavesamps += 1
-			spwout.write("%d\t%d\t%d\tNaN\tNaN\tNaN\n" % \
-						 (trial_number, d.Channel, d.Unit))
-
-	sys.stderr.write('%d trials\n' % trial_number)
+				continue
+			if bout:
+				bout.write(kind, trial, d, t)
+	except pypeplx.PlxError, e:
+		sys.stderr.write('%s\n' % e)
+		sys.exit(1)
+
+	sys.stderr.write('%d trials\n' % plx.clock.trial)
 	sys.stderr.write(' %d spikes\n' % nspikes)
 	sys.stderr.write(' %d spike waveform samples\n' % nwavesamps)
 	sys.stderr.write(' %d slow samples\n' % nsamps)
 	
-	f.close()
-	
-	spikeout.close()
-	lfpout.close()
-	spwout.close()
-	hdrout.close()
+	plx.close()
+	if bout:
+		bout.close()
+	if spikeout:
+		spikeout.close()
+		lfpout.close()
+		spwout.close()
 	
 	return 1
 		
@@ -535,10 +537,17 @@ if __name__ == '__main__':
 				 help='info on channels')
 	
 	
+	p.add_option('-b', '--binary', dest='binary',
+				 action='store_true', default=0,
+				 help='compact binary output (prefix.bin/)')
+	p.add_option('-n', '--noascii', dest='noascii',
+				 action='store_true', default=0,
+				 help='no ascii spike/lfp files')
+	
 	# options with mandatory arguments
 	p.add_option('-p', '--prefix', dest='prefix',
 				 action='store', type='string', default=None,
-				 help='file prefix for ascii dump files')
+				 help='file prefix for output files (default: plx-file)')
 
 	(options, args) = p.parse_args()
 
@@ -548,7 +557,8 @@ if __name__ == '__main__':
 		elif options.info:
 			info(args[0])
 		else:
-			xall(args[0], options.prefix)
+			xall(args[0], options.prefix,
+				 ascii=not options.noascii, binary=options.binary)
 	except NotPlx:
 		sys.stderr.write('"%s" is not a plx file\n' % args[0])
 		sys.exit(1)
@@ -32,14 +32,33 @@ Thu Jan 29 14:05:22 2009 mazer
 
 Fri Jan 30 10:59:42 2009 mazer
   updated to use single monster output file.. even fast, I think..
+
+Tue Oct 27 09:48:13 2026 mazer
+  If the output file ends in '.mat', write a binary (level 5) MAT-file
+  directly (see pypemat.py) instead of a matlab script: same rec(n)
+  and extradata layout, but vectors go straight from the record
+  arrays to disk and matlab just load()s the result. Floats are saved
+  at full precision instead of '%f'. p2m.m uses this now.
+
+Tue Oct 27 14:31:09 2026 mazer
+  .mat output: trials before 'startat' aren't loaded at all anymore
+  (the record index gives the count), '-i' keeps a checkpoint next to
+  the output file so repeated conversions of a growing datafile only
+  expand the new trials (see Checkpoint), and '-j nproc' expands
+  ranges of trials in parallel worker processes, stitched back
+  together in trial order.
   
 """
-import sys, types, string, math
+import sys, os, types, string, math, cPickle, getopt
+import multiprocessing
 from Numeric import *
 from pype import *
 from events import *
 from pypedata import *
-from tempfile import mktemp
+from tempfile import mktemp, mkstemp
+import pypemat
+
+CHUNKSIZE = 100					# trials per worker job (expandFileMat)
 
 __TMPVAR__ = 0;
 
@@ -245,7 +264,7 @@ def expandRecord(fname, fp, n, d, xd):
 	# Fri Jan 25 13:02:10 2008 mazer 
 	#   modified to work with both plexon and tdt data
 	# 
-	if d.plex_times:
+	if d.plex_times is not None:
 		writeVector(fp, objname, 'plx_times', d.plex_times, '%d')
 		writeVector(fp, objname, 'plx_channels', d.plex_channels, '%d')
 		writeVector(fp, objname, 'plx_units', d.plex_units, '%d')
@@ -316,25 +335,345 @@ def expandFile(fname, outfile, startat=0):
 	if recno > 0:
 		sys.stderr.write('\n')
 
+def matvalue(v):
+	# same conversions as printify(), but to pypemat values
+	if type(v) is types.IntType or type(v) is types.FloatType:
+		return v
+	elif type(v) is types.ListType or type(v) is types.TupleType:
+		return map(matvalue, v)
+	else:
+		s = '%s' % (v,)
+		return string.join(string.split(s, "\n"), "")
+
+def matDict(dict):
+	# same as writeDict()
+	s = pypemat.Struct()
+	for k in dict.keys():
+		v = dict[k]
+		if type(v) is types.StringType:
+			n = 0
+		else:
+			try:
+				n = len(v)
+			except TypeError:
+				n = 0
+		if n == 0:
+			s[matlabify(k)] = matvalue(v)
+		else:
+			s[matlabify(k)] = [matvalue(v[j]) for j in range(n)]
+	return s
+
+def matVector(d, attr=None, index=None):
+	# vector fields: Nx1 doubles or [] if missing
+	try:
+		if attr:
+			v = getattr(d, attr)
+		else:
+			v = d.rec
+			for i in index:
+				v = v[i]
+	except (AttributeError, IndexError, TypeError):
+		return None
+	if v is None or len(v) == 0:
+		return None
+	return Numeric.array(v, 'd')
+
+def matRecord(n, d):
+	"""Fields of rec(n+1) (see expandRecord), as a pypemat.Struct."""
+	d.compute()
+	s = pypemat.Struct()
+	s['pype_recno'] = n
+	s['taskname'] = '%s' % d.taskname
+	s['trialtime'] = '%s' % d.trialtime
+	s['result'] = '%s' % d.result
+	try:
+		s['rt'] = int('%d' % d.rt)
+	except TypeError:
+		s['rt'] = '%s' % d.rt
+	s['record_id'] = int(d.rec[8])
+
+	s['userparams'] = matDict(d.userparams)
+	s['params'] = matDict(d.params)
+	if len(d.rest):
+		s['rest'] = map(matvalue, d.rest)
+
+	if len(d.events):
+		s['ev_t'] = Numeric.array([[int(t) for (t, e) in d.events]], 'd')
+		s['ev_e'] = ['%s' % e for (t, e) in d.events]
+
+	s['spike_times'] = matVector(d, 'spike_times')
+	s['photo_times'] = matVector(d, 'photo_times')
+	s['realt'] = matVector(d, 'realt')
+	s['eyet'] = matVector(d, 'eyet')
+	s['raw_photo'] = matVector(d, index=(9,))
+	s['raw_spike'] = matVector(d, index=(10,))
+
+	# PlexNet/TDT spikes
+	if d.plex_times is not None:
+		s['plx_times'] = matVector(d, 'plex_times')
+		s['plx_channels'] = matVector(d, 'plex_channels')
+		s['plx_units'] = matVector(d, 'plex_units')
+	elif len(d.rec) > 13 and d.rec[13] is not None:
+		plist = Numeric.array(d.rec[13], 'd')
+		if len(plist):
+			s['plx_times'] = plist[:,0]
+			s['plx_channels'] = plist[:,1]
+			s['plx_units'] = plist[:,2]
+		else:
+			s['plx_times'] = s['plx_channels'] = s['plx_units'] = None
+
+	for chn in range(0, 7):
+		s['c%d' % chn] = matVector(d, index=(11, chn))
+
+	s['eyex'] = matVector(d, 'eyex')
+	s['eyey'] = matVector(d, 'eyey')
+	s['eyep'] = matVector(d, index=(12,))
+	return s
+
+def matExtradata(extradata):
+	x = []
+	for n in range(len(extradata)):
+		s = pypemat.Struct()
+		s['id'] = matvalue(extradata[n].id)
+		if len(extradata[n].data):
+			s['data'] = map(matvalue, extradata[n].data)
+		x.append(s)
+	return x
+
+def _expandRange(args):
+	# worker: expand trials [lo, hi) into a spool file of their own
+	(fname, lo, hi, startat) = args
+	pf = PypeFile(fname, filter=None, quiet=1)
+	(fd, sname) = mkstemp(suffix='.spool')
+	os.close(fd)
+	spool = pypemat.Spool(sname)
+	try:
+		for recno in range(lo, hi):
+			if recno < startat:
+				spool.append(())
+			else:
+				spool.append(matRecord(recno, pf.nth(recno)))
+		spool.flush()
+	finally:
+		spool.close()
+		pf.close()
+	return (sname, spool.state())
+
+class Checkpoint:
+	"""Incremental expansion state for one MAT output file.
+
+	Lives next to the output file: outfile.ckpt (what's been done so
+	far) and outfile.spool (the already encoded rec(n) elements, see
+	pypemat.Spool). Each run only expands the trials added to the
+	datafile since the last one, then rewrites outfile from the spool.
+	The checkpoint's thrown away if the datafile's been replaced or
+	truncated (last expanded trial isn't where it used to be).
+
+	"""
+	VERSION = 1
+
+	def __init__(self, outfile, pf):
+		self.fname = outfile + '.ckpt'
+		self.sname = outfile + '.spool'
+		self.source = os.path.abspath(pf.source)
+		self.nrecs = 0					# trials expanded
+		self.offset = None				# file offset of last one
+		self.nentries = 0				# index entries scanned for notes
+		self.extradata = []
+		state = self._read(pf)
+		self.spool = pypemat.Spool(self.sname, state)
+
+	def _read(self, pf):
+		try:
+			f = open(self.fname, 'rb')
+		except IOError:
+			return None
+		try:
+			try:
+				d = cPickle.load(f)
+			except (EOFError, cPickle.UnpicklingError, ValueError,
+					KeyError, IndexError, AttributeError, ImportError):
+				return None
+		finally:
+			f.close()
+		if type(d) is not types.DictType or \
+			   d.get('version') != self.VERSION or \
+			   d.get('source') != self.source or \
+			   not os.path.exists(self.sname):
+			return None
+		if d['nrecs'] > 0:
+			ix = pf._getindex()
+			if ix is None or len(ix.encodes()) < d['nrecs'] or \
+				   ix.offset(ix.encodes()[d['nrecs']-1]) != d['offset']:
+				sys.stderr.write('checkpoint: %s changed, starting over\n' %
+								 pf.source)
+				return None
+		self.nrecs = d['nrecs']
+		self.offset = d['offset']
+		self.nentries = d['nentries']
+		self.extradata = d['extradata']
+		return d['spool']
+
+	def save(self, pf):
+		"""Record progress (spool's flushed first)."""
+		self.spool.flush()
+		self.nrecs = len(self.spool)
+		ix = pf._getindex()
+		if self.nrecs > 0 and ix is not None:
+			self.offset = ix.offset(ix.encodes()[self.nrecs-1])
+		tmp = '%s.%d' % (self.fname, os.getpid())
+		f = open(tmp, 'wb')
+		cPickle.dump({'version': self.VERSION,
+					  'source': self.source,
+					  'nrecs': self.nrecs,
+					  'offset': self.offset,
+					  'nentries': self.nentries,
+					  'extradata': self.extradata,
+					  'spool': self.spool.state(), }, f, 1)
+		f.close()
+		os.rename(tmp, self.fname)
+
+def expandFileMat(fname, outfile, startat=0, incremental=0, nproc=1,
+				  chunksize=CHUNKSIZE):
+	"""Like expandFile(), but writes a binary MAT-file.
+
+	**incremental** -- keep a checkpoint next to outfile and only
+	expand trials added since the last run (see Checkpoint); not
+	for composite ('a+b') datafiles, they've no index to check the
+	checkpoint against (ValueError)
+
+	**nproc** -- number of worker processes for expanding the new
+	trials (None for one per cpu); each gets 'chunksize' trial
+	ranges and results are stitched together in trial order
+
+	"""
+	if nproc != 1:
+		# start the pool before touching any datafiles (see pypebatch)
+		pool = multiprocessing.Pool(nproc)
+	else:
+		pool = None
+
+	try:
+		pf = PypeFile(fname, filter=None)
+		if incremental and pf.source is None:
+			pf.close()
+			raise ValueError, \
+				  "%s: can't do incremental conversion of composite file" % \
+				  fname
+		if incremental:
+			ck = Checkpoint(outfile, pf)
+			spool = ck.spool
+		else:
+			ck = None
+			spool = pypemat.Spool()
+
+		ntrials = pf.ntrials()
+		if ntrials is None:
+			# no index (composite file) -- read through sequentially
+			recno = len(spool)
+			while 1:
+				d = pf.nth(recno)
+				if d is None:
+					break
+				elif recno < startat:
+					spool.append(())
+				else:
+					spool.append(matRecord(recno, d))
+				recno = recno + 1
+				_progress(1)
+			extradata = matExtradata(pf.extradata)
+		else:
+			first = len(spool)
+			if pool is None or ntrials - first <= chunksize:
+				for recno in range(first, ntrials):
+					if recno < startat:
+						spool.append(())
+					else:
+						spool.append(matRecord(recno, pf.nth(recno)))
+					_progress(1)
+			else:
+				work = []
+				for lo in range(first, ntrials, chunksize):
+					work.append((fname, lo, min(ntrials, lo + chunksize),
+								 startat))
+				for (sname, state) in pool.imap(_expandRange, work):
+					part = pypemat.Spool(sname, state)
+					spool.extend(part)
+					part.close()
+					os.unlink(sname)
+					_progress(len(part))
+			if ck:
+				(notes, ck.nentries) = pf.notes(ck.nentries)
+				ck.extradata.extend(matExtradata(notes))
+				extradata = ck.extradata
+			else:
+				extradata = matExtradata(pf.notes()[0])
+
+		mat = pypemat.MatFile(outfile)
+		spool.write(mat.fp, 'rec')
+		if len(extradata):
+			mat.write('extradata', extradata)
+		mat.close()
+		if ck:
+			ck.save(pf)
+		spool.close()
+		pf.close()
+		if len(spool) > 0:
+			sys.stderr.write('\n')
+	finally:
+		if pool is not None:
+			pool.terminate()
+
+def _progress(n):
+	sys.stderr.write('.' * n)
+	sys.stderr.flush()
+
 if __name__ == '__main__':
 	PROFILE = 0
-	if len(sys.argv) < 3:
-		sys.stderr.write("Usage: pype_expander pypefile outfile [startat]\n")
+	usage = "Usage: pype_expander [-i] [-j nproc] pypefile outfile [startat]\n"
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'ij:')
+	except getopt.GetoptError:
+		sys.stderr.write(usage)
 		sys.exit(1)
-	if len(sys.argv) > 3:
-		n = int(sys.argv[3])
+	if len(args) < 2:
+		sys.stderr.write(usage)
+		sys.exit(1)
+	if len(args) > 2:
+		n = int(args[2])
 	else:
 		n = 0
 
+	# -i and -j only apply to .mat output:
+	#   -i        incremental (checkpointed) conversion
+	#   -j nproc  use nproc worker processes (0 for one per cpu)
+	kw = {}
+	for (opt, val) in opts:
+		if opt == '-i':
+			kw['incremental'] = 1
+		elif opt == '-j':
+			kw['nproc'] = int(val) or None
+
+	if kw.has_key('incremental') and '+' in args[0]:
+		sys.stderr.write('pype_expander: -i not allowed for composite '
+						 'files (a+b)\n')
+		sys.exit(1)
+
+	if args[1][-4:] == '.mat':
+		expand = expandFileMat
+	else:
+		expand = expandFile
+		kw = {}
+
 	if not PROFILE:
-		expandFile(sys.argv[1], sys.argv[2], startat=n)
+		expand(args[0], args[1], startat=n, **kw)
 		sys.exit(0)
 	else:
 		from cProfile import *
 		import pstats
 		
 		prof = Profile()
-		prof = prof.run('expandFile(sys.argv[1], sys.argv[2], startat=n)')
+		prof = prof.run('expand(args[0], args[1], startat=n, **kw)')
 		prof.dump_stats('profile.out')
 
 		"""
@@ -7,10 +7,27 @@
 The plexon network API is massively broken, but this will get
 you some of the data in a pure-python application.
 
+Data come in as fixed size (PACKETSIZE) packets: a 16 byte header
+(drop counters) followed by data blocks. The background thread reads
+as many packets as the socket has ready and decodes them all at once
+into arrays (a Chunk). Chunks are handed to the main thread through a
+single-producer/single-consumer queue (deque append/popleft are
+atomic), so neither side ever has to take a lock.
+
 Author -- James A. Mazer (james.mazer@yale.edu)
 
 **Revision History**
 
+Thu Oct 29 09:12:40 2026 mazer
+
+- packet decoding done with Numeric, one batch of packets at a time,
+  instead of struct.unpack per data block
+
+- lock-free chunk queue between the reader thread and pype (drain()
+  can return the raw Chunks with chunks=1)
+
+- stats(): events/sec and drop counters
+
 """
 
 __author__   = '$Author$'
@@ -19,11 +36,137 @@ __revision__ = '$Revision$'
 __id__       = '$Id$'
 
 import sys
+import time
 import struct
 import socket
 import threading
+import collections
+import Numeric
 from guitools import Logger
 from PlexHeaders import Plex
+from pypespikes import UNITBASE
+
+BATCH = 64								# max packets to read at once
+RATEWINDOW = 1.0						# secs between events/sec updates
+
+_HEADWORDS = 8							# packet header (int16 words)
+_BLOCKWORDS = 8							# PL_DataBlockHeader (int16 words)
+_NBLOCKS = (Plex.PACKETSIZE / 2 - _HEADWORDS) / _BLOCKWORDS
+
+class Chunk:
+	"""Decoded events from one or more packets, one entry per event.
+
+	type, channel, unit -- Int arrays
+
+	ts -- timestamps as Float array
+
+	waves -- None if there are no waveforms, otherwise list of sample
+	tuples (or None) for each event
+
+	"""
+	def __init__(self, b=None):
+		if b is None:
+			return
+		self.type = b[:,0].astype(Numeric.Int)
+		# compute 5 byte timestamp (unsigned 32 bit TimeStamp)
+		self.ts = ((1L<<24) +
+				   Numeric.bitwise_and(b[:,2].astype(Numeric.Int), 0xffff) +
+				   Numeric.bitwise_and(b[:,3].astype(Numeric.Int), 0xffff) *
+				   65536.0).astype(Numeric.Float)
+		self.channel = b[:,4].astype(Numeric.Int)
+		self.unit = b[:,5].astype(Numeric.Int)
+		self.waves = None
+
+	def __len__(self):
+		return len(self.type)
+
+	def events(self):
+		"""Old style event list: (Type, Channel, Unit, ts, waveform)."""
+		ts = [long(x) for x in self.ts.tolist()]
+		waves = self.waves
+		if waves is None:
+			waves = [None] * len(ts)
+		return zip(self.type.tolist(), self.channel.tolist(),
+				   self.unit.tolist(), ts, waves)
+
+def concat(chunks):
+	"""Join a list of Chunks (ie, from drain(chunks=1)) into one."""
+	if len(chunks) == 0:
+		return Chunk(Numeric.zeros((0, _BLOCKWORDS), Numeric.Int))
+	if len(chunks) == 1:
+		return chunks[0]
+	c = Chunk()
+	for k in ('type', 'ts', 'channel', 'unit'):
+		setattr(c, k, Numeric.concatenate([getattr(x, k) for x in chunks]))
+	if [x for x in chunks if x.waves is not None]:
+		c.waves = []
+		for x in chunks:
+			c.waves.extend(x.waves or [None] * len(x))
+	else:
+		c.waves = None
+	return c
+
+def _walk(w):
+	"""Decode one packet (int16 words) with waveforms, block by block."""
+	w = w.tolist()
+	pos = _HEADWORDS
+	rows, waves = [], []
+	while (pos + _BLOCKWORDS) <= len(w):
+		db = w[pos:pos+_BLOCKWORDS]
+		if db[0] == 0 or db[0] == -1:
+			# empty block or end of packet
+			break
+		pos = pos + _BLOCKWORDS
+		(nWaveforms, nWordsInWaveform) = db[6:8]
+		if nWaveforms > 0:
+			# waveform samples/words are 2-bytes each
+			wavesize = nWaveforms * nWordsInWaveform
+			waves.append(tuple(w[pos:pos+wavesize]))
+			pos = pos + wavesize
+		else:
+			waves.append(None)
+		rows.append(db)
+	c = Chunk(Numeric.reshape(Numeric.array(rows, Numeric.Int),
+							  (len(rows), _BLOCKWORDS)))
+	c.waves = waves
+	return c
+
+def decode(data):
+	"""Decode whole packets (a string) into a Chunk.
+
+	Returns (chunk, headers): headers is the (npackets x 4) Int array
+	of packet headers (unknown1, unknown2, NumServerDropped,
+	NumMMFDropped).
+
+	"""
+	npk = len(data) / Plex.PACKETSIZE
+	heads = Numeric.reshape(Numeric.fromstring(data, Numeric.Int32),
+							(npk, Plex.PACKETSIZE / 4))[:,:4]
+	words = Numeric.reshape(Numeric.fromstring(data, Numeric.Int16),
+							(npk, Plex.PACKETSIZE / 2))
+	blocks = Numeric.reshape(words[:,_HEADWORDS:],
+							 (npk, _NBLOCKS, _BLOCKWORDS))
+	# type 0 (empty) or -1 ends the packet; everything before that
+	# is a data block -- as long as there are no waveforms, in which
+	# case blocks aren't fixed size anymore and need to be walked
+	t = blocks[:,:,0]
+	valid = Numeric.cumproduct(Numeric.logical_and(Numeric.not_equal(t, 0),
+												   Numeric.not_equal(t, -1)),
+							   1)
+	haswaves = Numeric.sometrue(Numeric.greater(blocks[:,:,6], 0) * valid, 1)
+	if not Numeric.sometrue(haswaves):
+		ix = Numeric.nonzero(Numeric.ravel(valid))
+		b = Numeric.take(Numeric.reshape(blocks, (npk * _NBLOCKS,
+												  _BLOCKWORDS)), ix)
+		return Chunk(b), heads
+	chunks = []
+	for n in range(npk):
+		if haswaves[n]:
+			chunks.append(_walk(words[n]))
+		else:
+			ix = Numeric.nonzero(valid[n])
+			chunks.append(Chunk(Numeric.take(blocks[n], ix)))
+	return concat(chunks), heads
 
 class PlexNet:
 	def __init__(self, host, port=6000, waveforms=0):
@@ -34,12 +177,26 @@ class PlexNet:
 		self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.__sock.connect((self.host, self.port))
 		self.__status = 'connected'
-		
+
+		# Everything below is either written only by the reader thread
+		# (counters) or only by the main thread (__nout, __mmf_seen);
+		# the two sides only talk through __queue -- except for the
+		# neuron list, which the main thread can clear, so that gets
+		# a lock of its own.
 		self.__last_NumMMFDropped = 0
 		self.__mmf_drops = 0
-		self.__tank = []
+		self.__mmf_seen = 0
+		self.__server_dropped = 0
+		self.__npackets = 0
+		self.__nin = 0
+		self.__nout = 0
+		self.__rate = 0.0
+		self.__queue = collections.deque()
 		self.__neurons = {}
-		
+		self.__nlock = threading.Lock()
+		self.__done = 0
+		self.__lost = 0
+
 		packet = [0] * 6
 		packet[0] = Plex.PLEXNET_CMD_SET_TRANSFER_MODE
 		packet[1] = 1					# want timestamps?
@@ -51,12 +208,6 @@ class PlexNet:
 		self.__put('6i', packet)
 		data = self.__get()
 
-		# these values are precomputed to speed things up:
-		self.__db_header = 'iiii'
-		self.__db_header_size = struct.calcsize(self.__db_header)
-		self.__db_size = struct.calcsize(Plex.fPL_DataBlockHeader)
-
-		self.__lock = threading.Lock()
 		Logger("PlexNet: starting background retrieval thread\n")
 		threading.Thread(target=self.run).start()
 
@@ -76,10 +227,12 @@ class PlexNet:
 		self.__sock.send(bin)
 
 	def __get(self):
-		nbytes = 0
-		while nbytes < Plex.PACKETSIZE:
-			data = self.__sock.recv(Plex.PACKETSIZE)
-			nbytes = nbytes + len(data)
+		data = ''
+		while len(data) < Plex.PACKETSIZE:
+			s = self.__sock.recv(Plex.PACKETSIZE - len(data))
+			if len(s) == 0:
+				raise socket.error, 'PlexNet: connection closed'
+			data = data + s
 		return data
 
 	def start_data(self):
@@ -88,120 +241,160 @@ class PlexNet:
 	def stop_data(self):
 		self.__put('i', [Plex.PLEXNET_CMD_STOP_DATA_PUMP,])
 
-	def pump(self):
-		data = self.__get()
-
-		(unknown1, unknown2, NumServerDropped, NumMMFDropped) = \
-				   struct.unpack(self.__db_header, data[:self.__db_header_size])
-
-		#print unknown1, unknown2, NumServerDropped, NumMMFDropped
-
-		if (NumMMFDropped - self.__last_NumMMFDropped) > 0:
-			self.__last_NumMMFDropped = NumMMFDropped
-			Logger("PlexNet: Warning, MMF dropout!!\n" +
-			       "         Consider power cycling MAP box...\n")
-			self.__mmf_drops = self.__mmf_drops + 1
-
-		if NumServerDropped > 0:
-			Logger("PlexNet: NumServerDropped=%d\n" % NumServerDropped +
-			       "         This should never happen. Tell Jamie,\n" +
-			       "         then quit and restart Plexon programs.\n")
-
-		pos = 16
-		events = []
-		while (pos + self.__db_size) <= Plex.PACKETSIZE:
-			db = struct.unpack(Plex.fPL_DataBlockHeader,
-							   data[pos:pos+self.__db_size])
-
-			if db[0] == 0:			# db[1] Type // empty block
-				print "?empty?"
-				break
-
-			if db[0] == -1:
-				# end of packet
-				break
-			pos = pos + self.__db_size
-
-			(Type, UpperTS, TimeStamp, Channel, \
-			 Unit, nWaveforms, nWordsInWaveform) = db
-
-			# compute 5 byte timestamp as L type (long int)
-			ts = (1L<<24)+TimeStamp
-			
-			if nWaveforms > 0:
-				# waveform samples/words are 2-bytes each
-				wavesize = nWaveforms * nWordsInWaveform
-				waveform = data[pos:pos+(wavesize*2)]
-				waveform = struct.unpack('h' * (len(waveform)/2), waveform)
-				pos = pos + (wavesize * 2)
-			else:
-				waveform = None
-				
-			# note: if type==4, then this is a non-waveform event, like
-			# the trigger pulse. Channel contains the event id. I think
-			# it's 258 for start and 259 for stop trial/recording.
-			events.append((Type, Channel, Unit, ts, waveform))
-			
-		return events
+	def __counters(self, heads):
+		for (NumServerDropped, NumMMFDropped) in heads[:,2:4].tolist():
+			if (NumMMFDropped - self.__last_NumMMFDropped) > 0:
+				self.__last_NumMMFDropped = NumMMFDropped
+				Logger("PlexNet: Warning, MMF dropout!!\n" +
+					   "         Consider power cycling MAP box...\n")
+				self.__mmf_drops = self.__mmf_drops + 1
+
+			if NumServerDropped > 0:
+				Logger("PlexNet: NumServerDropped=%d\n" % NumServerDropped +
+					   "         This should never happen. Tell Jamie,\n" +
+					   "         then quit and restart Plexon programs.\n")
+				self.__server_dropped = \
+						self.__server_dropped + NumServerDropped
+
+	def pump(self, buf=''):
+		"""Read and decode whatever complete packets are ready.
+
+		buf is any partial packet left from the last call. Returns
+		(chunk, buf): chunk is None if there were no events.
+
+		"""
+		data = self.__sock.recv(Plex.PACKETSIZE * BATCH)
+		if len(data) == 0:
+			raise socket.error, 'PlexNet: connection closed'
+		buf = buf + data
+		n = (len(buf) / Plex.PACKETSIZE) * Plex.PACKETSIZE
+		if n == 0:
+			return None, buf
+		(chunk, heads) = decode(buf[:n])
+		self.__npackets = self.__npackets + len(heads)
+		self.__counters(heads)
+		if len(chunk) == 0:
+			chunk = None
+		return chunk, buf[n:]
+
+	def __seen(self, chunk):
+		# distinct (channel, unit) pairs in chunk
+		codes = Numeric.sort(chunk.channel * UNITBASE + chunk.unit)
+		if len(codes) > 1:
+			codes = Numeric.compress(Numeric.concatenate(
+				([1], Numeric.not_equal(codes[1:], codes[:-1]))), codes)
+		self.__nlock.acquire()
+		try:
+			for c in codes.tolist():
+				self.__neurons[divmod(c, UNITBASE)] = 1
+		finally:
+			self.__nlock.release()
 
 	def run(self):
 		self.start_data()
-		while 1:
-			# query the socket for a new set of plexon evens
-			eventlist = self.pump()
-
-			# Now crunch through the events. The appended None dummy event
-			# will force a check on the tank status w/o requiring an
-			# additional acquire/release cylce on the lock. This allows
-			# the thread to correctly terminate and allow pype to cleanly
-			# exit when no spike data is coming in.
-			for e in eventlist + [None]:
-				try:
-					self.__lock.acquire()
-					if self.__tank is None:
-						# this is the termination signal from the main thread
-						return
-					if e is not None:
-						self.__tank.append(e)
-						self.__neurons[(e[1],e[2])] = 1
-				finally:
-					if self.__tank is not None:
-						self.__status = "[%05d]" % len(self.__tank)
-					self.__lock.release()
+		(buf, t0, n0) = ('', time.time(), 0)
+		try:
+			# The main thread sets __done to tell us to quit; it's
+			# checked after every read, so this will terminate
+			# correctly as long as plexon keeps sending packets.
+			while not self.__done:
+				(chunk, buf) = self.pump(buf)
+				if chunk is not None:
+					self.__seen(chunk)
+					self.__queue.append(chunk)
+					self.__nin = self.__nin + len(chunk)
+				t = time.time()
+				if (t - t0) >= RATEWINDOW:
+					self.__rate = (self.__nin - n0) / (t - t0)
+					(t0, n0) = (t, self.__nin)
+		except socket.error:
+			self.__lost = 1
+			Logger("PlexNet: lost connection\n")
+			return
 		self.stop_data()
 
-	def drain(self, terminate=0):
-		self.__lock.acquire()
-		t, self.__tank, ndrops = self.__tank, [], self.__mmf_drops
-		self.__mmf_drops = 0
+	def drain(self, terminate=0, chunks=0):
+		"""Get everything collected since the last drain.
+
+		Returns (events, ndrops): events is a list of (Type,
+		Channel, Unit, ts, waveform) tuples -- or the raw list of
+		Chunks if chunks is set -- and ndrops the number of MMF
+		dropouts since the last drain. events is None once the
+		connection is gone (or after terminate).
+
+		"""
+		ndrops = self.__mmf_drops - self.__mmf_seen
+		self.__mmf_seen = self.__mmf_seen + ndrops
+		if self.__done or self.__lost:
+			return None, ndrops
+
+		t = []
+		try:
+			while 1:
+				t.append(self.__queue.popleft())
+		except IndexError:
+			pass
+		for c in t:
+			self.__nout = self.__nout + len(c)
 		if terminate:
 			# signal collection thread to terminate next possible chance
-			self.__tank = None
-		self.__lock.release()
-		return t, ndrops
+			self.__done = 1
+		if chunks:
+			return t, ndrops
+		events = []
+		for c in t:
+			events.extend(c.events())
+		return events, ndrops
 
 	def neuronlist(self, clear=0):
 		"""Get list of recently seen neurons"""
-		self.__lock.acquire()
-		n = self.__neurons.keys()
-		if clear:
-			self.__neurons = {}
-		self.__lock.release()
+		self.__nlock.acquire()
+		try:
+			n = self.__neurons.keys()
+			if clear:
+				self.__neurons = {}
+		finally:
+			self.__nlock.release()
 		return n
 
 	def status(self):
-		self.__lock.acquire()
-		s = self.__status
-		self.__lock.release()
-		return s
+		if self.__npackets == 0:
+			return self.__status
+		# events waiting to be drained
+		return "[%05d]" % (self.__nin - self.__nout)
+
+	def stats(self):
+		"""Counters: dict with keys
+
+		  - rate: events/sec (over the last RATEWINDOW secs)
+
+		  - events: total events received
+
+		  - packets: total packets received
+
+		  - pending: events waiting to be drained
+
+		  - mmf_dropped: number of MMF dropouts
+
+		  - server_dropped: packets the server reports dropping
+
+		"""
+		return {
+			'rate': self.__rate,
+			'events': self.__nin,
+			'packets': self.__npackets,
+			'pending': self.__nin - self.__nout,
+			'mmf_dropped': self.__mmf_drops,
+			'server_dropped': self.__server_dropped,
+			}
 
 if __name__ == '__main__':
 	# try training plexon buffers for testing...
-	import time
 	p = PlexNet("192.168.1.111", 6000)
 	for i in range(3):
 		time.sleep(1)
 		events, ndrops = p.drain()
-		print "%d events (%d)" % (len(events), ndrops)
+		print "%d events (%d) %.0f/sec" % (len(events), ndrops,
+										   p.stats()['rate'])
 	p.drain(terminate=1)
 	print "drained."
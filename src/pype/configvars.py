@@ -16,6 +16,18 @@ Tue Mar 31 13:59:22 2009 mazer
 
 - added TESTPAT
 
+Sun Oct 18 13:40:27 2026 mazer
+
+- added RECFORMAT
+
+Wed Oct 21 11:02:45 2026 mazer
+
+- added RECQUEUE and RECFSYNC
+
+Sun Oct 25 20:12:44 2026 mazer
+
+- documented TTANKCACHE and TTANKLOCAL env vars
+
 """
 __author__   = '$Author$'
 __date__     = '$Date$'
@@ -120,6 +132,17 @@ def defaults(srcfile):
     c.set('TDTHOST', '')                # name or IP number of windows
                                         # machine running tdt.py server
 
+    #####################################################
+    # datafile format
+
+    c.set('RECFORMAT', 'columnar')      # trial record format; can be:
+                                        # columnar (header + binary bulk)
+                                        # split (header + pickled bulk)
+                                        # pickle (old single block)
+    c.set('RECQUEUE', '50')             # max queued datafile writes
+                                        # (0 for synchronous writes)
+    c.set('RECFSYNC', '1')              # fsync datafile at end of run
+
     return c
 
 def defaults_info():
@@ -166,6 +189,14 @@ PLEXHOST        (str)   IP # or name of machine running PlexNet
 PLEXPORT        (#)     port # for PlexNet
 TDTHOST         (str)   name or IP number of machine running tdt.py
 
+Datafiles
+---------
+RECFORMAT       (str)   trial record format: columnar, split or
+                        pickle (old style)
+RECQUEUE        (int)   max number of datafile writes queued for the
+                        background writer (0 = write synchronously)
+RECFSYNC        (0|1)   fsync datafile at the end of each run
+
 Other
 -----
 DEBUG           (0|1)   enables debug mode
@@ -176,6 +207,10 @@ Environment Vars (use setenv, not config file!)
 TTANK           (0/1)   if 0, then forces skipping to TTANK queries
 TTANKSERVER     (str)   hostname for ttank server (overrides pypefile)
 TTANKDIR        (str)   directory for ttanks (overrides pypefile)
+TTANKCACHE      (str)   directory for local copies of ttank data
+                        (default ~/.pyperc/ttcache; 0 to disable)
+TTANKLOCAL      (str)   local mount point of the ttank directory; used
+                        to check if cached ttank data is out of date
 
 Note: TTANKHOST/DIR are useful when the data get stored directly
       to a local disk, but later moved to a new location for
@@ -0,0 +1,153 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Incremental readout of the dacq a/d ring buffers**
+
+PypeApp.get_eyepos_now() and friends re-read the whole a/d buffer
+from sample 0 every time they're called, so a task that looks at
+the eye position every frame does O(n^2) work over a trial.
+AdbufCursor keeps track of how far it's read (the buffer's
+adbuf_ptr at the last read, see dacqinfo.h) and each read() only
+pulls the samples that have been appended since then, using
+dacq_adbuf_bulk(). Spike and photodiode pulses are picked out of
+the new samples as they arrive by pypettl.TTLDetector, which keeps
+the in-pulse state between calls.
+
+Typical closed-loop use::
+
+  c = app.adcursor()                # after app.record_start()
+  while ...:
+      c.read()
+      x, y = c.last['x'], c.last['y']
+      if len(c.new['spikes']): ...
+
+c.new[] and c.last[] are constant cost per read(); the whole-trial
+vectors (c.t, c.x, c.spikes etc) are glued together on demand, so
+don't touch those every frame.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Fri Oct 23 10:05:51 2026 mazer
+
+- TTLDetector moved to pypettl.py; ttl specs can include hysteresis
+  and refractory period
+
+Thu Oct 22 14:20:37 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+from Numeric import *
+from pypettl import TTLDetector
+from dacq import dacq_adbuf_size, dacq_adbuf_bulk, \
+	 ADBUF_T, ADBUF_X, ADBUF_Y, ADBUF_PA
+
+# names for the channels AdbufCursor can read
+CHANNELS = {
+	't': ADBUF_T,
+	'x': ADBUF_X,
+	'y': ADBUF_Y,
+	'pa': ADBUF_PA,
+	'c0': 0, 'c1': 1, 'c2': 2, 'c3': 3,
+	}
+
+def adbuf_slice(which, start=0, count=-1):
+	"""Get samples [start, start+count) of one a/d buffer channel.
+
+	'which' is ADBUF_T, ADBUF_X, ADBUF_Y, ADBUF_PA or a raw a/d
+	channel number (0..3, there are NADC=4 in dacqinfo.h); count < 0 means up to the current end
+	of the buffer. Timestamps come back in ms (Float32, rounded to
+	the nearest us), everything else as Int arrays.
+
+	"""
+	s = dacq_adbuf_bulk(which, start, count)
+	if which == ADBUF_T:
+		# dacq timestamps are in us; save as ms
+		t = fromstring(s, Float64)
+		return (floor(t + 0.5) / 1000.0).astype(Float32)
+	else:
+		return fromstring(s, Int32).astype(Int)
+
+class AdbufCursor:
+	"""Streaming reader for the dacq a/d buffers.
+
+	**channels** -- channel names to read (see CHANNELS); 't' is
+	always included
+
+	**ttl** -- dictionary of TTL detectors to run on the incoming
+	data: name -> (channel, thresh, polarity[, hysteresis[, refractory]])
+	(see pypettl.py). Pulse onset times for each are collected in the
+	same way as the raw channels.
+
+	After each read(), self.new[name] holds just the newly arrived
+	samples (or TTL onset times), self.last[name] is the most recent
+	sample/onset seen (None if there hasn't been one yet) and self.t,
+	self.x etc hold everything read so far this trial. If the buffer's
+	been cleared since the last read (ie, new trial), the cursor resets
+	itself.
+
+	"""
+	def __init__(self, channels=('x', 'y'), ttl=None):
+		self.channels = ['t']
+		for c in channels:
+			if c != 't':
+				self.channels.append(c)
+		self.detectors = {}
+		if ttl:
+			for name in ttl.keys():
+				spec = ttl[name]
+				chan = spec[0]
+				if not chan in self.channels:
+					self.channels.append(chan)
+				self.detectors[name] = (chan, apply(TTLDetector, spec[1:]))
+		self.reset()
+
+	def reset(self):
+		self.pos = 0
+		self.new = {}
+		self.last = {}
+		self._chunks = {}
+		for name in self.channels + self.detectors.keys():
+			self._chunks[name] = []
+			self.new[name] = array([])
+			self.last[name] = None
+		for (chan, d) in self.detectors.values():
+			d.reset()
+
+	def read(self):
+		"""Read newly arrived samples; returns number of new samples."""
+		n = dacq_adbuf_size()
+		if n < self.pos:
+			# buffer's been cleared (or wrapped) since last read
+			self.reset()
+		count = n - self.pos
+		for c in self.channels:
+			self.new[c] = adbuf_slice(CHANNELS[c], self.pos, count)
+		for name in self.detectors.keys():
+			(chan, d) = self.detectors[name]
+			self.new[name] = d.feed(self.new['t'], self.new[chan])
+		self.pos = n
+		for name in self.new.keys():
+			if len(self.new[name]):
+				self._chunks[name].append(self.new[name])
+				self.last[name] = self.new[name][-1]
+		return count
+
+	def __getattr__(self, name):
+		# self.t, self.x, self.spikes etc: concatenate on demand
+		chunks = self.__dict__.get('_chunks')
+		if chunks is None or not chunks.has_key(name):
+			raise AttributeError, name
+		if len(chunks[name]) > 1:
+			chunks[name] = [concatenate(chunks[name])]
+		if len(chunks[name]) == 0:
+			return array([])
+		return chunks[name][0]
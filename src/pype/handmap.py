@@ -55,6 +55,16 @@ Fri May 29 14:51:00 2009 mazer
 
 - got rid of color-bink..
 
+Sat Oct 31 11:40:02 2026 mazer
+
+- drifting gratings (cart, hyper, polar) are pre-rendered: one
+  temporal period of the drift is kept as a _FrameCycle (keyed by
+  all the probe parameters that affect the image) and draw() just
+  picks the frame for the current phase. Frames get rendered as
+  they're needed and in the background (from the idle function)
+  while the probe is hidden, so changing a parameter from the
+  keyboard doesn't stall the display.
+
 """
 
 __author__   = '$Author$'
@@ -86,6 +96,49 @@ POLAR=3
 RDP=4
 BARMODES = {BAR:'bar', CART:'cart', HYPER:'hyper', POLAR:'polar', RDP:'rdp'}
 
+MAXFRAMES = 60							# max frames in one drift cycle
+MAXCYCLEBYTES = 64<<20					# max pixel data in one drift cycle
+NCYCLES = 3								# number of drift cycles to keep
+BGFRAMES = 2							# frames to prerender per idle call
+
+class _FrameCycle:
+	"""One temporal period of a drifting grating.
+
+	Frame n is the stimulus at phase 360*n/nframes; frames are
+	rendered (by the probe's render method) the first time they're
+	needed, or ahead of time with fill().
+
+	"""
+	def __init__(self, key, nframes, render):
+		self.key = key
+		self.nframes = nframes
+		self.frames = [None] * nframes
+		self.nrendered = 0
+		self._render = render
+
+	def index(self, t, drift_freq):
+		"""Frame for time t (ms), drifting at drift_freq (Hz)."""
+		return int(round((t/1000.0) * drift_freq * self.nframes)) % \
+			   self.nframes
+
+	def frame(self, n):
+		if self.frames[n] is None:
+			self.frames[n] = self._render(360.0 * n / self.nframes)
+			self.nrendered = self.nrendered + 1
+		return self.frames[n]
+
+	def fill(self, n):
+		"""Render up to n of the missing frames."""
+		for k in range(self.nframes):
+			if n <= 0:
+				break
+			if self.frames[k] is None:
+				self.frame(k)
+				n = n - 1
+
+	def complete(self):
+		return self.nrendered == self.nframes
+
 class _Probe:
 	def __init__(self, app):
 		self.lock = 0
@@ -120,6 +173,8 @@ class _Probe:
 		self.bg = 128.0
 		self.showinfo = 1
 		self.probeid = None
+		self.cycles = {}
+		self.cyclelru = []
 		
 		try:
 			self.load()
@@ -299,7 +354,13 @@ class _Probe:
 			self.app.udpy._canvas.delete(self.probeid)
 			self.probeid = None
 		elif self.probeid is None or redraw:
-			self.photoim = self.s.asPhotoImage()
+			try:
+				# prerendered frames keep their PhotoImage around
+				self.photoim = self.s.pim
+			except AttributeError:
+				self.photoim = self.s.asPhotoImage()
+			if self.probeid:
+				self.app.udpy._canvas.delete(self.probeid)
 			self.probeid = self.app.udpy._canvas.create_image(x, y, anchor=NW,
 															  image=self.photoim)
 			self.app.udpy._canvas.lower(self.probeid)
@@ -308,6 +369,93 @@ class _Probe:
 			self.app.udpy._canvas.lower(self.probeid)
 
 		
+	def rgb(self, color):
+		"""Grating color vector for color (see color())."""
+		if color:
+			rc = self.inten * (color[0]-1) / 254.0 / 100.0
+			gc = self.inten * (color[1]-1) / 254.0 / 100.0
+			bc = self.inten * (color[2]-1) / 254.0 / 100.0
+		else:
+			rc = 1.0
+			gc = 1.0
+			bc = 1.0
+		return (rc, gc, bc)
+
+	def grating(self, phase, color, rgb):
+		"""Render grating probe (cart, hyper or polar) as a new Sprite."""
+		(rc, gc, bc) = rgb
+		l = self.length
+		s = Sprite(width=l, height=l, fb=self.app.fb, depth=99)
+		if sum(color) < 3:
+			# 'black' is just 90deg phase shift of 'white'
+			rc,gc,bc = -1.0,-1.0,-1.0
+		if self.barmode == CART:
+			singrat(s, abs(self.sfreq), phase, self.a,
+					1.0*rc, 1.0*gc, 1.0*bc)
+		elif self.barmode == HYPER:
+			hypergrat(s, abs(self.sfreq), phase, self.a,
+					  1.0*rc, 1.0*gc, 1.0*bc)
+		elif self.barmode == POLAR:
+			if self.rfreq < 0:
+				pol = -1
+			else:
+				pol = 1
+			polargrat(s, abs(self.sfreq), abs(self.rfreq), phase, pol,
+					  1.0*rc, 1.0*gc, 1.0*bc)
+		s.alpha_aperture(l/2)
+		return s
+
+	def cycle(self, color, rgb):
+		"""Drift cycle (_FrameCycle) for the current probe settings."""
+		key = (self.barmode, self.length, self.sfreq, self.rfreq, self.a,
+			   color, rgb, self.drift_freq)
+		try:
+			c = self.cycles[key]
+			self.cyclelru.remove(key)
+		except KeyError:
+			# enough frames to step through one period at the
+			# display frame rate, within reason..
+			try:
+				fps = float(self.app.rig_common.queryv('mon_fps'))
+			except:
+				fps = 0
+			if fps <= 0:
+				fps = 60.0
+			# (two copies of the pixels per frame: sprite + fastim)
+			nbytes = 2 * 4 * self.length * self.length
+			n = min(int(round(fps / self.drift_freq)), MAXFRAMES,
+					MAXCYCLEBYTES / nbytes)
+			c = _FrameCycle(key, max(1, n),
+							lambda phase: self._prerender(phase, color, rgb))
+			self.cycles[key] = c
+			if len(self.cyclelru) >= NCYCLES:
+				del self.cycles[self.cyclelru.pop(0)]
+		self.cyclelru.append(key)
+		return c
+
+	def _prerender(self, phase, color, rgb):
+		s = self.grating(phase, color, rgb)
+		if self.app.fb.opengl:
+			# blit() uses the pre-rendered image automatically
+			s.render()
+		return s
+
+	def prerender(self, nframes=BGFRAMES):
+		"""Fill in a few frames of the current drift cycle.
+
+		This is called from the idle function while the probe's not
+		visible, so by the time it's shown the cycle is (hopefully)
+		complete.
+
+		"""
+		if self.drift and self.barmode in (CART, HYPER, POLAR):
+			(color, name) = self.color()
+			if color is None:
+				return
+			c = self.cycle(color, self.rgb(color))
+			if not c.complete():
+				c.fill(nframes)
+
 	def draw(self):
 		t = self.app.ts()
 
@@ -317,23 +465,18 @@ class _Probe:
 			self.blinktime = t
 
 		(color, name) = self.color()
-		if color:
-			rc = self.inten * (color[0]-1) / 254.0 / 100.0
-			gc = self.inten * (color[1]-1) / 254.0 / 100.0
-			bc = self.inten * (color[2]-1) / 254.0 / 100.0
-		else:
-			rc = 1.0
-			gc = 1.0
-			bc = 1.0
+		(rc, gc, bc) = self.rgb(color)
 		self.colorshow = color
 		self.colorname = name
 		olds = self.s
-		if (self.s is None) or self.drift:
-			if self.drift and not (self.barmode == BAR):
-				phase = (t/1000.0) * self.drift_freq * 360.0
-			else:
-				phase = 0.0;
-
+		if self.drift and self.barmode in (CART, HYPER, POLAR):
+			# drifting grating: pick the frame for the current phase
+			cycle = self.cycle(color, (rc, gc, bc))
+			self.s = cycle.frame(cycle.index(t, self.drift_freq))
+			if not self.s is olds:
+				self.lastx = None
+				self.lasty = None
+		elif (self.s is None) or self.drift:
 			if self.barmode == BAR:
 				self.s = Sprite(width=self.width, height=self.length,
 								fb=self.app.fb, depth=99)
@@ -342,40 +485,8 @@ class _Probe:
 				else:
 					self.s.fill(color)
 				self.s.rotateCCW(self.a, 0, 1)
-			elif self.barmode == CART:
-				l = self.length
-				self.s = Sprite(width=l, height=l,
-								fb=self.app.fb, depth=99)
-				if sum(color) < 3:
-					# 'black' is just 90deg phase shift of 'white'
-					rc,gc,bc = -1.0,-1.0,-1.0
-				singrat(self.s, abs(self.sfreq), phase, self.a,
-						1.0*rc, 1.0*gc, 1.0*bc)
-				self.s.alpha_aperture(l/2)
-			elif self.barmode == HYPER:
-				l = self.length
-				self.s = Sprite(width=l, height=l,
-								fb=self.app.fb, depth=99)
-				if sum(color) < 3:
-					# 'black' is just 90deg phase shift of 'white'
-					rc,gc,bc = -1.0,-1.0,-1.0
-				hypergrat(self.s, abs(self.sfreq), phase, self.a,
-						  1.0*rc, 1.0*gc, 1.0*bc)
-				self.s.alpha_aperture(l/2)
-			elif self.barmode == POLAR:
-				l = self.length
-				self.s = Sprite(width=l, height=l,
-								fb=self.app.fb, depth=99)
-				if self.rfreq < 0:
-					pol = -1
-				else:
-					pol = 1
-				if sum(color) < 3:
-					# 'black' is just 90deg phase shift of 'white'
-					rc,gc,bc = -1.0,-1.0,-1.0
-				polargrat(self.s, abs(self.sfreq), abs(self.rfreq), phase, pol,
-						  1.0*rc, 1.0*gc, 1.0*bc)
-				self.s.alpha_aperture(l/2)
+			elif self.barmode in (CART, HYPER, POLAR):
+				self.s = self.grating(0.0, color, (rc, gc, bc))
 			elif self.barmode == RDP:
 				# rds
 				l = self.length
@@ -613,6 +724,9 @@ def _hmap_idlefn(app):
 	p.draw()
 	if app.running:
 		app.fb.flip()
+	if not (p.live and p.on):
+		# spare time: work on the drift cycle in the background
+		p.prerender()
 
 def hmap_set_dlist(app, dlist):
 	app.hmapstate.dlist = dlist
@@ -22,6 +22,16 @@ Mon Jul 16 12:07:03 2001 mazer
 
 - only change at this time was "app" replaced by "fb"
 
+Mon Nov  2 11:28:05 2026 mazer
+
+- added MovieStream: streaming version of Movie2 -- frames are
+  loaded by a background thread into a bounded ring just ahead of
+  the playback position instead of all up front. Counts (and logs)
+  underruns and supports random seeks.
+
+- MovieStream loader thread only holds a weakref to the stream, so
+  a stream that's never closed still gets collected.
+
 """
 
 __author__   = '$Author$'
@@ -29,7 +39,7 @@ __date__     = '$Date$'
 __revision__ = '$Revision$'
 __id__       = '$Id$'
 
-import sys, types, error, math, os, glob, string
+import sys, types, error, math, os, glob, string, time, threading, weakref
 from sprite import *
 from guitools import *
 
@@ -199,6 +209,299 @@ class Movie2:
 			s.fastblit()
 			
 
+def _indexfiles(idir):
+	"""Frame files for idir, without loading anything.
+
+	**returns** -- (fnames, seq, lines) or None if there's nothing
+	there; fnames are full paths, seq the names from the INDEX file.
+
+	"""
+	try:
+		f = open(idir+'/INDEX')
+		lines = f.readlines()
+		f.close()
+		entries = []
+		for l in lines:
+			if l[0] == '%' or len(string.strip(l)) == 0:
+				continue
+			entries.append(string.split(l)[0])
+		fnames = map(lambda e, d=idir: d + '/' + e, entries)
+	except IOError:
+		sys.stderr.write('warning: no INDEX file -- using glob *.p?m\n');
+		fnames = glob.glob(idir+'/*.p?m')
+		fnames.sort()
+		entries = map(os.path.basename, fnames)
+		lines = None
+	if len(fnames) == 0:
+		return None
+	return (fnames, entries, lines)
+
+def _wakeup(cv):
+	# weakref callback: stream's gone, let the loader notice
+	cv.acquire()
+	try:
+		cv.notifyAll()
+	finally:
+		cv.release()
+
+def _loader(ref, cv):
+	# MovieStream's background loader thread. It only holds a
+	# strong reference to the stream while loading a frame, so a
+	# stream that's dropped without close() still gets collected
+	# (and then the thread exits).
+	cv.acquire()
+	try:
+		while 1:
+			m = ref()
+			if m is None or m._done:
+				return
+			n = m._next()
+			if n is None:
+				del m
+				# if that was the last ref, _wakeup() already ran
+				if ref() is None:
+					return
+				cv.wait()
+				continue
+			m._loading = n
+			cv.release()
+			try:
+				try:
+					s = m._load(n)
+				except:
+					# don't leave blit() waiting for this one
+					m.bad.append(n)
+					s = None
+			finally:
+				cv.acquire()
+			m._loading = None
+			if s is not None and \
+				   m._pos <= n < m._pos + m.nahead:
+				m._ring[n] = s
+			cv.notifyAll()
+			del m, s
+	finally:
+		cv.release()
+
+class MovieStream:
+	"""Streaming version of Movie2.
+
+	Same arguments and blit() as Movie2, but instead of loading (and
+	smoothing and rendering) every frame before the first one can be
+	shown, frames are loaded on a background thread into a ring of at
+	most **nahead** ready-to-blit sprites, starting at the current
+	playback position. Frames behind the playback position are
+	dropped, so memory use doesn't depend on the length of the movie.
+
+	**nahead** -- ring size (frames to keep loaded ahead of playback)
+
+	**wait** -- if the frame blit() wants isn't ready yet (underrun),
+	wait for it (default) or show the background frame instead
+
+	Underruns are counted (self.underruns, a list of frame numbers)
+	and logged. Playback doesn't have to be sequential; blit(n)
+	for any frame number is a seek, it just means an underrun unless
+	seek(n) was called far enough in advance to load it (ie, during
+	the intertrial interval).
+
+	In OpenGL mode the loader can't talk to GL, so frames are
+	converted (Sprite.prerender()) by the loader but uploaded to a
+	texture (Sprite.upload()) on first blit.
+
+	Call close() when done with it: that stops the loader thread and
+	frees the frames right away. The loader doesn't keep the stream
+	alive, so a stream that's just dropped gets cleaned up too, but
+	only once the garbage collector gets to it.
+
+	"""
+	def __init__(self, fb, x, y, idir, bg, smooth1=None, smooth2=None,
+				 nahead=30, wait=1):
+		index = _indexfiles(idir)
+		if index is None:
+			warn('Warning', 'empty movie dir: %s' % idir, wait=1)
+			index = ([], [], None)
+		(self.fnames, self.seq, self.index) = index
+		self.length = len(self.fnames)
+		self.fb = fb
+		self.x = x
+		self.y = y
+		self.bg = bg
+		self.smooth1 = smooth1
+		self.smooth2 = smooth2
+		self.nahead = nahead
+		self.wait = wait
+
+		self.loaded = 0					# frames loaded so far
+		self.bad = []					# frames that wouldn't load
+		self.underruns = []				# frames not ready when needed
+		self.stalled = 0.0				# secs spent waiting on loader
+
+		self._ring = {}					# frame number -> Sprite
+		self._pos = 0					# playback position
+		self._loading = None			# frame being loaded right now
+		self._done = 0
+		self._cv = threading.Condition()
+
+		# background frame needs the frame size, so the first frame
+		# gets loaded right here
+		maxw, maxh = 1, 1
+		if self.length > 0:
+			s = self._load(0)
+			if s is not None:
+				self._ring[0] = s
+				maxw, maxh = s.w, s.h
+		self.bgframe = Sprite(width=maxw, height=maxh,
+							  x=x, y=y, fb=fb, on=0);
+		self.bgframe.fill(bg)
+		self.bgframe.render()
+
+		# loader gets a weakref, not the bound method (see _loader)
+		ref = weakref.ref(self, lambda r, cv=self._cv: _wakeup(cv))
+		self._thread = threading.Thread(target=_loader,
+										args=(ref, self._cv))
+		self._thread.setDaemon(1)
+		self._thread.start()
+
+	def _load(self, n):
+		try:
+			s = Sprite(x=self.x, y=self.y, fb=self.fb, depth=0, on=0,
+					   fname=self.fnames[n], name="i%d" % n)
+		except:
+			self.bad.append(n)
+			sys.stderr.write('warning: bad movie frame: <%s>\n' % \
+							 self.fnames[n])
+			return None
+		r = round(min(s.w, s.h) / 2.0)
+		if self.smooth2:
+			r = self.smooth2
+		if self.smooth1:
+			s.alpha_gradient2(self.smooth1, r, self.bg)
+		# tostring()/convert() here, only the GL upload (if any) is
+		# left for the main thread
+		s.prerender()
+		self.loaded = self.loaded + 1
+		return s
+
+	def _next(self):
+		# first frame in the window that's not loaded yet (call
+		# with the lock held)
+		for n in range(self._pos, min(self._pos + self.nahead, self.length)):
+			if not self._ring.has_key(n) and not n in self.bad:
+				return n
+		return None
+
+	def _seek(self, n):
+		# move playback position to n, dropping frames that fall out
+		# of the window (call with the lock held)
+		if n == self._pos:
+			return []
+		self._pos = n
+		dropped = []
+		for k in self._ring.keys():
+			if k < n or k >= n + self.nahead:
+				dropped.append(self._ring[k])
+				del self._ring[k]
+		self._cv.notifyAll()
+		return dropped
+
+	def seek(self, n, wait=0):
+		"""Start loading at frame n (next blit(n) is fast).
+
+		**wait** -- wait until the ring is full (or the movie's
+		all loaded) from n on
+
+		"""
+		self._cv.acquire()
+		try:
+			dropped = self._seek(n)
+			if wait:
+				while not self._done and self._next() is not None:
+					self._cv.wait()
+		finally:
+			self._cv.release()
+		# sprites are deleted out here (main thread, not holding lock)
+		del dropped
+
+	def ready(self):
+		"""Number of frames loaded from the playback position on."""
+		self._cv.acquire()
+		try:
+			n = 0
+			while self._ring.has_key(self._pos + n):
+				n = n + 1
+			return n
+		finally:
+			self._cv.release()
+
+	def nth_frame(self, n):
+		"""Sprite for frame n (also moves playback position to n).
+
+		**returns** -- Sprite or None if it's not available (bad frame,
+		out of range or not loaded and not waiting)
+
+		"""
+		if n is None or n < 0 or n >= self.length:
+			return None
+		self._cv.acquire()
+		try:
+			dropped = self._seek(n)
+			s = self._ring.get(n)
+			if s is None and not n in self.bad:
+				self.underruns.append(n)
+				if self.wait:
+					t0 = time.time()
+					while not self._done and s is None and \
+							  not n in self.bad:
+						self._cv.wait()
+						s = self._ring.get(n)
+					self.stalled = self.stalled + (time.time() - t0)
+		finally:
+			self._cv.release()
+		del dropped
+		if s is not None and self.fb.opengl and s._tex is None:
+			s.upload()
+		return s
+
+	def blit(self, n):
+		if n is not None:
+			s = self.nth_frame(n)
+			if s is not None:
+				s.fastblit()
+				return
+		self.bgframe.fastblit()
+
+	def stats(self):
+		"""Counters, as a dict."""
+		return {
+			'length': self.length,
+			'loaded': self.loaded,
+			'ready': self.ready(),
+			'bad': len(self.bad),
+			'underruns': len(self.underruns),
+			'stalled': self.stalled,
+			}
+
+	def report(self):
+		"""Log underruns (if any) since the last report."""
+		if len(self.underruns):
+			Logger('movie: %d underruns (frames %s), %.0fms stalled\n' % \
+				   (len(self.underruns), self.underruns, 1000.0*self.stalled))
+		self.underruns = []
+		self.stalled = 0.0
+
+	def close(self):
+		"""Stop the loader thread and drop all frames."""
+		self._cv.acquire()
+		try:
+			self._done = 1
+			ring = self._ring
+			self._ring = {}
+			self._cv.notifyAll()
+		finally:
+			self._cv.release()
+		self._thread.join()
+		del ring
+
 if __name__ == '__main__':
 	sys.stderr.write('%s does nothing as main.\n' % __name__)
 else:
@@ -12,6 +12,10 @@ Tue Apr  7 10:34:35 2009 mazer
 
 - started work..
 
+Fri Oct 30 10:21:16 2026 mazer
+
+- axes come from the shared grid cache (spritetools.cachedaxes)
+
 """
 
 __author__   = '$Author$'
@@ -45,7 +49,7 @@ except ImportError:
 	
 
 from PIL import Image
-from sprite import _C, genaxes
+from sprite import _C, cachedaxes
 
 from pypedebug import keyboard
 import time
@@ -97,8 +101,9 @@ class NumSprite:
 		(self.w, self.h) = self.alpha.shape
 		(self.iw, self.ih) = (self.w, self.h)
 
-		self.ax, self.ay = genaxes(self.w, self.h, inverty=0)
-		self.xx, self.yy = genaxes(self.w, self.h, inverty=1)
+		# shared with other sprites, don't modify in place
+		self.ax, self.ay = cachedaxes(self.w, self.h, inverty=0)
+		self.xx, self.yy = cachedaxes(self.w, self.h, inverty=1)
 
 	def __repr__(self):
 		return '<NumSprite "%s"@(%d,%d) %x%x depth=%d>' % \
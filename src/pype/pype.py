@@ -324,6 +324,51 @@ Fri Oct 15 13:20:53 2010 mazer
 
 - variety of changes to support the new command-line interface (vs.
   magic env vars) to comedi_server and the dacq() function
+
+Sun Oct 18 13:40:27 2026 mazer
+
+- record_write() now writes each trial as a header block followed by
+  a separate bulk analog data block (see pyperecord.py), so analysis
+  tools can scan the headers without unpickling the eye traces and
+  raw channels. Set RECFORMAT=pickle in the config file to get the
+  old single-block records.
+
+Sun Oct 18 16:05:52 2026 mazer
+
+- record_write() no longer converts the analog buffers to python
+  lists; they're written as typed binary columns by default.
+
+Wed Oct 21 11:02:45 2026 mazer
+
+- datafile writes (trials and notes) are now done by a background
+  writer thread (see pypewriter.py) with a bounded queue (RECQUEUE),
+  so slow (ie, NFS) disks don't eat into the inter-trial interval.
+  record_done() waits for the queue to drain and fsync()s the file
+  (RECFSYNC). Queue depth/durability is shown next to the file name.
+
+Thu Oct 22 09:48:10 2026 mazer
+
+- record_write() and the get_xxx_now() functions now pull each a/d
+  channel out of the dacq buffers with one dacq_adbuf_bulk() call
+  instead of calling dacq_adbuf_xxx(i) for every sample.
+
+Thu Oct 22 14:20:37 2026 mazer
+
+- added adcursor(): incremental (cursor based) readout of the a/d
+  buffers with on-the-fly spike/photodiode detection for closed-loop
+  tasks (see dacqstream.py).
+
+Fri Oct 23 10:05:51 2026 mazer
+
+- TTL (spike/photodiode) detection is now array based (pypettl.py)
+  instead of a per-sample python loop. New rig params spike_hyst,
+  spike_refrac, photo_hyst and photo_refrac set the hysteresis and
+  refractory period (ms); 0 (default) gives the old behavior.
+
+Thu Oct 29 09:12:40 2026 mazer
+
+- idle plexon drains take raw PlexNet chunks (no per-event tuples);
+  'query plexnet' also reports events/sec and drop counts.
   
 """
 
@@ -350,6 +395,7 @@ import socket
 import time
 import math
 import cPickle
+import copy
 import thread
 from types import *
 from Tkinter import *
@@ -381,6 +427,7 @@ from pypeerrors import *
 
 from candy import bounce, slideshow
 import PlexHeaders, PlexNet, pype2tdt
+import pyperecord, pypewriter, dacqstream, pypettl
 from info import print_version_info
 import filebox
 import userdpy
@@ -493,10 +540,18 @@ PAR_RIG = (
 		  'threshold for photodiode detection'),
 	pslot('photo_polarity', '1', is_int,
 		  'sign of threshold for photodiode detection'),
+	pslot('photo_hyst', '0', is_int,
+		  'hysteresis for photodiode detection (a/d units)'),
+	pslot('photo_refrac', '0', is_int,
+		  'min ms between photodiode events'),
 	pslot('spike_thresh', '500', is_int,
 		  'threshold for spike detection'),
 	pslot('spike_polarity', '1', is_int,
 		  'sign of threshold for spike detection'),
+	pslot('spike_hyst', '0', is_int,
+		  'hysteresis for spike detection (a/d units)'),
+	pslot('spike_refrac', '0', is_int,
+		  'min ms between spikes'),
 	pslot('save_chn_0', '0', is_int),
 	pslot('save_chn_1', '0', is_int),
 	pslot('save_chn_2', '0', is_int),
@@ -649,6 +704,9 @@ class PypeApp:
 		self.record_id = 1
 		self.record_buffer = []
 		self.record_file = None
+		self.writer = pypewriter.RecordWriter(
+			maxqueue=self.config.iget('RECQUEUE'),
+			fsync=self.config.iget('RECFSYNC'))
 		self._last_eyepos = 0
 		self._allowabort = 0
 		self._rewardlock = thread.allocate_lock()
@@ -785,6 +843,11 @@ class PypeApp:
 		self.__recfile.pack(side=LEFT)
 		self._recfile()
 
+		self.__wrstat = Label(f, text=None)
+		self.__wrstat.pack(side=LEFT)
+		self.balloon.bind(self.__wrstat, "datafile writer queue/sync state")
+		self._wrstat()
+
 		self.__repinfo = Label(f, text=None)
 		self.__repinfo.pack(side=RIGHT)
 
@@ -2220,14 +2283,16 @@ class PypeApp:
 
 		if (not self.recording) and (self.plex is not None):
 			# drawin the plexon buffer to prevent overflow when
-			# pype is idle...
-			tank, ndropped = self.plex.drain()
+			# pype is idle... (raw chunks, nobody's looking at them)
+			tank, ndropped = self.plex.drain(chunks=1)
 			if tank is None:
 				Logger('pype: lost plexon signal.. this is bad..')
 
 		if self.plex:
 			self.record_led.configure(text=self.plex.status())
 
+		# queue drains in the background, keep the status current
+		self._wrstat()
 
 		if self.tk is None:
 			if not ms is None:
@@ -2680,6 +2745,11 @@ class PypeApp:
 			self.plex.drain(terminate=1)
 			Logger('pype: closed connection to plexon.\n')
 
+		try:
+			self.writer.close()
+		except IOError, e:
+			Logger('pype: %s\n' % e)
+
 		try:
 			self.udpy.fidinfo(file=subjectrc('last.fid'))
 			self.udpy.savepoints(subjectrc('last.pts'))
@@ -2736,6 +2806,12 @@ class PypeApp:
 									  % (spacer, self.record_file[-25:]))
 				self.balloon.bind(self.__recfile, self.record_file)
 
+	def _wrstat(self):
+		if self.tk:
+			text = self.writer.status()
+			if text != self.__wrstat.cget('text'):
+				self.__wrstat.config(text=text)
+
 	def set_userbutton(self, n, text=None, check=None, command=None):
 		"""Set callback and label for user-defined buttons"""
 		if not self.tk:
@@ -2843,6 +2919,11 @@ class PypeApp:
 			for (chan, unit) in self.plex.neuronlist():
 				Logger(" sig%03d%c" % (chan, chr(ord('a')+unit)))
 			Logger("\n")
+			s = self.plex.stats()
+			Logger("pype: plexnet %(rate).0f events/sec, %(events)d events, "
+				   "%(packets)d packets\n" % s)
+			Logger("pype: plexnet dropped: %(mmf_dropped)d MMF, "
+				   "%(server_dropped)d server\n" % s)
 		else:
 			Logger("pype: plexnet not enabled.")
 
@@ -2930,18 +3011,10 @@ class PypeApp:
 
 		"""
 		n = dacq_adbuf_size()
-		t = zeros(n, 'f')
-		s0 = zeros(n)
-
-		for i in range(0,n):
-			t[i] = round(dacq_adbuf_t(i) / 1000.0, 3)
-			s0[i] = dacq_adbuf_c3(i)
+		t = _adbuf(ADBUF_T, n)
+		s0 = _adbuf(3, n)
 
-		spike_thresh = int(self.rig_common.queryv('spike_thresh'))
-		spike_polarity = int(self.rig_common.queryv('spike_polarity'))
-		spike_times = _find_ttl(t, s0, spike_thresh, spike_polarity)
-		
-		return spike_times
+		return _find_ttl(t, s0, *self._ttlspec('spike'))
 
 	def get_eyepos_now(self):
 		"""
@@ -2958,29 +3031,48 @@ class PypeApp:
 
 		"""
 		n = dacq_adbuf_size()
-		t = zeros(n, 'f')
-		x = zeros(n)
-		y = zeros(n)
-
-		for i in range(0,n):
-			t[i] = round(dacq_adbuf_t(i) / 1000.0, 3)
-			x[i] = dacq_adbuf_x(i)
-			y[i] = dacq_adbuf_y(i)
+		t = _adbuf(ADBUF_T, n)
+		x = _adbuf(ADBUF_X, n)
+		y = _adbuf(ADBUF_Y, n)
 
 		return (t, x, y)
 
+	def _ttlspec(self, which):
+		"""
+		(thresh, polarity, hysteresis, refractory) rig settings for
+		'spike' or 'photo' TTL detection.
+
+		"""
+		return tuple([int(self.rig_common.queryv(which + '_' + k))
+					  for k in ('thresh', 'polarity', 'hyst', 'refrac')])
+
+	def adcursor(self, channels=('x', 'y'), spikes=1, photo=0):
+		"""
+		Get a streaming reader for the a/d buffers (see dacqstream.py).
+
+		Unlike the get_xxx_now() functions, each read() on the cursor
+		only fetches the samples recorded since the previous read(),
+		so it's cheap enough to call every frame in closed-loop tasks.
+		If spikes/photo are set, spike and photodiode pulses are
+		detected on the fly (using the rig thresholds/polarities) and
+		show up as cursor.new['spikes'] and cursor.new['photo'].
+
+		"""
+		ttl = {}
+		if spikes:
+			ttl['spikes'] = ('c3',) + self._ttlspec('spike')
+		if photo:
+			ttl['photo'] = ('c2',) + self._ttlspec('photo')
+		return dacqstream.AdbufCursor(channels=channels, ttl=ttl)
+
 	def get_photo_now(self):
 		"""
 		This function extracts the current photodiode trace.
 
 		"""
 		n = dacq_adbuf_size()
-		t = zeros(n, 'f')
-		p = zeros(n)
-
-		for i in range(0,n):
-			t[i] = round(dacq_adbuf_t(i) / 1000.0, 3)
-			p[i] = dacq_adbuf_c2(i)
+		t = _adbuf(ADBUF_T, n)
+		p = _adbuf(2, n)
 
 		return (t, p)
 
@@ -3022,40 +3114,37 @@ class PypeApp:
 		# be careful here -- if you're trying to look at the photodiode
 		# signals, you'd better not set fast_tmp=1...
 		if not fast_tmp or self.show_eyetraces.get():
+			# one dacq call per channel (see _adbuf)
+			self.eyebuf_t = _adbuf(ADBUF_T, n)
+			self.eyebuf_x = _adbuf(ADBUF_X, n)
+			self.eyebuf_y = _adbuf(ADBUF_Y, n)
+			self.eyebuf_pa = _adbuf(ADBUF_PA, n)
+			p0 = _adbuf(2, n)
+			s0 = _adbuf(3, n)
 			(c0, c1, c2, c3, c4) = [None] * 5
-			if self.rig_common.queryv('save_chn_0'): c0 = zeros(n, Numeric.Int32)
-			if self.rig_common.queryv('save_chn_1'): c1 = zeros(n, Numeric.Int32)
-			if self.rig_common.queryv('save_chn_2'): c2 = zeros(n, Numeric.Int32)
-			if self.rig_common.queryv('save_chn_3'): c3 = zeros(n, Numeric.Int32)
-			if self.rig_common.queryv('save_chn_4'): c4 = zeros(n, Numeric.Int32)
-
-			for i in range(0,n):
-				# convert dacq_adbuf_t() in 'us' to 'ms' for saving
-				# nb: it's a float, so full us-precision is still there!
-				self.eyebuf_t[i] = round(dacq_adbuf_t(i) / 1000.0, 3)
-				self.eyebuf_x[i] = dacq_adbuf_x(i)
-				self.eyebuf_y[i] = dacq_adbuf_y(i)
-				self.eyebuf_pa[i] = dacq_adbuf_pa(i)
-				p0[i] = dacq_adbuf_c2(i)
-				s0[i] = dacq_adbuf_c3(i)
-				if not c0 is None: c0[i] = dacq_adbuf_c0(i)
-				if not c1 is None: c1[i] = dacq_adbuf_c1(i)
-				if not c2 is None: c2[i] = dacq_adbuf_c2(i)
-				if not c3 is None: c3[i] = dacq_adbuf_c3(i)
-				if not c4 is None: c4[i] = dacq_adbuf_c4(i)
+			if self.rig_common.queryv('save_chn_0'):
+				c0 = _adbuf(0, n).astype(Numeric.Int32)
+			if self.rig_common.queryv('save_chn_1'):
+				c1 = _adbuf(1, n).astype(Numeric.Int32)
+			if self.rig_common.queryv('save_chn_2'):
+				c2 = p0.astype(Numeric.Int32)
+			if self.rig_common.queryv('save_chn_3'):
+				c3 = s0.astype(Numeric.Int32)
+			if self.rig_common.queryv('save_chn_4'):
+				# there's no a/d channel 4 (NADC is 4 in dacqinfo.h);
+				# the old per-sample path returned junk here, save
+				# zeros so old analysis code still finds a c4
+				c4 = Numeric.zeros(n, Numeric.Int32)
 
 			# Thu Oct 21 14:38:49 2010 mazer
 			# look for duplicates in the time stream -- this means
 			# something's wrong with comedi_server or passing doubles
 			# around.
 
-			ndups = 0
-			offset = -1
-			for i in range(1, n):
-				if self.eyebuf_t[i-1] == self.eyebuf_t[i]:
-					ndups = ndups + 1
-					if offset < 0: offset = i
+			dups = nonzero(equal(self.eyebuf_t[1:], self.eyebuf_t[:-1]))
+			ndups = len(dups)
 			if ndups > 0:
+				offset = dups[0] + 1
 				for i in range(max(0, offset-10),
 							   min(offset+10, len(self.eyebuf_t))):
 					print i, self.eyebuf_t[i], ; print_adbuf_t(i); print ""
@@ -3064,15 +3153,13 @@ class PypeApp:
 					   ['Continue', 'Keyboard (debug)']) == 1:
 					keyboard()
 					
-		photo_thresh = int(self.rig_common.queryv('photo_thresh'))
-		photo_polarity = int(self.rig_common.queryv('photo_polarity'))
-		self.photo_times = _find_ttl(self.eyebuf_t, p0,
-									  photo_thresh, photo_polarity)
-
-		spike_thresh = int(self.rig_common.queryv('spike_thresh'))
-		spike_polarity = int(self.rig_common.queryv('spike_polarity'))
-		self.spike_times = _find_ttl(self.eyebuf_t, s0,
-									  spike_thresh, spike_polarity)
+		# (thresh, polarity, hysteresis, refractory) for photo & spikes
+		(thresh, polarity, hyst, refrac) = \
+				 zip(self._ttlspec('photo'), self._ttlspec('spike'))
+		(self.photo_times, self.spike_times) = \
+				 [list(x) for x in
+				  pypettl.find_ttl_channels(self.eyebuf_t, (p0, s0),
+											thresh, polarity, hyst, refrac)]
 
 		if self.show_eyetraces.get():
 			self.plotEyetraces(self.eyebuf_t, x=self.eyebuf_x, y=self.eyebuf_y,
@@ -3149,21 +3236,26 @@ class PypeApp:
 				info[2]['tdt_tnum'] = tnum
 
 			rec = [ENCODE, info, self.record_buffer,
-				   list(self.eyebuf_t),
-				   list(self.eyebuf_x), list(self.eyebuf_y),
+				   self.eyebuf_t,
+				   self.eyebuf_x, self.eyebuf_y,
 				   self.photo_times, self.spike_times,
-				   self.record_id, list(p0), list(s0),
+				   self.record_id, p0, s0,
 				   (c0, c1, c2, c3, c4, None, None),
-				   list(self.eyebuf_pa),
+				   self.eyebuf_pa,
 				   self.xdacq_data_store]
 
 				   # note the None's in the line above are logical
 				   # place holders for c2,c3, which are hardcoded
 				   # as p0 and s0
 
-			f = open(self.record_file, 'a')
-			labeled_dump('encode', rec, f, 1)
-			f.close()
+			# the actual write happens later in the writer thread;
+			# copy the params and taskinfo so the task can't change
+			# them under the writer's feet (the buffers are fresh
+			# each trial)
+			rec[1] = copy.deepcopy(info)
+			self.writer.record(self.record_file, rec,
+							   self.config.get('RECFORMAT'))
+			self._wrstat()
 
 		self.record_id = self.record_id + 1
 
@@ -3175,10 +3267,10 @@ class PypeApp:
 
 		"""
 		if self.record_file:
-			rec = [NOTE, tag, note]
-			f = open(self.record_file, 'a')
-			labeled_dump('note', rec, f, 1)
-			f.close()
+			# queued for the writer thread -- copy, so later changes
+			# (ie, to self.config.dict) don't end up in the file
+			rec = [NOTE, tag, copy.deepcopy(note)]
+			self.writer.note(self.record_file, 'note', rec)
 
 	def _guess_fallback(self):
 		subject = self.sub_common.queryv('subject')
@@ -3260,8 +3352,15 @@ class PypeApp:
 
 	def record_done(self):
 		self.record_note('pype', 'run ends')
+		# barrier: don't let the run end until it's all on disk
+		try:
+			self.writer.sync()
+		except IOError, e:
+			Logger('pype: %s\n' % e)
+			warn('pype', 'Error writing datafile:\n%s' % e)
 		self.record_file = None
 		self._recfile()
+		self._wrstat()
 
 	def record_selectfile(self, fname=None):
 		if not fname is None:
@@ -3443,7 +3542,17 @@ def _CanOnlyBeOne():
 		raise FatalPypeError
 
 
-def _find_ttl(t, x, thresh=500, polarity=1):
+def _adbuf(which, n):
+	"""Get first n samples of one dacq a/d buffer channel.
+
+	Pulls the whole channel out of shared memory with a single
+	dacq_adbuf_bulk() call (see dacqstream.adbuf_slice), instead
+	of one dacq call per sample.
+
+	"""
+	return dacqstream.adbuf_slice(which, 0, n)
+
+def _find_ttl(t, x, thresh=500, polarity=1, hysteresis=0, refractory=0):
 	"""
 	Find downward going TTL pulses in x.  Returns list of onset times.
 
@@ -3455,25 +3564,14 @@ def _find_ttl(t, x, thresh=500, polarity=1):
 
 	This is BACKWARDS .. but we're NOT going to change it..
 
-	"""
+	Fri Oct 23 10:05:51 2026 mazer
 
-	times = []
-	inpulse = 0
-	if polarity > 0:
-		for i in range(0, len(t)):
-			if (not inpulse) and (x[i] < thresh):
-				times.append(t[i])
-				inpulse = 1
-			elif inpulse and (x[i] > thresh):
-				inpulse = 0
-	else:
-		for i in range(0, len(t)):
-			if (not inpulse) and (x[i] > thresh):
-				times.append(t[i])
-				inpulse = 1
-			elif inpulse and (x[i] < thresh):
-				inpulse = 0
-	return times
+	- now just a wrapper for pypettl.find_ttl() (array based, with
+	  optional hysteresis and refractory period)
+
+	"""
+	return list(pypettl.find_ttl(t, x, thresh, polarity,
+								 hysteresis, refractory))
 
 class _EyeGraph:
 	def __init__(self, app):
@@ -3844,34 +3942,52 @@ def _get_plexon_events(plex, fc=40000):
 	TTL sync line). All events left in the tank (post-trial) will
 	be discarded.
 
+	Works on whole drained chunks (see PlexNet.drain()): only the
+	start/stop markers are looked at one by one, the events between
+	them are converted with array ops.
+
 	"""
 	events = None
+	ext = PlexHeaders.Plex.PL_ExtEventType
 
 	hit_stop = 0
 	while not hit_stop:
-		tank, ndropped = plex.drain()
+		tank, ndropped = plex.drain(chunks=1)
 		if tank is None:
 			Logger("pype: oh no.. lost plexon signal during run\n")
 			return None
-
-		for e in tank:
-			(Type, Channel, Unit, ts, waveform) = e
-			if Type == PlexHeaders.Plex.PL_ExtEventType and \
-				   Channel == PlexHeaders.Plex.PL_StartExtChannel:
+		if len(tank) == 0:
+			continue
+		c = PlexNet.concat(tank)
+
+		isext = Numeric.equal(c.type, ext)
+		start = Numeric.logical_and(
+			isext, Numeric.equal(c.channel, PlexHeaders.Plex.PL_StartExtChannel))
+		stop = Numeric.logical_and(
+			isext, Numeric.equal(c.channel, PlexHeaders.Plex.PL_StopExtChannel))
+		markers = Numeric.nonzero(Numeric.logical_or(start, stop)).tolist()
+
+		# events between markers: [lo, hi) ranges
+		lo = 0
+		for k in markers + [len(c)]:
+			if events is not None and k > lo:
+				# use fc (sample freq in hz) to convert timestmaps to ms
+				ms = Numeric.around((c.ts[lo:k] - zero_ts) /
+									fc * 1000.0).astype(Numeric.Int)
+				events.extend(zip(ms.tolist(), c.channel[lo:k].tolist(),
+								  c.unit[lo:k].tolist()))
+			if k == len(c):
+				break
+			if start[k]:
 				if events is not None:
 					Logger("pype: double trigger\n")
 					return None
 				events = []
-				zero_ts = ts
+				zero_ts = c.ts[k]
 			elif events is not None:
-				if Type == PlexHeaders.Plex.PL_ExtEventType and \
-					   Channel == PlexHeaders.Plex.PL_StopExtChannel:
-					hit_stop = 1
-					# drain rest of tank, then return
-				else:
-					# use fc (sample freq in hz) to convert timestmaps to ms
-					events.append((int(round(float(ts - zero_ts) / fc * 1000.0)),
-								   Channel, Unit))
+				hit_stop = 1
+				# drain rest of tank, then return
+			lo = k + 1
 
 	return events
 
@@ -27,6 +27,12 @@ Thu Jan  7 17:22:10 2010 mazer
 
 - hacked labeled_load to override the Numeric array constructor
   function to allow loading 32bit data files on 64bit machines.
+
+Sun Oct 18 13:40:27 2026 mazer
+
+- added labeled_dumps()/labeled_skip() for length-prefixed blocks
+  that can be skipped without unpickling, and split the array
+  constructor hack out of labeled_load() into unpickle().
   
 """
 
@@ -43,6 +49,7 @@ import os
 import re
 import string
 import cPickle
+import struct
 import Numeric
 
 _tic = None
@@ -445,10 +452,88 @@ def labeled_dump(label, obj, f, bin=0):
 	cPickle.dump(obj, f, bin)
 
 
-def labeled_load(f):
+def labeled_load(f, skip=()):
 	"""Wrapper for cPickle.load.
 
-	Inverse of labeled_dump().
+	Inverse of labeled_dump(). Blocks with labels listed in 'skip'
+	must have been written with labeled_dumps(); their payload is
+	skipped over without unpickling and the (offset, length)
+	location of the raw payload (see labeled_skip) is returned
+	instead of the data.
+	"""
+
+	while 1:
+		l = f.readline()
+		if not l:
+			return None, None
+		elif l[:3] == '<<<' and l[-4:] == '>>>\n':
+			if l[3:-4] in skip:
+				return l[3:-4], labeled_skip(f)
+			return l[3:-4], unpickle(f)
+
+def labeled_dumps(label, s, f):
+	"""Dump a (binary) string as a labeled block.
+
+	The string is written as a protocol 1 pickle, so the block
+	can still be read back by labeled_load(), but it can also be
+	stepped over cheaply with labeled_skip() since the length is
+	stored up front.
+	"""
+	labeled_dump(label, s, f, 1)
+
+def labeled_skip(f):
+	"""Skip over the payload of a block written by labeled_dumps().
+
+	Call this right after the <<<label>>> line has been read.
+
+	**returns** -- (offset, length) of raw string payload in the file.
+	offset is None if the file can't report it's position (pipes).
+	"""
+	op = f.read(1)
+	if op == '\x80':
+		# protocol 2+ header
+		f.read(1)
+		op = f.read(1)
+	if op == 'T':
+		n = struct.unpack('<i', f.read(4))[0]
+	elif op == 'U':
+		n = ord(f.read(1))
+	elif not op:
+		raise EOFError
+	else:
+		raise cPickle.UnpicklingError, 'labeled_skip: not a string block'
+	try:
+		offset = f.tell()
+	except (IOError, AttributeError):
+		offset = None
+	if offset is None:
+		# pipe -- have to read through it..
+		k = n
+		while k > 0:
+			m = len(f.read(min(k, 65536)))
+			if m == 0:
+				raise EOFError
+			k = k - m
+	else:
+		f.seek(n, 1)
+	while 1:
+		op = f.read(1)
+		if op == 'q':
+			f.read(1)
+		elif op == 'r':
+			f.read(4)
+		elif op == '.':
+			break
+		else:
+			raise EOFError
+	return offset, n
+
+def unpickle(f=None, s=None):
+	"""Unpickle from file f (or string s).
+
+	Overrides the Numeric array constructor during the load so
+	that datafiles written on 32bit machines can be read on
+	64bit machines (and vice versa).
 	"""
 
 	def local_array_constructor(shape, typecode, thestr,
@@ -481,12 +566,10 @@ def labeled_load(f):
 	try:
 		ac = Numeric.array_constructor
 		Numeric.array_constructor = local_array_constructor
-		while 1:
-			l = f.readline()
-			if not l:
-				return None, None
-			elif l[:3] == '<<<' and l[-4:] == '>>>\n':
-				return l[3:-4], cPickle.load(f)
+		if s is None:
+			return cPickle.load(f)
+		else:
+			return cPickle.loads(s)
 	finally:
 		Numeric.array_constructor = ac
 		
@@ -0,0 +1,220 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Parallel batch loading of many pype datafiles**
+
+Population analyses typically boil down to::
+
+  for f in files:
+      pf = PypeFile(f)
+      for each record p in pf:
+          results.append(somefunction(p))
+
+which leaves all but one core idle while it unpickles and compute()s
+its way through hundreds of sessions. imap() and load() do the same
+thing using a pool of worker processes:
+
+  - the files are split into work units -- whole files, or, for
+    files that already have a record index sidecar (pypeindex.py),
+    ranges of trials within a file, so a few big sessions still get
+    spread over all the workers. Splitting only looks at the index
+    (PypeFile.ntrials()); the parent never reads the datafiles or
+    runs the filter.
+
+  - each worker opens its datafile with PypeFile (building the index
+    if needed) and calls the map function on each trial in its range
+    that passes the filter (PypeFile.trials()). Only the function's return
+    values come back to the parent, never the PypeRecords themselves,
+    and a unit's results are packed into a single Numeric array
+    whenever possible (see _pack) to keep the pickling overhead between
+    processes down.
+
+  - results are streamed back in file/record order.
+
+The map function gets called with a PypeRecord and can return
+anything picklable, ideally a number or a fixed length vector. It
+gets called in another process, so it has to be a module level
+function (not a lambda or a method). Same goes for any callables
+in a pypefilter.Filter. For example::
+
+  >>> def peakvel(p):
+  ...     p.compute()
+  ...     return max(abs(diff(p.eyex)))
+  >>> fnames, recnums, v = load('/data/romeo*.curvplay.*', peakvel,
+  ...                           filter=Filter(result='C'))
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Tue Oct 20 15:40:12 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import sys, os, glob
+from types import *
+import Numeric
+import multiprocessing
+
+from pypedata import PypeFile
+from pypeindex import INDEX_SUFFIX, index_name
+
+CHUNKSIZE = 100					# default max records per work unit
+
+def expand(files):
+	"""Expand a glob pattern or list of files/patterns to a file list.
+
+	Index sidecar files (see pypeindex.py) are ignored.
+
+	"""
+	if type(files) is StringType:
+		files = [files]
+	l = []
+	for f in files:
+		g = filter(lambda x: x[-len(INDEX_SUFFIX):] != INDEX_SUFFIX,
+				   glob.glob(f))
+		if len(g) == 0:
+			# composite ('a+b') or missing -- let PypeFile sort it out
+			l.append(f)
+		else:
+			g.sort()
+			l.extend(g)
+	return l
+
+def _ntrials(fname):
+	"""Number of trials (unfiltered) in fname if it has an index."""
+	if not (os.path.exists(index_name(fname)) or
+			os.path.exists(index_name(fname + '.gz'))):
+		# no sidecar yet (or a composite) -- building the index
+		# means reading the whole file, leave that to the worker
+		return None
+	pf = PypeFile(fname, quiet=1)
+	try:
+		return pf.ntrials()
+	finally:
+		pf.close()
+
+def units(files, chunksize=CHUNKSIZE):
+	"""Split files into (fname, first, last+1) trial-range work units.
+
+	Trial ranges count all trials (see PypeFile.trials()); the
+	filter is applied by the workers. Files without a record index
+	are a single unit with an open-ended range (last+1 is None).
+
+	"""
+	u = []
+	for f in files:
+		n = _ntrials(f)
+		if n is None:
+			u.append((f, 0, None))
+		else:
+			for lo in range(0, n, chunksize):
+				u.append((f, lo, min(n, lo + chunksize)))
+	return u
+
+def _pack(values):
+	"""Pack a list of results into something cheap to pickle.
+
+	Results that Numeric can turn into a numeric (not object or
+	char) array are sent as (typecode, shape, string); anything
+	else gets sent as a plain list.
+
+	"""
+	if len(values) > 0:
+		try:
+			a = Numeric.array(values)
+			if a.typecode() not in (Numeric.PyObject, Numeric.Character):
+				return ('a', a.typecode(), a.shape, a.tostring())
+		except (TypeError, ValueError):
+			pass
+	return ('l', values)
+
+def _unpack(x):
+	if x[0] == 'a':
+		(tag, tc, shape, s) = x
+		return Numeric.reshape(Numeric.fromstring(s, tc), shape)
+	else:
+		return x[1]
+
+def _work(args):
+	(func, fname, lo, hi, filter, headers) = args
+	pf = PypeFile(fname, filter=filter, quiet=1, headers=headers)
+	recnums = []
+	values = []
+	try:
+		for p in pf.trials(lo, hi):
+			recnums.append(p.recnum)
+			values.append(func(p))
+	finally:
+		pf.close()
+	return (fname, recnums, _pack(values))
+
+def imap(files, func, filter=None, nproc=None, chunksize=CHUNKSIZE,
+		 headers=None):
+	"""Apply func to every record in files using a process pool.
+
+	**files** -- glob pattern or list of files/patterns
+
+	**func** -- module-level function called with each PypeRecord
+
+	**filter** -- PypeFile filter (result code or pypefilter.Filter)
+
+	**nproc** -- number of worker processes (default is one per cpu;
+	1 means do everything in this process, which is handy for
+	debugging)
+
+	**chunksize** -- max records per work unit
+
+	**headers** -- open files in header-only mode (see PypeFile)
+
+	Generates (fname, recnum, value) tuples in file/record order.
+
+	"""
+	files = expand(files)
+	if nproc == 1:
+		pool = None
+		mapper = map
+	else:
+		# start the pool before touching any datafiles (PypeFile
+		# may have decoder threads running)
+		pool = multiprocessing.Pool(nproc)
+		mapper = pool.imap
+	try:
+		work = []
+		for (f, lo, hi) in units(files, chunksize):
+			work.append((func, f, lo, hi, filter, headers))
+		for (fname, recnums, values) in mapper(_work, work):
+			values = _unpack(values)
+			for k in range(len(recnums)):
+				yield fname, recnums[k], values[k]
+	finally:
+		if pool is not None:
+			pool.terminate()
+
+def load(files, func, **kw):
+	"""Like imap(), but collects everything.
+
+	Returns (fnames, recnums, values): fnames is a list of file
+	names, recnums is an Int array of record numbers and values
+	is an array of results (one row per record) if all the
+	results could be stacked into one array, or a list otherwise.
+
+	Takes the same keyword args as imap().
+
+	"""
+	fnames, recnums, values = [], [], []
+	for (f, n, v) in imap(files, func, **kw):
+		fnames.append(f)
+		recnums.append(n)
+		values.append(v)
+	x = _pack(values)
+	if x[0] == 'a':
+		values = _unpack(x)
+	return fnames, Numeric.array(recnums, Numeric.Int), values
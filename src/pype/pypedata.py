@@ -120,6 +120,92 @@ Tue Jun  2 12:21:37 2009 mazer
 - fixed false spike_time and photo_time events -- these are now
   automatically stripped on load.. also see p2mLoad()
 
+Sun Oct 18 10:02:11 2026 mazer
+
+- PypeFile now keeps a random-access record index (pypeindex.py)
+  in a '.idx' sidecar file next to the datafile. nth() uses the
+  index to seek directly to records that aren't next in line (or
+  were already freed), instead of unpickling everything before
+  them. Index gets rebuilt automatically if missing or out of date.
+  Use index=0 to disable.
+
+Sun Oct 18 13:40:27 2026 mazer
+
+- new header-only scan mode: PypeFile(..., headers=1) returns records
+  without the bulk analog data (eye traces, raw channels, pupil),
+  which is much faster for files written in the new split
+  header/bulk format (see pyperecord.py). compute() will pull in
+  the analog data on demand if it's needed.
+
+Sun Oct 18 16:05:52 2026 mazer
+
+- bulk analog data is now written in a columnar binary format by
+  default (typed little-endian blocks, see pyperecord.py). For
+  uncompressed files it's decoded straight out of an mmap of the
+  datafile. Older pickle-based files are still read as before.
+
+Mon Oct 19 09:12:40 2026 mazer
+
+- compressed and composite ('a+b+c') files are decoded in-process
+  (see pypezip.py) instead of via gunzip/cat pipes; the files in a
+  composite are decoded concurrently and decoding errors are reported
+  instead of silently truncating the data. Block gzip files support
+  random access through the record index.
+
+Mon Oct 19 14:27:05 2026 mazer
+
+- PypeFile.cache is now a RecordCache: an LRU cache with a byte budget
+  (PypeFile(cachesize=...), default CACHESIZE) keyed by record number.
+  Evicted records are reloaded via the record index on demand, so
+  going backwards in a file works again. nth()'s free= argument is
+  ignored now. Hit/miss/eviction counters: PypeFile.cachestats().
+
+Tue Oct 20 10:18:33 2026 mazer
+
+- PypeFile's filter= can now be a pypefilter.Filter (predicates on
+  result, task, record_id, trial time and params). Predicates are
+  checked against the record index and/or record headers, so rejected
+  trials never get their analog data decoded. Plain result codes
+  (filter='C') still work as before.
+
+Fri Oct 23 10:05:51 2026 mazer
+
+- added PypeRecord.ttl(): array based TTL pulse detection on all the
+  saved a/d channels (c0..c4) in one call (see pypettl.py).
+
+Sat Oct 24 09:31:18 2026 mazer
+
+- find_saccades() and findfix() are now array based (pypesacc.py);
+  pypesacc.saccade_table()/fixation_table() do whole files at once.
+
+Sun Oct 25 10:14:02 2026 mazer
+
+- count_spikes()/extract_spikes() are vectorized; added
+  PypeRecord.spiketimes() (binary search window queries) and
+  event aligned PSTH/raster builders (see pypespikes.py).
+
+Sun Oct 25 16:40:27 2026 mazer
+
+- spike unit identity (PlexNet rec[13] and TDT) is kept as packed
+  integer unit codes (plex_codes, see pypespikes.py) instead of a
+  '005a' style string per spike. spikes() compiles the spikepattern
+  into a unit lookup table once per file; plex_ids is still there,
+  but only gets built on demand.
+
+Sun Oct 25 20:12:44 2026 mazer
+
+- tdtpull() goes through the local tank cache (tdtspikes.pull()), so
+  re-analyzing TTank data doesn't re-download the whole block.
+
+Tue Oct 27 14:31:09 2026 mazer
+
+- PypeFile.ntrials() and PypeFile.notes(): complete trial count and
+  extradata notes straight from the record index, without reading
+  through the file (for incremental/parallel p2m).
+
+- PypeFile.trials(lo, hi): the trials in a range of (unfiltered)
+  trial numbers that pass the filter (for pypebatch work units).
+
 """
 
 __author__   = '$Author$'
@@ -127,12 +213,17 @@ __date__     = '$Date$'
 __revision__ = '$Revision$'
 __id__       = '$Id$'
 
-import sys, types, string, os, posix
-import math, Numeric, time
+import sys, types, string, os, mmap
+import math, Numeric, time, heapq
 from vectorops import *
 from pype import *
 import tdtspikes, ttank
 import re
+import pypeindex, pyperecord, pypezip, pypettl, pypesacc, pypespikes
+from pypefilter import Filter, asfilter
+
+# default byte budget for PypeFile's record cache
+CACHESIZE = 256 * 1024 * 1024
 
 class PypedataTimeError(Exception):
 	"""Serious bad voodoo in the datafile!
@@ -143,6 +234,15 @@ class PypedataTimeError(Exception):
 	"""
 	pass
 
+class PypedataHeaderError(Exception):
+	"""Can't get analog data for a header-only record.
+
+	Raised by PypeRecord.compute() when a record was loaded in
+	header-only mode (PypeFile(..., headers=1)) and the analog
+	data can't be re-read from the file (no random access).
+	"""
+	pass
+
 
 def idfile(f):
 	try:
@@ -166,6 +266,30 @@ def idfile(f):
 	else:
 		return ''
 
+def _trialtime(rec):
+	"""Decode a 'trialtime' NOTE record.
+
+	Returns (trialtime, parsed_trialtime, tracker_guess).
+
+	"""
+	(n, trialtime) = rec[2]
+	# for some reason unclear to me, trialtime is an 'instance'
+	# and not a string.. the % hack makes it into a string..
+	trialtime = "%s" % trialtime
+	# year, month, day, hour, min, sec, 1-7, 1-365, daylight sav?
+	trialtime2 = time.strptime(trialtime, '%d-%b-%Y %H:%M:%S')
+	# try to detect if this is an iscan file? Anything after
+	# 01-jun-2000.	After 13-apr-2001, there should be an
+	# eye tracker parameter stored in the datafile..
+	# only do this on first record.
+	year = trialtime2[0]
+	month = trialtime2[1]
+	if (year > 2000) or (year == 2000 and month >= 6):
+		tracker_guess = ('iscan', 120, 24)
+	else:
+		tracker_guess = ('coil', 1000, 0)
+	return trialtime, trialtime2, tracker_guess
+
 class Note:
 	def __init__(self, rec):
 		self.id = rec[1]
@@ -219,6 +343,9 @@ class PypeRecord:
 		self.parsed_trialtime = parsed_trialtime
 		self.userparams = userparams
 		self.computed = None
+		# header-only records have no bulk analog data attached
+		# yet (see pyperecord.py); compute() will go get it
+		self.headeronly = (len(self.rec) > 3 and self.rec[3] is None)
 
 		# these things are fast, the rest of the recording will
 		# be filled in by the compute() method..
@@ -241,6 +368,14 @@ class PypeRecord:
 	def __repr__(self):
 		return "<PypeRecord: r='%s'>" % self.result
 
+	def __getattr__(self, name):
+		# plex_ids (list of '005a' style unit names) is only built if
+		# someone asks for it -- use plex_codes instead
+		if name == 'plex_ids' and self.__dict__.has_key('plex_codes'):
+			self.plex_ids = map(pypespikes.unitname, self.plex_codes)
+			return self.plex_ids
+		raise AttributeError, name
+
 	def printevents(self, fp=sys.stdout):
 		lastt = None
 		for (t, e) in self.events:
@@ -325,6 +460,8 @@ class PypeRecord:
 			  Use pix2deg() and deg2pix() below to convert.
 		"""
 		if not self.computed:
+			if self.headeronly:
+				self.file.loadbulk(self)
 			# this is new 13-apr-2001:
 			try:
 				lag = float(self.params['eyelag'])
@@ -390,23 +527,21 @@ class PypeRecord:
 					
 
 			if len(self.rec) > 13 and self.rec[13] is not None:
-				plist = self.rec[13]
-				times, channels, units, ids = [], [], [], []
-				for (t, c, u) in plist:
-					times.append(t)
-					channels.append(c)
-					units.append(u)
-					ids.append("%03d%c" % (c, chr(ord('a')+u-1)))
-				self.plex_times = Numeric.array(times, 'i')
-				self.plex_channels = Numeric.array(channels, 'i')
-				self.plex_units = Numeric.array(units, 'i')
-				self.plex_ids = ids[::]
+				# (time, channel, unit) triples
+				plist = Numeric.array(self.rec[13], 'i')
+				if len(plist) == 0:
+					plist = Numeric.zeros((0, 3), 'i')
+				self.plex_times = plist[:,0]
+				self.plex_channels = plist[:,1]
+				self.plex_units = plist[:,2]
+				self.plex_codes = pypespikes.unitcode(self.plex_channels,
+													  self.plex_units)
 			elif try_ttank_pull and self.params.has_key('tdt_tank'):
-				(times, channels, units, ids) = self.file.tdtpull(self)
+				(times, channels, units, codes) = self.file.tdtpull(self)
 				self.plex_times = times
 				self.plex_channels = channels
 				self.plex_units = units
-				self.plex_ids = ids
+				self.plex_codes = codes
 			else:
 				self.plex_times = None
 			
@@ -476,6 +611,8 @@ class PypeRecord:
 				self.eyedxydt = None
 
 			self.computed = 1
+			# record's a lot bigger now, let the cache know
+			self.file.cache.resized(self)
 
 		return self
 
@@ -485,22 +622,19 @@ class PypeRecord:
 		# sh script to select a channel)
 		#	None --> TTL input (old style)
 		#	regexp --> PlexNet datastream (001a, 001b, 002b etc..)
+		#
+		# Sun Oct 25 16:40:27 2026 mazer
+		#   spikepattern is read and compiled into a unit selector
+		#   (see pypespikes.py) once per file
 		if pattern is None:
-			try:
-				pattern = string.strip(open(pyperc('spikepattern'),
-											'r').readline())
-			except IOError:
-				pattern = None
+			pattern = self.file.spikepattern()
 
 		if pattern is None or self.plex_times is None:
 			ts = self.spike_times[::]
 			pattern = 'TTL'
 		else:
-			p = re.compile(pattern)
-			ts = []
-			for n in range(len(self.plex_times)):
-				if p.match(self.plex_ids[n]) is not None:
-					ts.append(self.plex_times[n])
+			ts = self.file.unitselector(pattern).select(self.plex_codes,
+														self.plex_times)
 
 		if PypeRecord._reportchannel:
 			sys.stderr.write('spikepattern=%s\n' % pattern)
@@ -508,50 +642,267 @@ class PypeRecord:
 					
 		return pattern, ts
 
+	def spiketimes(self, pattern=None):
+		"""Spikes (see spikes()) as a pypespikes.SpikeTimes object
+		for fast window queries. Built once per pattern.
+
+		"""
+		try:
+			cache = self._spiketimes
+		except AttributeError:
+			cache = self._spiketimes = {}
+		if not cache.has_key(pattern):
+			cache[pattern] = pypespikes.SpikeTimes(self.spikes(pattern)[1])
+		return cache[pattern]
+
+	def ttl(self, thresh=500, polarity=1, hysteresis=0, refractory=0):
+		"""Find TTL pulses on the saved raw a/d channels.
+
+		Returns a list of onset time arrays (ms, aligned like
+		spike_times) for c0..c4, with None for channels that weren't
+		saved. c2 and c3 are the photodiode and spike channels. The
+		detection args can be single values or per-channel tuples (see
+		pypettl.find_ttl_channels).
+
+		"""
+		self.compute()
+		chans = [None] * 5
+		if len(self.rec) > 11 and self.rec[11] is not None:
+			for n in range(min(5, len(self.rec[11]))):
+				chans[n] = self.rec[11][n]
+		# c2 and c3 are stored in rec[9] and rec[10]
+		if len(self.rec) > 10:
+			(chans[2], chans[3]) = (self.rec[9], self.rec[10])
+		for n in range(5):
+			if chans[n] is not None and len(chans[n]) != len(self.realt):
+				chans[n] = None
+		return pypettl.find_ttl_channels(self.realt, chans, thresh,
+										 polarity, hysteresis, refractory)
+
+def _nbytes(x):
+	"""Rough memory footprint of x (arrays, lists & tuples) in bytes."""
+	t = type(x)
+	if t is Numeric.ArrayType:
+		return Numeric.size(x) * x.itemsize()
+	elif t in (types.ListType, types.TupleType):
+		n = 8 * len(x)
+		for v in x:
+			if type(v) in (Numeric.ArrayType, types.ListType, types.TupleType):
+				n = n + _nbytes(v)
+		return n
+	return 0
+
+def _recsize(p):
+	"""Approximate size of a PypeRecord (including compute() results)."""
+	n = _nbytes(p.rec)
+	for v in p.__dict__.values():
+		if v is not p.rec:
+			n = n + _nbytes(v)
+	return n
+
+class RecordCache:
+	"""LRU cache of PypeRecords with a byte budget.
+
+	Records are keyed by record number. Sizes are estimated by
+	_recsize() when a record is put() and again when compute()
+	grows it (see resized()), not on every fetch. Least recently
+	used records are evicted once the total goes over 'maxbytes';
+	a single record bigger than the whole budget isn't cached at
+	all.
+
+	Recency is a use counter per record plus a heap of (counter,
+	key) pairs. Heap entries for records that have been used again
+	since are just skipped when evicting (and the heap is rebuilt
+	when too many pile up), so nothing is O(number of records).
+
+	hits, misses and evictions count just what you'd think..
+
+	"""
+	def __init__(self, maxbytes):
+		self.maxbytes = maxbytes
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._recs = {}					# n -> (record, size)
+		self._used = {}					# n -> use counter at last get/put
+		self._heap = []					# (use counter, n), may be stale
+		self._keys = {}					# id(record) -> n
+		self._clock = 0
+
+	def __len__(self):
+		return len(self._recs)
+
+	def __contains__(self, n):
+		return self._recs.has_key(n)
+
+	def get(self, n):
+		try:
+			(p, size) = self._recs[n]
+		except KeyError:
+			self.misses = self.misses + 1
+			return None
+		self.hits = self.hits + 1
+		self._use(n)
+		return p
+
+	def put(self, n, p):
+		self.drop(n)
+		size = _recsize(p)
+		if size > self.maxbytes:
+			return
+		self._recs[n] = (p, size)
+		self._keys[id(p)] = n
+		self.nbytes = self.nbytes + size
+		self._use(n)
+		self._evict()
+
+	def resized(self, p):
+		"""Re-measure record p after it's changed (ie, compute()).
+
+		Does nothing if p isn't in the cache.
+
+		"""
+		n = self._keys.get(id(p))
+		if n is None:
+			return
+		(p, size) = self._recs[n]
+		newsize = _recsize(p)
+		self.nbytes = self.nbytes + newsize - size
+		self._recs[n] = (p, newsize)
+		if newsize > self.maxbytes:
+			self._pop(n)
+		else:
+			self._evict()
+
+	def drop(self, n):
+		if self._recs.has_key(n):
+			self._pop(n)
+
+	def _pop(self, n):
+		(p, size) = self._recs[n]
+		del self._recs[n]
+		del self._used[n]
+		del self._keys[id(p)]
+		self.nbytes = self.nbytes - size
+
+	def _use(self, n):
+		self._clock = self._clock + 1
+		self._used[n] = self._clock
+		heapq.heappush(self._heap, (self._clock, n))
+		if len(self._heap) > 2 * len(self._used) + 64:
+			# mostly stale entries, start over
+			self._heap = [(t, k) for (k, t) in self._used.items()]
+			heapq.heapify(self._heap)
+
+	def _evict(self):
+		while self.nbytes > self.maxbytes:
+			(t, n) = heapq.heappop(self._heap)
+			if self._used.get(n) == t:
+				self._pop(n)
+				self.evictions = self.evictions + 1
+
+	def stats(self):
+		return { 'records': len(self._recs),
+				 'bytes': self.nbytes,
+				 'maxbytes': self.maxbytes,
+				 'hits': self.hits,
+				 'misses': self.misses,
+				 'evictions': self.evictions, }
+
 class PypeFile:
-	def __init__(self, fname, filter=None, status=None, quiet=None):
+	def __init__(self, fname, filter=None, status=None, quiet=None, index=1,
+				 headers=None, cachesize=None):
+		self.source = None
+		self._zs = None
 		flist = string.split(fname, '+')
 		if len(flist) > 1:
-			if flist[0][-3:] == '.gz':
-				cmd = 'gunzip --quiet -c %s ' % string.join(flist,' ')
-			else:
-				cmd = 'cat %s ' % string.join(flist,' ')
-			self.fp = posix.popen(cmd, 'r')
+			self._flist = flist
 			if not quiet:
 				sys.stderr.write('compositing: %s\n' % fname)
 			self.fname = fname
+			self.zfname = None
 		elif fname[-3:] == '.gz':
-			# it appears MUCH faster to open a pipe to gunzip
-			# than to use the zlib/gzip module..
-			self.fp = posix.popen('gunzip --quiet <%s 2>/dev/null' % fname, 'r')
+			self._flist = [fname]
 			if not quiet:
 				sys.stderr.write('decompressing: %s\n' % fname)
 			self.fname = fname[:-3]
 			self.zfname = fname[::]
+			self.source = self.zfname
 		elif not posixpath.exists(fname) and \
 				 posixpath.exists(fname+'.gz'):
 			# if .gz file exists and the named file does not,
 			# try using the .gz file instead...
 			self.fname = fname
 			self.zfname = fname+'.gz'
-			self.fp = posix.popen('gunzip --quiet <%s 2>/dev/null' %
-								  self.zfname, 'r')
+			self.source = self.zfname
+			self._flist = [self.zfname]
 			if not quiet:
 				sys.stderr.write('decompressing: %s\n' % self.zfname)
 		else:
 			self.fname = fname
 			self.zfname = None
-			self.fp = open(self.fname, 'r')
-		self.cache = []
+			self.source = self.fname
+			self._flist = None
+		self._open()
+		# LRU cache of loaded records, keyed by (filtered) record
+		# number; nrecs is the number read sequentially so far
+		if cachesize is None:
+			cachesize = CACHESIZE
+		self.cache = RecordCache(cachesize)
+		self.nrecs = 0
+		self._last = None
 		self.status = status
 		self.filter = filter
+		self._filter = asfilter(filter)
+		self._matches = []				# index entries passing _filter
+		self._mnext = 0					# next ix.encodes() to check
+		self.headers = headers
+		self.quiet = quiet
 		self.userparams = None
 		self.taskname = None
 		self.extradata = []
 		self.counter = 0
+		self.error = None				# decompression error (if any)
+		# random access index (see pypeindex.py); built on demand
+		# the first time nth() can't be satisfied sequentially
+		self.index = None
+		self._useindex = index and (self.source is not None)
+		self._rfp = None
+		# plain (uncompressed) files get their bulk data decoded
+		# straight from a memory map of the file
+		self._mappable = (self.source is not None and self.zfname is None)
+		self._mm = None
+		# spikepattern and compiled unit selectors (see spikes())
+		self._spikepattern = 0
+		self._selectors = {}
 
 	def __repr__(self):
-		return '<PypeFile:%s (%d recs)>' % (self.fname, len(self.cache))
+		return '<PypeFile:%s (%d recs)>' % (self.fname, self.nrecs)
+
+	def _open(self):
+		"""Open sequential stream at the start of the datafile."""
+		if self._flist is None:
+			self.fp = open(self.fname, 'r')
+		else:
+			self._zs = pypezip.Stream(self._flist)
+			self.fp = self._zs.fp
+
+	def _rewind(self):
+		"""Restart sequential reading from the top of the file.
+
+		Only used when an evicted record has to be reloaded and
+		there's no index to seek with (ie, composite files).
+
+		"""
+		self.close()
+		self._open()
+		self.userparams = None
+		self.taskname = None
+		self.extradata = []
+		self.counter = 0
+		self.error = None
+		self.nrecs = 0
 
 	def close(self):
 		if not self.fp is None:
@@ -562,6 +913,17 @@ class PypeFile:
 				# and thread interaction?
 				pass
 			self.fp = None
+		if not self._zs is None:
+			self._zs.close()
+			if self._zs.error:
+				self.error = self._zs.error
+			self._zs = None
+		if not self._rfp is None:
+			self._rfp.close()
+			self._rfp = None
+		if not self._mm is None:
+			self._mm.close()
+			self._mm = None
 
 	def _next(self, cache=1, runinfo=None):
 		if self.fp is None:
@@ -570,7 +932,8 @@ class PypeFile:
 		trialtime = None
 		while 1:
 			try:
-				label, rec = labeled_load(self.fp)
+				label, rec = labeled_load(self.fp,
+										  skip=(pyperecord.BULK_LABEL,))
 			except EOFError:
 				label, rec = None, None
 			except ImportError:
@@ -581,12 +944,17 @@ class PypeFile:
 
 			if label == None:
 				self.close()
+				if self.error:
+					sys.stderr.write('error: %s\n' % self.error)
 				return None
 			if label == WARN:
 				sys.stderr.write('WARNING: %s\n' % rec)
 			if label == ANNOTATION:
 				# for the moment, do nothing about this..
 				pass
+			elif label == pyperecord.BULK_LABEL:
+				# orphaned bulk data block (no header) -- ignore
+				pass
 			elif rec[0] == ENCODE:
 				try:
 					xxx=trialtime2
@@ -596,6 +964,18 @@ class PypeFile:
 					xxx=tracker_guess
 				except UnboundLocalError:
 					tracker_guess = ('unknown', -1, -1)
+				if self._filter and \
+					   not self._filter.header(rec, self.taskname, trialtime2):
+					# rejected on the header -- skip the bulk data
+					if label == pyperecord.HEADER_LABEL:
+						self._skipbulk()
+					self.counter = self.counter + 1
+					trialtime = None
+					continue
+				if label == pyperecord.HEADER_LABEL:
+					rec = self._nextbulk(rec)
+				elif self.headers:
+					rec = pyperecord.strip_record(rec)
 				p = PypeRecord(self, self.counter,
 							   rec, trialtime=trialtime,
 							   parsed_trialtime=trialtime2,
@@ -604,9 +984,10 @@ class PypeFile:
 							   taskname=self.taskname)
 				self.counter = self.counter + 1
 				trialtime = None
-				if not self.filter or (p.result == self.filter):
-					if cache:
-						self.cache.append(p)
+				if cache:
+					self.cache.put(self.nrecs, p)
+				self._last = p
+				self.nrecs = self.nrecs + 1
 				return p
 			elif rec[0] == 'NOTE' and rec[1] == 'task_is':
 				self.taskname = rec[2]
@@ -618,37 +999,298 @@ class PypeFile:
 				 rec[1] == 'pype' and rec[2] == 'run ends':
 				pass
 			elif rec[0] == 'NOTE' and rec[1] == 'trialtime':
-				(n, trialtime) = rec[2]
-				# for some reason unclear to me, trialtime is an 'instance'
-				# and not a string.. the % hack makes it into a string..
-				trialtime = "%s" % trialtime
-				# year, month, day, hour, min, sec, 1-7, 1-365, daylight sav?
-				trialtime2 = time.strptime(trialtime, '%d-%b-%Y %H:%M:%S')
-				# try to detect if this is an iscan file? Anything after
-				# 01-jun-2000.	After 13-apr-2001, there should be an
-				# eye tracker parameter stored in the datafile..
-				# only do this on first record.
-				year = trialtime2[0]
-				month = trialtime2[1]
-				if (year > 2000) or (year == 2000 and month >= 6):
-					tracker_guess = ('iscan', 120, 24)
-				else:
-					tracker_guess = ('coil', 1000, 0)
+				(trialtime, trialtime2, tracker_guess) = _trialtime(rec)
 			elif rec[0] == 'NOTE' and rec[1] == 'userparams':
 				self.userparams = rec[2]
 			else:
 				#sys.stderr.write('stashed: <type=%s>\n' % label)
 				self.extradata.append(Note(rec))
 
+	def _skipbulk(self):
+		"""Skip over the bulk block following a record header."""
+		try:
+			labeled_load(self.fp, skip=(pyperecord.BULK_LABEL,))
+		except EOFError:
+			pass
+
+	def _nextbulk(self, header):
+		"""Read (or skip) the bulk block following a record header."""
+		try:
+			if self.headers or self._mappable:
+				label, bulk = labeled_load(self.fp,
+										   skip=(pyperecord.BULK_LABEL,))
+			else:
+				label, bulk = labeled_load(self.fp)
+		except EOFError:
+			label, bulk = None, None
+		except ImportError:
+			fatal_unpickle_error()
+			sys.exit(1)
+		if label is None or label != pyperecord.BULK_LABEL or self.headers:
+			# header-only mode or truncated trial; compute() will try
+			# to get the bulk data later (via the index)
+			return header
+		if self._mappable:
+			(offset, length) = bulk
+			bulk = self._decodemapped(offset, length)
+		else:
+			bulk = pyperecord.decode_bulk(bulk)
+		return pyperecord.merge_record(header, bulk)
+
+	def _decodemapped(self, offset, length):
+		"""Decode bulk block payload directly from mmap'd datafile."""
+		if self._mm is None or (offset + length) > len(self._mm):
+			# file's grown since last mapped (or never mapped)
+			if not self._mm is None:
+				self._mm.close()
+			f = open(self.source, 'r')
+			self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			f.close()
+		return pyperecord.decode_bulk(self._mm, offset, length)
+
+	def _bulk_at(self, offset):
+		"""Load bulk data block at offset in (uncompressed) stream."""
+		if self._mappable:
+			label, (boffset, length) = \
+				   labeled_load(self._reader().at(offset),
+								skip=(pyperecord.BULK_LABEL,))
+			return self._decodemapped(boffset, length)
+		else:
+			return pyperecord.decode_bulk(self._load_at(offset)[1])
+
+	def loadbulk(self, p):
+		"""Attach bulk analog data to header-only record p.
+
+		This gets called automatically by PypeRecord.compute().
+
+		"""
+		ix = self._getindex()
+		if ix is None or p.recnum >= len(ix.encodes()):
+			raise PypedataHeaderError
+		k = ix.encodes()[p.recnum]
+		if k+1 < len(ix.entries) and \
+			   ix.entries[k+1][pypeindex.I_LABEL] == pyperecord.BULK_LABEL:
+			bulk = self._bulk_at(ix.offset(k+1))
+		else:
+			# old style single block record -- reload the whole thing
+			label, rec = self._load_at(ix.offset(k))
+			bulk = pyperecord.split_record(rec)[1]
+		p.rec = pyperecord.merge_record(p.rec, bulk)
+		p.headeronly = 0
+
 	def nth(self, n, free=1):
-		"""Load or return (if cached) nth record."""
-		while len(self.cache) <= n:
+		"""Load or return (if cached) nth record.
+
+		Records are kept in a memory-bounded LRU cache (see
+		RecordCache). If the requested record isn't in the cache
+		and isn't the next one in the file, the record index is
+		used to seek directly to the record instead of reading
+		through the file sequentially.
+
+		'free' is ignored -- it's only kept for compatibility; the
+		cache's byte budget takes care of memory usage now.
+
+		"""
+		p = self.cache.get(n)
+		if p is not None:
+			return p
+		if n != self.nrecs and self._getindex() is not None:
+			p = self._seek(n)
+			if p is not None:
+				self.cache.put(n, p)
+			return p
+		if n < self.nrecs:
+			# evicted and no index -- start over from the top
+			self._rewind()
+		while self.nrecs <= n:
 			if self._next() is None:
 				return None
-		rec = self.cache[n]
-		if free:
-			self.cache[n] = None
-		return rec
+		return self._last
+
+	def _getindex(self):
+		"""Get the record index, (re)building it if needed."""
+		if not self._useindex:
+			return None
+		try:
+			if self.index is None:
+				self.index = pypeindex.RecordIndex(self.source,
+												   quiet=self.quiet)
+			else:
+				self.index.update()
+		except ImportError:
+			fatal_unpickle_error()
+			sys.exit(1)
+		except (IOError, OSError):
+			self._useindex = 0
+			self.index = None
+		return self.index
+
+	def _reader(self):
+		if self._rfp is None:
+			self._rfp = pypezip.RandomReader(self.source)
+		return self._rfp
+
+	def _load_at(self, offset):
+		try:
+			return labeled_load(self._reader().at(offset))
+		except ImportError:
+			fatal_unpickle_error()
+			sys.exit(1)
+
+	def _match(self, ix, n):
+		"""Index entry number of the nth trial passing the filter.
+
+		Index-level predicates are checked first; only trials that
+		pass those get their headers loaded (if the filter needs
+		them). Results are remembered, so this is incremental.
+
+		"""
+		elist = ix.encodes()
+		if self._filter is None:
+			if n < len(elist):
+				return elist[n]
+			return None
+		while len(self._matches) <= n and self._mnext < len(elist):
+			k = elist[self._mnext]
+			self._mnext = self._mnext + 1
+			if self._filter.entry(ix.entries[k]) and \
+				   (not self._filter.needheader() or self._headerok(ix, k)):
+				self._matches.append(k)
+		if n < len(self._matches):
+			return self._matches[n]
+		return None
+
+	def _headerok(self, ix, k):
+		"""Check filter against header of trial at index entry k."""
+		label, rec = self._load_at(ix.offset(k))
+		trialtime2 = 'nd'
+		if self._filter.trialtime is not None:
+			j = ix.trialtime_for(k)
+			if j is not None:
+				trialtime2 = _trialtime(self._load_at(ix.offset(j))[1])[1]
+		return self._filter.header(rec, ix.entries[k][pypeindex.I_TASK],
+								   trialtime2)
+
+	def _seek(self, n):
+		"""Load nth (filtered) record directly using the record index.
+
+		The caller is responsible for caching the returned record.
+
+		"""
+		ix = self._getindex()
+		if ix is None:
+			return None
+		k = self._match(ix, n)
+		if k is None:
+			return None
+		return self._record_at(ix, k)
+
+	def _record_at(self, ix, k):
+		"""Load the trial at index entry k as a PypeRecord."""
+		label, rec = self._load_at(ix.offset(k))
+		if self.headers:
+			rec = pyperecord.strip_record(rec)
+		elif label == pyperecord.HEADER_LABEL and \
+				 k+1 < len(ix.entries) and \
+				 ix.entries[k+1][pypeindex.I_LABEL] == pyperecord.BULK_LABEL:
+			rec = pyperecord.merge_record(rec, self._bulk_at(ix.offset(k+1)))
+
+		trialtime, trialtime2 = None, 'nd'
+		tracker_guess = ('unknown', -1, -1)
+		j = ix.trialtime_for(k)
+		if j is not None:
+			(trialtime, trialtime2,
+			 tracker_guess) = _trialtime(self._load_at(ix.offset(j))[1])
+		j = ix.userparams_for(k)
+		if j is not None:
+			userparams = self._load_at(ix.offset(j))[1][2]
+		else:
+			userparams = None
+		return PypeRecord(self, ix.recnum(k),
+						  rec, trialtime=trialtime,
+						  parsed_trialtime=trialtime2,
+						  tracker_guess=tracker_guess,
+						  userparams=userparams,
+						  taskname=ix.entries[k][pypeindex.I_TASK])
+
+	def ntrials(self):
+		"""Number of complete trials in the file (None if unindexed).
+
+		Doesn't count a trial whose bulk data hasn't been written
+		yet (ie, the file's still being written). Ignores the filter.
+
+		"""
+		ix = self._getindex()
+		if ix is None:
+			return None
+		elist = ix.encodes()
+		n = len(elist)
+		if n and elist[-1] == len(ix.entries) - 1 and \
+			   ix.entries[-1][pypeindex.I_LABEL] == pyperecord.HEADER_LABEL:
+			n = n - 1
+		return n
+
+	def trials(self, lo=0, hi=None):
+		"""Generate the trials numbered lo..hi-1 that pass the filter.
+
+		Trial numbers count every trial in the file (same as
+		PypeRecord.recnum and ntrials()), not just the ones that pass
+		the filter, so a file can be split into ranges without
+		running the filter first. With the record index, rejected
+		trials are never loaded; otherwise the file is read through
+		sequentially. Records aren't cached.
+
+		"""
+		ix = self._getindex()
+		if ix is None:
+			n = 0
+			while 1:
+				p = self.nth(n)
+				if p is None or (hi is not None and p.recnum >= hi):
+					break
+				if p.recnum >= lo:
+					yield p
+				n = n + 1
+			return
+		elist = ix.encodes()
+		ntrials = self.ntrials()
+		if hi is None or hi > ntrials:
+			hi = ntrials
+		for j in range(lo, hi):
+			k = elist[j]
+			if self._filter is not None and \
+				   not (self._filter.entry(ix.entries[k]) and
+						(not self._filter.needheader() or
+						 self._headerok(ix, k))):
+				continue
+			yield self._record_at(ix, k)
+
+	def notes(self, start=0):
+		"""Get extradata notes using the record index.
+
+		Returns (notes, end): the Notes (same ones sequential reading
+		collects in self.extradata) from index entry 'start' on, and
+		the entry to start from next time. None if there's no index.
+
+		"""
+		ix = self._getindex()
+		if ix is None:
+			return None
+		notes = []
+		for k in range(start, len(ix.entries)):
+			e = ix.entries[k]
+			if e[pypeindex.I_LABEL] in (ANNOTATION, pyperecord.BULK_LABEL) \
+				   or e[pypeindex.I_TYPE] == ENCODE:
+				continue
+			if e[pypeindex.I_TYPE] == NOTE and \
+				   e[pypeindex.I_TAG] in ('task_is', 'trialtime', 'userparams'):
+				continue
+			label, rec = self._load_at(ix.offset(k))
+			if rec[0] == 'NOTE' and rec[1] == 'pype' and \
+				   rec[2] in ('run starts', 'run ends'):
+				continue
+			notes.append(Note(rec))
+		return notes, len(ix.entries)
 
 	def tdtpull(self, rec):
 		n = rec.recnum
@@ -657,56 +1299,82 @@ class PypeFile:
 			x = self.tdt
 		except AttributeError:
 			try:
-				sys.stderr.write("Warning: pulling tdt spikes from tank\n")
-				self.tdt = tdtspikes.Spikes(rec=rec)
-				# download spikes and pull out into tdt.sdata[]
-				self.tdt.query()
-				sys.stderr.write("Warning: pulled %d trials from tank\n" %
-								 len(self.tdt.sdata))
+				# download spikes (or get them from the local cache)
+				# and pull out into tdt.sdata[]
+				self.tdt = tdtspikes.pull(rec, datafile=self.source)
+				if self.tdt.cached:
+					sys.stderr.write("Warning: %d tdt trials from cache\n" %
+									 len(self.tdt.sdata))
+				else:
+					sys.stderr.write("Warning: pulled %d trials from tank\n" %
+									 len(self.tdt.sdata))
 			except ttank.TDTError:
 				sys.stderr.write("Warning: can't connect to tank\n")
 				self.tdt = None
 		if self.tdt is None:
 			return (None, None, None, None)
 		elif n < len(self.tdt.sdata):
-			(t, c, s, sigs) = self.tdt.sdata[n]
+			(t, c, s, codes) = self.tdt.sdata[n]
 			times = around(t).astype(Numeric.Int)
 			channels = around(c).astype(Numeric.Int)
 			units = around(s).astype(Numeric.Int)
-			ids = sigs[::]
-			return (times, channels, units, ids)
+			return (times, channels, units, codes)
 		else:
 			sys.stderr.write('Warning: tdt tank appears short!')
 			return (None, None, None, None)
 			
+	def spikepattern(self):
+		"""~/.pyperc/spikepattern (None if not set); read once per file."""
+		if self._spikepattern == 0:
+			try:
+				self._spikepattern = string.strip(open(pyperc('spikepattern'),
+													   'r').readline())
+			except IOError:
+				self._spikepattern = None
+		return self._spikepattern
+
+	def unitselector(self, pattern):
+		"""Compiled pypespikes.UnitSelector for pattern."""
+		try:
+			return self._selectors[pattern]
+		except KeyError:
+			sel = pypespikes.UnitSelector(pattern)
+			self._selectors[pattern] = sel
+			return sel
+
 	def freenth(self, n):
-		if n < len(self.cache):
-			self.cache[n] = None
-			
+		self.cache.drop(n)
+
+	def cachestats(self):
+		"""Record cache hit/miss/eviction counters (dictionary)."""
+		return self.cache.stats()
+
 	def last(self):
 		"""Get last record."""
 		while 1:
 			d = self._next()
 			if d is None: break
-		return (self.cache[-1], len(self.cache)-1)
+		return (self._last, self.nrecs-1)
 
 def count_spikes(spike_times, start, stop):
-	n = 0
-	for t in spike_times:
-		if (t >= start) and (t < stop):
-			n = n + 1
-	return n
+	"""Count spikes in [start, stop).
+
+	See pypespikes.SpikeTimes if you're going to do a lot of these
+	on the same trial.
+
+	"""
+	t = Numeric.array(spike_times)
+	return int(Numeric.sum(Numeric.logical_and(Numeric.greater_equal(t, start),
+											   Numeric.less(t, stop))))
 
 def extract_spikes(spike_times, start, stop, fromzero=None, offset=0):
 	"""Pull out a subset of spikes -- the ones in the specified time window"""
-	v = []
-	for t in spike_times:
-		if (t >= start) and (t < stop):
-			if fromzero:
-				v.append(t - start + offset)
-			else:
-				v.append(t)
-	return v
+	t = Numeric.array(spike_times)
+	v = Numeric.compress(Numeric.logical_and(Numeric.greater_equal(t, start),
+											 Numeric.less(t, stop)), t)
+	if fromzero:
+		v = v - start + offset
+	return v.tolist()
 
 def fixvel(d, start=None, stop=None, kn=2):
 	"""
@@ -797,127 +1465,15 @@ def find_saccades(d, thresh=2, mindur=25, maxthresh=None):
 	- Added maxthresh -- if (vel > maxthresh), assume it's a blink and
 	  don't put it in the list..
 
-	"""
-
-	start = 0
-	stop = len(d.eyet)
-
-	# calculate good v (velocity profile from XY position)
-
-	# calc how to decimate down to 120hz (ie, 8ms sampling period)
-	if 0:
-		for ix in range(1, len(d.eyet)):
-			decimate_by = (d.eyet[ix]-d.eyet[ix-1])
-			if decimate_by > 0:
-				decimate_by = int(0.5 + 8.0 / float(decimate_by))
-				break
-		if ix == len(d.eyet):
-			sys.stderr.write('decimate_by time failure!!\n')
-			sys.exit(1)
-	else:
-		# guess at sampling period in ms:
-		fs = mean(diff(d.eyet))
-		decimate_by = int(0.5 + (8.0 / fs))
-
-	if decimate > 1:
-		t = decimate(d.eyet[start:stop], decimate_by)
-		x = decimate(d.eyex[start:stop], decimate_by)
-		y = decimate(d.eyey[start:stop], decimate_by)
-	else:
-		t = d.eyet[start:stop]
-		x = d.eyex[start:stop]
-		y = d.eyey[start:stop]
-
-	dx = x[1::] - x[0:-1:]
-	dy = y[1::] - y[0:-1:]
-	dt = t[1::] - t[0:-1:]
-
-	dxy = ((dx**2 + dy ** 2) ** .5) / dt
-	dxy = smooth(dxy, 2)
-
-	# t0[i] = start of last fixation
-	# t1[i] = start of this saccade
-	# t2[i] = start of this fixation (end this saccade)
-	# t3[i] = start of next saccade
-	#  tN is the time in ms, tNi is index into d.eye[txy]
-	# state = 1 --> in saccade
-	# state = 2 --> in fixation
-
-	if maxthresh is None:
-		# this will NEVER be exceeded..
-		maxthresh = max(dxy) * 10
-
-	# find a fixation to get started..
-	realti = None
-	for ix in range(0, len(dxy)):
-		if dxy[ix] < thresh and dxy[ix] < maxthresh:
-			realix = ix * decimate_by
-			realti = t[ix]
-			ix0 = ix
-			break
-
-	if realti is None:
-		# no fixations found..
-		return []
-
-
-	t2 = realti
-	t2i = realix
-	state = 2
-	SList = [];
-	fx, fy, fv, lfx, lfy, lfv = None, None, None, None, None, None
-	for ix in range(ix0, len(dxy)):
-		realix = ix * decimate_by
-		realti = t[ix]
-		if (state == 2) and (dxy[ix] > thresh) and (dxy[ix] < maxthresh):
-			# we were in a fixation (or at start) and just entered a saccade
-			t3 = realti
-			t3i = realix
-			# SList this fixation and last fixation positions
-			if d.eyevalid:
-				v = (sum(d.eyevalid[t2i:t3i]) == 0)
-			else:
-				v = 1
-			fx, fy, fv, lfx, lfy, lfv = \
-				mean(d.eyex[t2i:t3i]), mean(d.eyey[t2i:t3i]), v, fx, fy, fv
-			try:
-				if t3-t2 > 0:
-					SList.append((t0,  t1,	t2,	 t3,
-								  t0i, t1i, t2i, t3i,
-								  fx, fy, fv, lfx, lfy, lfv))
-			except NameError:
-				pass
-			(t0, t1, t2, t3) = (t2, realti, None, None)
-			(t0i, t1i, t2i, t3i) = (t2i, realix, None, None)
-			state = 1
-		elif (state == 1) and (dxy[ix] <= thresh):
-			# make sure we're staying below thresh for a ~<mindur>ms
-			skip = 0
-			for i in range(1, int(0.5+float(mindur)/decimate_by)):
-				j = ix + i
-				if j < len(dxy) and dxy[j] > thresh and dxy[ix] < maxthresh:
-					skip = 1
-					break
-			if not skip:
-				# we were in a saccade and now in a stable fixation period
-				t2 = realti
-				t2i = realix
-				state = 2
-
-	# try to catch that last saccade that ran out..
-	if (state == 2) and (dxy[ix] <= thresh):
-		t3 = realti
-		t3i = realix
-		try:
-			if t3-t2 > 0:
-				SList.append((t0,  t1,	t2,	 t3,
-							  t0i, t1i, t2i, t3i,
-							  fx, fy, fv, lfx, lfy, lfv))
-		except NameError:
-			pass
+	Sat Oct 24 09:31:18 2026 mazer
 
-	return SList
+	- now just calls pypesacc.saccades(), which does the same thing
+	  with array ops instead of a per-sample loop. Use
+	  pypesacc.saccade_table() to do a whole file at once.
 
+	"""
+	return pypesacc.saccades(d, thresh=thresh, mindur=mindur,
+							 maxthresh=maxthresh)
 
 def findfix(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
 	"""
@@ -940,45 +1496,13 @@ def findfix(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
 
 	Note: 100 deg/sec -> 1800pix/sec -> 1.8pix/ms
 
-	"""
+	Sat Oct 24 09:31:18 2026 mazer
 
-	# calculate v (velocity profile from XY position)
-	start, stop, v = fixvel(d, start=start, stop=stop)
-
-	fix_ix = []
-	infix = 0
-	for i in range(0, len(v)):
-		if (not d.eyevalid is None) and (not d.eyevalid[i]):
-			# outside valid calibration range -- discard completely
-			infix = 0
-		elif not infix and (v[i] <= thresh):
-			infix = 1
-			fstart = start + i
-		elif infix and ((v[i] > thresh) or i == (len(v)-1)):
-			infix = 0
-			fstop = start + i - 1
-			if (d.eyet[fstop]-d.eyet[fstart]) > dur:
-				fix_ix.append(fstart)
-				fix_ix.append(fstop)
-
-	if len(fix_ix) > 2:
-		merged = fix_ix[:1]
-		for i in range(2, len(fix_ix), 2):
-			if d.eyet[fix_ix[i]] - d.eyet[fix_ix[i-1]] > anneal:
-				merged.append(fix_ix[i-1])
-				merged.append(fix_ix[i])
-		merged.append(fix_ix[-1])
-		fix_ix = merged
-
-	fixations = []
-	for i in range(0, len(fix_ix), 2):
-		a = fix_ix[i]
-		b = fix_ix[i+1]
-		xp = Numeric.sum(d.eyex[a:b]) / float(len(d.eyex[a:b]))
-		yp = Numeric.sum(d.eyey[a:b]) / float(len(d.eyey[a:b]))
-		fixations.append((a, b, d.eyet[a], d.eyet[b], xp, yp))
-
-	return fixations
+	- now just calls pypesacc.fixations() (see find_saccades)
+
+	"""
+	return pypesacc.fixations(d, thresh=thresh, dur=dur, anneal=anneal,
+							  start=start, stop=stop)
 
 def fatal_unpickle_error():
 		exc_type, exc_value, exc_traceback = sys.exc_info()
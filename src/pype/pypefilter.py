@@ -0,0 +1,164 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Trial selection predicates for PypeFile**
+
+PypeFile's filter= argument used to be just a result code ('C', 'E'
+etc) that got compared against each record after it was completely
+loaded. A Filter collects a set of predicates that PypeFile can
+check as early as possible:
+
+  - result code, task name and record_id are checked against the
+    record index (pypeindex.py), so rejected trials are never even
+    read from disk.
+
+  - trial time and params are checked against the record header
+    (see pyperecord.py), before any bulk analog data is decoded.
+
+For example::
+
+  >>> f = Filter(result='C', task='spotmap', recid=(100, 200),
+  ...            ori=(0, 90), tdt_block='Block-3')
+  >>> pf = PypeFile('romeo0001.spotmap.000', filter=f)
+
+Each predicate can be:
+
+  - a tuple or list -- value must be one of these
+  - a callable -- called with the value, should return true/false
+  - anything else -- value must be equal to this
+
+except for recid and trialtime, where a (lo, hi) tuple is a range
+(lo <= x < hi, either end can be None). trialtime limits can be
+seconds since the epoch or time tuples (ie, time.strptime() output).
+
+Keyword args other than the ones named above are predicates on the
+trial's params dictionary (trials without the param are rejected);
+use params={...} for params whose names clash with the keywords.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Tue Oct 20 10:18:33 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import time
+from types import *
+
+from events import ENCODE
+import pypeindex
+
+def _test(value, want):
+	if callable(want):
+		return want(value)
+	elif type(want) in (TupleType, ListType):
+		return value in want
+	else:
+		return value == want
+
+def _inrange(value, want):
+	if callable(want):
+		return want(value)
+	elif type(want) in (TupleType, ListType) and len(want) == 2:
+		(lo, hi) = want
+		return (lo is None or value >= lo) and (hi is None or value < hi)
+	else:
+		return value == want
+
+def _seconds(t):
+	if t is None or type(t) in (IntType, LongType, FloatType):
+		return t
+	return time.mktime(tuple(t))
+
+class Filter:
+	"""Set of trial selection predicates (see module docs)."""
+	def __init__(self, result=None, task=None, recid=None,
+				 trialtime=None, params=None, **kw):
+		self.result = result
+		self.task = task
+		self.recid = recid
+		if trialtime is not None and not callable(trialtime):
+			trialtime = (_seconds(trialtime[0]), _seconds(trialtime[1]))
+		self.trialtime = trialtime
+		self.params = {}
+		if params:
+			self.params.update(params)
+		self.params.update(kw)
+
+	def __repr__(self):
+		l = []
+		for k in ('result', 'task', 'recid', 'trialtime'):
+			if getattr(self, k) is not None:
+				l.append('%s=%s' % (k, getattr(self, k)))
+		for k in self.params.keys():
+			l.append('%s=%s' % (k, self.params[k]))
+		return '<Filter %s>' % ', '.join(l)
+
+	def needheader(self):
+		"""Does this filter need more than the record index?"""
+		return self.trialtime is not None or len(self.params) > 0
+
+	def entry(self, e):
+		"""Check predicates that can be decided from index entry e."""
+		if e[pypeindex.I_TYPE] != ENCODE:
+			return 0
+		if self.result is not None and \
+			   not _test(e[pypeindex.I_RESULT], self.result):
+			return 0
+		if self.task is not None and \
+			   not _test(e[pypeindex.I_TASK], self.task):
+			return 0
+		if self.recid is not None and \
+			   not _inrange(e[pypeindex.I_RECID], self.recid):
+			return 0
+		return 1
+
+	def header(self, rec, taskname=None, trialtime=None):
+		"""Check all predicates against a record header.
+
+		**rec** -- rec[] list (header-only or full record)
+
+		**taskname** -- task name in effect for the record
+
+		**trialtime** -- parsed trial time (time tuple or 'nd')
+
+		"""
+		result = rec[1][0]
+		if len(rec) > 8:
+			recid = rec[8]
+		else:
+			recid = None
+		if not self.entry((None, None, ENCODE, None,
+						   result, taskname, recid)):
+			return 0
+		if self.trialtime is not None:
+			if trialtime is None or type(trialtime) is StringType:
+				# no (parseable) trialtime note
+				return 0
+			if not _inrange(time.mktime(tuple(trialtime)), self.trialtime):
+				return 0
+		params = rec[1][2]
+		for k in self.params.keys():
+			if not params.has_key(k) or not _test(params[k], self.params[k]):
+				return 0
+		return 1
+
+	def __call__(self, p):
+		"""Check a PypeRecord."""
+		return self.header(p.rec, p.taskname, p.parsed_trialtime)
+
+def asfilter(f):
+	"""Convert old style filter= args (result codes) to Filters."""
+	if not f:
+		return None
+	elif isinstance(f, Filter):
+		return f
+	return Filter(result=f)
@@ -0,0 +1,312 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Texture backed sprites for the OpenGL FrameBuffer**
+
+In OpenGL mode sprites used to be drawn with glDrawPixels(), which
+sends the whole RGBA image across the bus every time a sprite gets
+blitted. Sprite.render() now uploads the image once into a texture
+(see TextureManager) and blit()/fastblit() just draw a textured quad,
+so per frame traffic is a handful of vertices. Since it's a quad,
+rotation (Sprite.texangle) and scaling (Sprite.texscale) come for
+free on the GL side -- the sprite's pixels aren't touched. Alpha
+blending is the same as before (FrameBuffer sets up GL_BLEND).
+
+Only GL 1.1 calls are used and textures are padded out to power of
+two sizes, so this works with any old driver and with Mesa's
+software rasterizer (LIBGL_ALWAYS_SOFTWARE=1), which is handy for
+testing on machines without a real graphics card.
+
+Texture memory is accounted for by the TextureManager (one per
+FrameBuffer, fb.textures). When an upload would take it over
+maxbytes, the least recently drawn textures are evicted; sprites
+whose texture got evicted quietly re-upload the next time they're
+drawn. Released textures are kept around (still counted) for reuse
+by the next upload of the same padded size, which is the common
+case for stimulus sequences.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Sun Nov  1 14:36:20 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+try:
+	from OpenGL.GL import *
+	OPENGL_AVAIL = 1
+except ImportError:
+	OPENGL_AVAIL = 0
+
+MAXBYTES = 128 << 20					# default texture memory budget
+
+def _pot(n):
+	"""Smallest power of two >= n."""
+	p = 1
+	while p < n:
+		p = p << 1
+	return p
+
+class Texture:
+	"""One GL texture object holding a w x h RGBA image.
+
+	The texture itself is padded out to tw x th (powers of two);
+	(s, t) are the texture coords of the image's far corner. id is
+	None when there's no GL texture behind it (evicted or released).
+
+	"""
+	def __init__(self, w, h):
+		self.id = None
+		self.w = w
+		self.h = h
+		self.tw = _pot(w)
+		self.th = _pot(h)
+		self.s = float(w) / self.tw
+		self.t = float(h) / self.th
+		self.nbytes = self.tw * self.th * 4
+		self.used = 0
+
+class TextureManager:
+	"""Texture uploads and memory accounting for one GL context.
+
+	**maxbytes** -- texture memory budget (bytes); this is only what
+	pype asks for, the driver's overhead isn't included
+
+	Counters (see stats()): uploads, reuses (uploads that recycled a
+	released texture), evictions, nbytes (currently allocated, incl.
+	the free pool) and peak.
+
+	"""
+	def __init__(self, maxbytes=MAXBYTES):
+		self.maxbytes = maxbytes
+		self._live = {}					# GL id -> Texture
+		self._free = []					# released, ready for reuse
+		self._clock = 0
+		self.nbytes = 0
+		self.peak = 0
+		self.uploads = 0
+		self.reuses = 0
+		self.evictions = 0
+		try:
+			self.maxsize = int(glGetIntegerv(GL_MAX_TEXTURE_SIZE))
+		except:
+			self.maxsize = 1024
+
+	def fits(self, w, h):
+		"""Can a w x h image be held in a single texture?"""
+		return _pot(w) <= self.maxsize and _pot(h) <= self.maxsize
+
+	def upload(self, data, w, h, tex=None):
+		"""Load RGBA string data (w x h, bottom row first) into a texture.
+
+		If tex (from a previous upload) is given and it's still the
+		right size, it's just overwritten, otherwise a texture is
+		recycled or allocated (evicting as needed to stay within
+		maxbytes).
+
+		**returns** -- Texture, or None if it's too big for the card
+
+		"""
+		if not self.fits(w, h):
+			return None
+		if tex is not None and (tex.tw, tex.th) != (_pot(w), _pot(h)):
+			self.release(tex)
+			tex = None
+		if tex is None:
+			tex = Texture(w, h)
+		else:
+			tex.w = w
+			tex.h = h
+			tex.s = float(w) / tex.tw
+			tex.t = float(h) / tex.th
+
+		if tex.id is None:
+			self._allocate(tex)
+		glBindTexture(GL_TEXTURE_2D, tex.id)
+		glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+		glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, w, h,
+						GL_RGBA, GL_UNSIGNED_BYTE, data)
+		glBindTexture(GL_TEXTURE_2D, 0)
+		self.uploads = self.uploads + 1
+		self._touch(tex)
+		return tex
+
+	def _allocate(self, tex):
+		for n in range(len(self._free)):
+			f = self._free[n]
+			if (f.tw, f.th) == (tex.tw, tex.th):
+				del self._free[n]
+				tex.id = f.id
+				self._live[tex.id] = tex
+				self.reuses = self.reuses + 1
+				return
+		self._evict(self.maxbytes - tex.nbytes)
+		ids = glGenTextures(1)
+		try:
+			tex.id = int(ids)
+		except TypeError:
+			tex.id = int(ids[0])
+		glBindTexture(GL_TEXTURE_2D, tex.id)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+		# padding is transparent black
+		glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, tex.tw, tex.th, 0,
+					 GL_RGBA, GL_UNSIGNED_BYTE, '\0' * tex.nbytes)
+		glBindTexture(GL_TEXTURE_2D, 0)
+		self._live[tex.id] = tex
+		self.nbytes = self.nbytes + tex.nbytes
+		self.peak = max(self.peak, self.nbytes)
+
+	def _delete(self, tex):
+		glDeleteTextures([tex.id])
+		self.nbytes = self.nbytes - tex.nbytes
+		tex.id = None
+
+	def _evict(self, limit):
+		# free pool goes first, then least recently drawn
+		while self._free and self.nbytes > limit:
+			self._delete(self._free.pop(0))
+		if self.nbytes > limit:
+			lru = [(t.used, t) for t in self._live.values()]
+			lru.sort()
+			for (used, t) in lru:
+				if self.nbytes <= limit:
+					break
+				del self._live[t.id]
+				self._delete(t)
+				self.evictions = self.evictions + 1
+
+	def _touch(self, tex):
+		self._clock = self._clock + 1
+		tex.used = self._clock
+
+	def release(self, tex):
+		"""Done with tex; its GL texture goes to the free pool."""
+		if tex is None or tex.id is None:
+			return
+		if self._live.has_key(tex.id):
+			del self._live[tex.id]
+			f = Texture(tex.tw, tex.th)
+			f.id = tex.id
+			self._free.append(f)
+		tex.id = None
+
+	def setmax(self, maxbytes):
+		"""Change the memory budget (evicts right away if needed)."""
+		self.maxbytes = maxbytes
+		self._evict(maxbytes)
+
+	def flush(self):
+		"""Delete everything (sprites will re-upload on next draw)."""
+		self._evict(0)
+
+	def lost(self):
+		"""GL context went away (display closed), forget all textures.
+
+		No GL calls here -- the textures are already gone.
+
+		"""
+		for t in self._live.values() + self._free:
+			t.id = None
+		self._live = {}
+		self._free = []
+		self.nbytes = 0
+
+	def stats(self):
+		"""Counters, as a dict."""
+		return {
+			'textures': len(self._live),
+			'free': len(self._free),
+			'nbytes': self.nbytes,
+			'peak': self.peak,
+			'maxbytes': self.maxbytes,
+			'uploads': self.uploads,
+			'reuses': self.reuses,
+			'evictions': self.evictions,
+			}
+
+	def draw(self, tex, x, y, angle=0, scale=1.0):
+		"""Draw tex as a quad, lower left corner at (x, y).
+
+		**x, y** -- GL window coords (origin lower left) of the
+		unrotated, unscaled image's lower left corner; rotation
+		(degrees CCW) and scaling are about the image center
+
+		**scale** -- number or (xscale, yscale) pair
+
+		Untransformed quads are drawn with GL_NEAREST so pixels come
+		out exactly as with glDrawPixels; otherwise GL_LINEAR.
+
+		"""
+		if type(scale) in (type(()), type([])):
+			(sx, sy) = scale
+		else:
+			sx = sy = scale
+		exact = (angle == 0 and sx == 1.0 and sy == 1.0)
+
+		self._touch(tex)
+		glEnable(GL_TEXTURE_2D)
+		glBindTexture(GL_TEXTURE_2D, tex.id)
+		glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+		if exact:
+			f = GL_NEAREST
+		else:
+			f = GL_LINEAR
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, f)
+		glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, f)
+
+		hw = tex.w / 2.0
+		hh = tex.h / 2.0
+		glPushMatrix()
+		glTranslatef(x + hw, y + hh, 0.0)
+		if not exact:
+			glRotatef(angle, 0.0, 0.0, 1.0)
+			glScalef(sx, sy, 1.0)
+		glBegin(GL_QUADS)
+		glTexCoord2f(0.0, 0.0)
+		glVertex2f(-hw, -hh)
+		glTexCoord2f(tex.s, 0.0)
+		glVertex2f(hw, -hh)
+		glTexCoord2f(tex.s, tex.t)
+		glVertex2f(hw, hh)
+		glTexCoord2f(0.0, tex.t)
+		glVertex2f(-hw, hh)
+		glEnd()
+		glPopMatrix()
+
+		glBindTexture(GL_TEXTURE_2D, 0)
+		glDisable(GL_TEXTURE_2D)
+
+if __name__ == '__main__':
+	# quick check, ie (no graphics card needed):
+	#   LIBGL_ALWAYS_SOFTWARE=1 python pypegl.py
+	import sys, time
+	from sprite import *
+
+	fb = quickinit(dpy=":0.0", w=512, h=512, bpp=32, fullscreen=0, opengl=1)
+	s = Sprite(128, 128, 0, 0, fb=fb, on=1)
+	s.fill((255, 1, 1))
+	s.circlefill((1, 255, 1, 128), r=40)
+	s.render()
+
+	n = 0
+	t0 = time.time()
+	while n < 360:
+		fb.clear()
+		s.texangle = n
+		s.texscale = 1.0 + 0.5 * (n % 90) / 90.0
+		s.blit()
+		fb.flip()
+		n = n + 1
+	sys.stderr.write('%.1f fps\n' % (n / (time.time() - t0)))
+	sys.stderr.write('%s\n' % fb.textures.stats())
@@ -0,0 +1,264 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Random-access record index for pype datafiles**
+
+Pype datafiles are just a stream of <<<label>>> tagged pickles (see
+pype_aux.labeled_dump), so the only way to find record N is to
+unpickle records 0..N-1 first. This module builds (and caches on
+disk) a small sidecar index next to each datafile that records where
+each labeled block starts, plus enough header info (label, record
+type, result code, task name and record_id) to pick records without
+loading them.
+
+The sidecar lives next to the datafile with an '.idx' suffix
+(ie, 'romeo0001.spotmap.000.idx' or 'romeo0001.spotmap.000.gz.idx').
+If the index is missing, was written by an older version of this
+module or the datafile has changed since the index was written,
+it's (re)built automatically. Files that are still growing (ie,
+a running experiment) are only re-scanned from the end of the
+last indexed record.
+
+Offsets are always in the UNCOMPRESSED stream, so the same index
+works for .gz files. Plain gzip files are slow to seek in; block
+gzip files (see pypezip.py) only need one member inflated per seek.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Sun Oct 18 10:02:11 2026 mazer
+
+- created
+
+Mon Oct 19 09:12:40 2026 mazer
+
+- scanning/seeking goes through pypezip.RandomReader (block gzip support)
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import sys, os, string, cPickle, bisect
+from types import *
+
+from pype_aux import labeled_load
+from events import ENCODE, NOTE
+from pyperecord import BULK_LABEL
+from pypezip import RandomReader
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+
+# slots in each index entry (entries are plain tuples to keep the
+# sidecar small and independent of this module's class names):
+I_OFFSET = 0				# offset of <<<label>>> line (uncompressed)
+I_LABEL = 1					# label from the <<<label>>> line
+I_TYPE = 2					# rec[0] -- ENCODE, NOTE etc (or None)
+I_TAG = 3					# rec[1] for NOTE records (or None)
+I_RESULT = 4				# trial result code (ENCODE only)
+I_TASK = 5					# task name in effect for this record
+I_RECID = 6					# record_id, rec[8] (ENCODE only)
+
+_PARTIAL = []				# marker: scan hit an incomplete record
+
+def index_name(source):
+	"""Name of the sidecar index file for datafile 'source'."""
+	return source + INDEX_SUFFIX
+
+class RecordIndex:
+	"""Byte-offset index for a single pype datafile.
+
+	**source** -- actual datafile on disk (including '.gz' if compressed)
+
+	**save** -- write the index back to the sidecar file when it's
+	built or extended (if the directory is read-only, the index is
+	silently kept in memory only).
+
+	"""
+	def __init__(self, source, save=1, quiet=None):
+		self.source = source
+		self.fname = index_name(source)
+		self.save = save
+		self.quiet = quiet
+		self.entries = []
+		self.size = -1
+		self.mtime = -1
+		self.end = 0
+		self._encodes = None
+		if not self._read():
+			self.entries = []
+			self.end = 0
+		self.update()
+
+	def __repr__(self):
+		return '<RecordIndex:%s (%d entries)>' % (self.source,
+												  len(self.entries))
+
+	def __len__(self):
+		return len(self.entries)
+
+	def _stat(self):
+		s = os.stat(self.source)
+		return s.st_size, int(s.st_mtime)
+
+	def _read(self):
+		try:
+			f = open(self.fname, 'rb')
+		except IOError:
+			return 0
+		try:
+			try:
+				d = cPickle.load(f)
+			except (EOFError, cPickle.UnpicklingError,
+					ValueError, KeyError, IndexError):
+				return 0
+		finally:
+			f.close()
+		if type(d) is not DictType or d.get('version') != INDEX_VERSION:
+			return 0
+		self.entries = d['entries']
+		self.size = d['size']
+		self.mtime = d['mtime']
+		self.end = d['end']
+		return 1
+
+	def _write(self):
+		if not self.save:
+			return
+		tmp = '%s.%d' % (self.fname, os.getpid())
+		try:
+			f = open(tmp, 'wb')
+			cPickle.dump({'version': INDEX_VERSION,
+						  'source': os.path.basename(self.source),
+						  'size': self.size,
+						  'mtime': self.mtime,
+						  'end': self.end,
+						  'entries': self.entries, }, f, 1)
+			f.close()
+			os.rename(tmp, self.fname)
+		except (IOError, OSError):
+			# read-only data directory (or similar) -- keep going
+			# with the in-memory copy..
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+			if not self.quiet:
+				sys.stderr.write('warning: can\'t write %s\n' % self.fname)
+			self.save = 0
+
+	def stale(self):
+		"""Has the datafile changed since the index was built?"""
+		return (self.size, self.mtime) != self._stat()
+
+	def update(self):
+		"""Bring index up to date with datafile.
+
+		Returns true if the index had to be (re)built or extended.
+
+		"""
+		size, mtime = self._stat()
+		if (self.size, self.mtime) == (size, mtime):
+			return 0
+		if self.source[-3:] == '.gz' or size < self.end or self.end == 0:
+			# compressed files and files that shrank get redone
+			# from scratch
+			self.entries = []
+			self.end = 0
+			if not self.quiet:
+				sys.stderr.write('indexing: %s\n' % self.source)
+		self._scan()
+		self.size, self.mtime = size, mtime
+		self._encodes = None
+		self._write()
+		return 1
+
+	def _scan(self):
+		reader = RandomReader(self.source)
+		try:
+			if self.end:
+				taskname = self.entries[-1][I_TASK]
+			else:
+				taskname = None
+			for (base, fp) in reader.segments(self.end):
+				taskname = self._scanseg(base, fp, taskname)
+				if taskname is _PARTIAL:
+					break
+		finally:
+			reader.close()
+
+	def _scanseg(self, base, fp, taskname):
+		while 1:
+			offset = base + fp.tell()
+			try:
+				label, rec = labeled_load(fp, skip=(BULK_LABEL,))
+			except (EOFError, cPickle.UnpicklingError, ValueError):
+				# partial record at the end of the file -- probably
+				# still being written; leave it for next update()
+				return _PARTIAL
+			if label is None:
+				return taskname
+			rtype, tag, result, recid = None, None, None, None
+			if label != BULK_LABEL and \
+				   type(rec) in (ListType, TupleType) and len(rec) > 1:
+				rtype = rec[0]
+				if rtype == ENCODE:
+					result = rec[1][0]
+					if len(rec) > 8:
+						recid = rec[8]
+				elif rtype == NOTE:
+					tag = rec[1]
+					if tag == 'task_is':
+						taskname = rec[2]
+			self.entries.append((offset, label, rtype, tag,
+								 result, taskname, recid))
+			self.end = base + fp.tell()
+
+	def encodes(self, result=None):
+		"""List of entry numbers for ENCODE (trial) records.
+
+		If result is specified, only trials with matching result
+		codes are returned (same as an old style PypeFile filter=).
+
+		"""
+		if self._encodes is None:
+			self._encodes = []
+			for n in range(len(self.entries)):
+				if self.entries[n][I_TYPE] == ENCODE:
+					self._encodes.append(n)
+		if not result:
+			return self._encodes
+		l = []
+		for n in self._encodes:
+			if self.entries[n][I_RESULT] == result:
+				l.append(n)
+		return l
+
+	def recnum(self, k):
+		"""Trial number (counting all ENCODE records) for entry k."""
+		return bisect.bisect_left(self.encodes(), k)
+
+	def _findnote(self, k, tag, stop=None):
+		while k > 0:
+			k = k - 1
+			e = self.entries[k]
+			if e[I_TYPE] == NOTE and e[I_TAG] == tag:
+				return k
+			elif stop and e[I_TYPE] == stop:
+				break
+		return None
+
+	def trialtime_for(self, k):
+		"""Entry number of 'trialtime' note for trial k (or None)."""
+		return self._findnote(k, 'trialtime', stop=ENCODE)
+
+	def userparams_for(self, k):
+		"""Entry number of 'userparams' note in effect for entry k."""
+		return self._findnote(k, 'userparams')
+
+	def offset(self, k):
+		return self.entries[k][I_OFFSET]
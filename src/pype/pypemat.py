@@ -0,0 +1,338 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**MATLAB v5 (binary) MAT-file writer**
+
+Writes python data directly into a level 5 MAT-file that matlab can
+load() in one shot -- no text formatting on the python side and no
+parsing on the matlab side. Used by pype_expander.py (p2m) in place
+of the old generated matlab scripts.
+
+Conversions:
+
+  - int, long, float -- 1x1 double
+
+  - string -- 1xN char (0x0 if empty)
+
+  - Numeric array (or anything else Numeric.array() can turn into
+    numbers) -- double; 1D vectors are written as Nx1 columns, 2D
+    arrays keep their shape
+
+  - list, tuple -- 1xN cell array (empty ones are [])
+
+  - dict or Struct -- 1x1 struct; Struct keeps its fields in order
+
+  - None -- []
+
+Big struct arrays (ie, one element per trial) can be streamed with
+StructArray: each element is encoded as it's appended and spooled to
+a temp file, so only one trial's worth of data is ever in memory.
+Elements can have different fields (missing fields are [], same as
+matlab does for rec(n).foo = ... assignments). The underlying Spool
+can also be kept on disk and reopened later, or built in pieces by
+several processes and stitched together.
+
+Everything is written in native byte order (the MAT header says
+which). Level 5 files are limited to 2GB per variable.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Tue Oct 27 09:48:13 2026 mazer
+
+- created
+
+- Spool (persistent/mergeable struct array elements)
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import sys, time, struct, tempfile, types
+import Numeric
+
+# data types (tags)
+miINT8 = 1
+miUINT16 = 4
+miINT32 = 5
+miUINT32 = 6
+miDOUBLE = 9
+miMATRIX = 14
+
+# array classes
+mxCELL_CLASS = 1
+mxSTRUCT_CLASS = 2
+mxCHAR_CLASS = 4
+mxDOUBLE_CLASS = 6
+
+NAMELEN = 64							# max field name length (+ null)
+MAXBYTES = 0x7fffffff					# max size of one variable
+
+_NUMBERS = (types.IntType, types.LongType, types.FloatType)
+
+class Struct:
+	"""Ordered struct: list of (name, value) pairs.
+
+	Setting an existing field replaces its value, but it keeps its
+	original position (like matlab).
+
+	"""
+	def __init__(self, fields=None):
+		self.names = []
+		self.values = {}
+		if fields:
+			for (name, value) in fields:
+				self[name] = value
+
+	def __setitem__(self, name, value):
+		if not self.values.has_key(name):
+			self.names.append(name)
+		self.values[name] = value
+
+	def __getitem__(self, name):
+		return self.values[name]
+
+	def items(self):
+		return [(n, self.values[n]) for n in self.names]
+
+def _pad(n):
+	return '\0' * ((8 - n % 8) % 8)
+
+def _tag(mtype, data):
+	# data element: tag + data, padded to 64bit boundary
+	return struct.pack('=II', mtype, len(data)) + data + _pad(len(data))
+
+def _matrix(cls, dims, name, body):
+	return _tag(miMATRIX,
+				_tag(miUINT32, struct.pack('=II', cls, 0)) +
+				_tag(miINT32, struct.pack('=%di' % len(dims), *dims)) +
+				_tag(miINT8, name) +
+				body)
+
+EMPTY = _matrix(mxDOUBLE_CLASS, (0, 0), '', _tag(miDOUBLE, ''))
+
+def _double(v, name=''):
+	a = Numeric.array(v, Numeric.Float64)
+	if len(a.shape) == 0:
+		dims = (1, 1)
+	elif len(a.shape) == 1:
+		dims = (a.shape[0], 1)
+	elif len(a.shape) == 2:
+		# matlab's column major
+		dims = a.shape
+		a = Numeric.transpose(a)
+	else:
+		raise ValueError, 'pypemat: %d-d arrays not supported' % len(a.shape)
+	if Numeric.multiply.reduce(dims) == 0:
+		return _matrix(mxDOUBLE_CLASS, (0, 0), name, _tag(miDOUBLE, ''))
+	return _matrix(mxDOUBLE_CLASS, dims, name,
+				   _tag(miDOUBLE, Numeric.ravel(a).tostring()))
+
+def _char(s, name=''):
+	if len(s) == 0:
+		return _matrix(mxCHAR_CLASS, (0, 0), name, _tag(miUINT16, ''))
+	return _matrix(mxCHAR_CLASS, (1, len(s)), name,
+				   _tag(miUINT16, struct.pack('=%dH' % len(s), *map(ord, s))))
+
+def _cell(v, name=''):
+	if len(v) == 0:
+		return _matrix(mxDOUBLE_CLASS, (0, 0), name, _tag(miDOUBLE, ''))
+	return _matrix(mxCELL_CLASS, (1, len(v)), name,
+				   ''.join([element(x) for x in v]))
+
+def _fieldnames(names):
+	n = min(NAMELEN, max([len(x) for x in names] + [0]) + 1)
+	n = n + (-n % 8)
+	# field name length goes in a 'small' data element
+	return (struct.pack('=Ii', (4 << 16) | miINT32, n) +
+			_tag(miINT8, ''.join([x[:n-1].ljust(n, '\0') for x in names])))
+
+def _struct(s, name=''):
+	if type(s) is types.DictType:
+		s = Struct(s.items())
+	items = s.items()
+	return _matrix(mxSTRUCT_CLASS, (1, 1), name,
+				   _fieldnames([n for (n, v) in items]) +
+				   ''.join([element(v) for (n, v) in items]))
+
+def element(v, name=''):
+	"""Encode v as a (named) MAT-file matrix element (a string)."""
+	t = type(v)
+	if v is None:
+		return _matrix(mxDOUBLE_CLASS, (0, 0), name, _tag(miDOUBLE, ''))
+	elif t is types.StringType:
+		return _char(v, name)
+	elif t in _NUMBERS:
+		return _double(v, name)
+	elif t in (types.ListType, types.TupleType):
+		return _cell(v, name)
+	elif t is types.DictType or isinstance(v, Struct):
+		return _struct(v, name)
+	else:
+		return _double(v, name)
+
+class Spool:
+	"""Encoded struct array elements, spooled to disk.
+
+	**fname** -- spool file; None for an anonymous temp file
+
+	**state** -- state() of an existing spool file to reopen (and
+	keep appending to), otherwise fname is (re)created
+
+	Spools can be saved (flush() + state()) and reopened later, or
+	built separately (ie, in different processes) and glued together
+	with extend().
+
+	"""
+	def __init__(self, fname=None, state=None):
+		self.fname = fname
+		self.names = []
+		self._known = {}
+		self._index = []				# per element: field -> (pos, len)
+		self._pos = 0
+		if fname is None:
+			self._fp = tempfile.TemporaryFile()
+		elif state is None:
+			self._fp = open(fname, 'w+b')
+		else:
+			self._fp = open(fname, 'r+b')
+			(names, self._index, self._pos) = state
+			for name in names:
+				self._addname(name)
+			# anything past the saved state is left over from a
+			# write that never got checkpointed
+			self._fp.truncate(self._pos)
+			self._fp.seek(self._pos)
+
+	def __len__(self):
+		return len(self._index)
+
+	def _addname(self, name):
+		if not self._known.has_key(name):
+			self._known[name] = 1
+			self.names.append(name)
+
+	def append(self, fields):
+		"""Add element; fields is a Struct, dict or (name, value) list."""
+		if type(fields) in (types.ListType, types.TupleType):
+			fields = Struct(fields)
+		elif type(fields) is types.DictType:
+			fields = Struct(fields.items())
+		self._fp.seek(self._pos)
+		ix = {}
+		for (name, value) in fields.items():
+			self._addname(name)
+			e = element(value)
+			self._fp.write(e)
+			ix[name] = (self._pos, len(e))
+			self._pos = self._pos + len(e)
+		self._index.append(ix)
+
+	def extend(self, other):
+		"""Append all of another spool's elements (in order)."""
+		other.flush()
+		other._fp.seek(0)
+		self._fp.seek(self._pos)
+		n = other._pos
+		while n > 0:
+			buf = other._fp.read(min(n, 1 << 20))
+			if len(buf) == 0:
+				raise IOError, 'pypemat: short spool file'
+			self._fp.write(buf)
+			n = n - len(buf)
+		base = self._pos
+		for name in other.names:
+			self._addname(name)
+		for ix in other._index:
+			x = {}
+			for (name, (pos, n)) in ix.items():
+				x[name] = (base + pos, n)
+			self._index.append(x)
+		self._pos = base + other._pos
+
+	def state(self):
+		"""Picklable state, for reopening the spool file later."""
+		return (self.names, self._index, self._pos)
+
+	def flush(self):
+		self._fp.flush()
+
+	def write(self, fp, name):
+		"""Write the elements to open MAT-file fp as 1xN struct array."""
+		fn = _fieldnames(self.names)
+		nbytes = 0
+		for ix in self._index:
+			nbytes = nbytes + len(EMPTY) * (len(self.names) - len(ix))
+			for (pos, n) in ix.values():
+				nbytes = nbytes + n
+		if len(self._index):
+			dims = (1, len(self._index))
+		else:
+			dims = (0, 0)
+		head = _tag(miUINT32, struct.pack('=II', mxSTRUCT_CLASS, 0)) + \
+			   _tag(miINT32, struct.pack('=2i', *dims)) + \
+			   _tag(miINT8, name) + fn
+		nbytes = nbytes + len(head)
+		if nbytes > MAXBYTES:
+			raise ValueError, 'pypemat: %s too big for MAT-file' % name
+
+		fp.write(struct.pack('=II', miMATRIX, nbytes) + head)
+		for ix in self._index:
+			for name in self.names:
+				if ix.has_key(name):
+					(pos, n) = ix[name]
+					self._fp.seek(pos)
+					fp.write(self._fp.read(n))
+				else:
+					fp.write(EMPTY)
+
+	def close(self):
+		if self._fp is not None:
+			self._fp.close()
+			self._fp = None
+
+class StructArray(Spool):
+	"""1xN struct array variable, written one element at a time.
+
+	Elements are spooled to a temp file; the MAT-file itself gets
+	written by close(), so don't use it for anything else until then.
+
+	"""
+	def __init__(self, mat, name):
+		Spool.__init__(self)
+		self.mat = mat
+		self.name = name
+
+	def close(self):
+		"""Write the whole struct array out to the MAT-file."""
+		self.write(self.mat.fp, self.name)
+		Spool.close(self)
+
+class MatFile:
+	"""Level 5 MAT-file, open for writing."""
+	def __init__(self, fname):
+		self.fname = fname
+		self.fp = open(fname, 'wb')
+		text = 'MATLAB 5.0 MAT-file, Platform: %s, Created on: %s' % \
+			   (sys.platform, time.ctime())
+		self.fp.write(text[:116].ljust(116) + '\0' * 8 +
+					  struct.pack('=HH', 0x0100, 0x4d49))
+
+	def write(self, name, value):
+		"""Save value as variable name."""
+		e = element(value, name)
+		if len(e) > MAXBYTES:
+			raise ValueError, 'pypemat: %s too big for MAT-file' % name
+		self.fp.write(e)
+
+	def structarray(self, name):
+		"""Start a struct array variable (see StructArray)."""
+		return StructArray(self, name)
+
+	def close(self):
+		self.fp.close()
+		self.fp = None
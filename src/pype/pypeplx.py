@@ -0,0 +1,401 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Streaming, array based reader for Plexon .plx files**
+
+pyplex.py and plx2asc.py used to unpack .plx files one data block
+at a time with struct.unpack(), which is painfully slow for long
+recordings with lots of LFP data. PlxFile memory maps the file and
+decodes data blocks in bulk instead:
+
+  - data blocks are a 16 byte header (type, timestamp, channel,
+    unit, waveform count and size) followed by the waveform samples
+    (all Int16), so a run of blocks with the same size (ie, spikes
+    with the same number of points, or slow a/d blocks) is just an
+    Int16 matrix with one row per block. blocks() pulls out runs of
+    (up to CHUNKSIZE bytes) as a single Numeric array and slices the
+    header fields and waveforms out of the columns. How many blocks
+    it tries at once adapts to how long the runs have been.
+
+  - TrialClock assigns blocks to trials (external start/stop
+    events, ie, plexon running in gated mode under pype) using array
+    ops on each run, carrying the trial state between runs.
+    trialdata() gives the spike and slow (LFP) blocks that fall in
+    trials with times relative to the trial start, following the
+    same rules as plx2asc has always used.
+
+  - BinaryWriter saves trialdata() as compact per-channel binary
+    files (raw Int16 waveforms plus scale factors) instead of one
+    line of text per sample. See BinaryWriter for the layout.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Wed Oct 28 10:17:52 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import os, struct, mmap
+import Numeric
+
+CHUNKSIZE = 4 << 20						# max bytes decoded at once
+
+MAGIC = 0x58454c50
+HEADERSIZE = 7504						# fixed part of file header
+CHANHEADERSIZE = 1020					# per spike channel
+EVHEADERSIZE = 296						# per event channel
+SLOWHEADERSIZE = 296					# per slow (a/d) channel
+BLOCKHEADER = 8							# data block header (Int16 words)
+
+# data block types
+PL_SPIKE = 1
+PL_STEREO = 2
+PL_TETRO = 3
+PL_EVENT = 4
+PL_SLOW = 5
+
+# event codes (data block channel for PL_EVENT blocks)
+PL_XSTROBE = 257
+PL_XSTART = 258
+PL_XSTOP = 259
+
+class PlxError(Exception): pass
+
+def _cstring(s):
+	return s.split(chr(0))[0]
+
+class _Record:
+	pass
+
+class PlxHeader:
+	"""File header (just the fields needed to decode data).
+
+	Field names are the same as the Plexon structures (and
+	plx2asc.FileHeader). channels[] and slows[] are the spike and
+	slow channel headers (Name, Channel, Gain, NUnits etc).
+
+	"""
+	def __init__(self, buf):
+		(magic, self.Version) = struct.unpack_from('<Ii', buf, 0)
+		if magic != MAGIC:
+			raise PlxError, 'not a plx file'
+		(self.ADFrequency, self.NumDspChannels, self.NumEventChannels,
+		 self.NumSlowChannels, self.NumPointsWave,
+		 self.NumPointsPreThr) = struct.unpack_from('<6i', buf, 136)
+		(self.BitsPerSpikeSample, self.BitsPerSlowSample,
+		 self.SpikeMaxMagnitudeMV, self.SlowMaxMagnitudeMV,
+		 self.SpikePreAmpGain) = struct.unpack_from('<BBhhh', buf, 202)
+
+		pos = HEADERSIZE
+		self.channels = []
+		for n in range(self.NumDspChannels):
+			c = _Record()
+			(c.Name, c.SIGName) = map(_cstring,
+									  struct.unpack_from('<32s32s', buf, pos))
+			(c.Channel, c.WFRate, c.SIG, c.Ref, c.Gain, c.Filter,
+			 c.Threshold, c.Method, c.NUnits) = \
+			 struct.unpack_from('<9i', buf, pos + 64)
+			self.channels.append(c)
+			pos = pos + CHANHEADERSIZE
+		pos = pos + EVHEADERSIZE * self.NumEventChannels
+		self.slows = []
+		for n in range(self.NumSlowChannels):
+			s = _Record()
+			s.Name = _cstring(struct.unpack_from('<32s', buf, pos)[0])
+			(s.Channel, s.ADFrequency, s.Gain, s.Enabled, s.PreAmpGain) = \
+						struct.unpack_from('<5i', buf, pos + 32)
+			self.slows.append(s)
+			pos = pos + SLOWHEADERSIZE
+		if len(self.slows) > 0:
+			# all slow ad channels will have same speed..
+			self.slow_adfreq = self.slows[0].ADFrequency
+		self.datastart = pos
+
+	def spikescale(self, channel):
+		"""Spike waveform a/d units to mV (channel is 1-based)."""
+		return self.SpikeMaxMagnitudeMV / \
+			   (0.5 * (2.0 ** self.BitsPerSpikeSample) *
+				self.channels[channel - 1].Gain * self.SpikePreAmpGain)
+
+	def slowscale(self, channel):
+		"""Slow a/d units to mV (channel is 0-based)."""
+		return self.SlowMaxMagnitudeMV / \
+			   (0.5 * (2.0 ** self.BitsPerSlowSample) *
+				self.slows[channel].Gain * self.slows[channel].PreAmpGain)
+
+class DataBlocks:
+	"""A run of same-sized data blocks, one row per block.
+
+	type, channel, unit -- Int arrays
+
+	ts -- timestamps (ticks at ADFrequency) as Float arrays
+
+	waves -- Int16 array of waveform samples (n x nwords), nwords can
+	be 0 (event blocks, spikes without waveforms)
+
+	"""
+	def __init__(self, a=None):
+		if a is None:
+			return
+		self.type = a[:,0].astype(Numeric.Int)
+		# 40-bit timestamps: upper byte + unsigned 32-bit lower part
+		# (upper byte shifted like plx2asc's DataRecord.ts)
+		u16 = Numeric.bitwise_and(a[:,1:4].astype(Numeric.Int), 0xffff)
+		self.ts = (u16[:,0] * (2.0 ** 40) +
+				   u16[:,2] * 65536.0 + u16[:,1]).astype(Numeric.Float)
+		self.channel = a[:,4].astype(Numeric.Int)
+		self.unit = a[:,5].astype(Numeric.Int)
+		self.waves = a[:,BLOCKHEADER:]
+
+	def __len__(self):
+		return len(self.type)
+
+class PlxFile:
+	"""Memory mapped .plx file."""
+	def __init__(self, fname):
+		self.fname = fname
+		f = open(fname, 'rb')
+		try:
+			self.size = os.fstat(f.fileno()).st_size
+			if self.size < HEADERSIZE:
+				raise PlxError, '%s: not a plx file' % fname
+			self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			f.close()
+		self.header = PlxHeader(self._mm)
+		self.nblocks = 0
+		self.clock = None				# TrialClock (see trialdata)
+
+	def close(self):
+		if self._mm is not None:
+			self._mm.close()
+			self._mm = None
+
+	def blocks(self, chunksize=CHUNKSIZE):
+		"""Generate DataBlocks for the whole file, in file order.
+
+		A truncated block at the end of the file is ignored.
+
+		"""
+		mm = self._mm
+		pos = self.header.datastart
+		end = self.size
+		# rows to try decoding at once for each block size: grows
+		# while runs keep going, shrinks when blocks are interleaved
+		guess = {}
+		while pos + 2 * BLOCKHEADER <= end:
+			(nwf, nwords) = struct.unpack_from('<hh', mm, pos + 12)
+			nw = max(0, nwf * nwords)
+			size = 2 * (BLOCKHEADER + nw)
+			maxrows = max(1, chunksize / size)
+			n = min((end - pos) / size, guess.get(size, 16), maxrows)
+			if n == 0:
+				break
+			a = Numeric.fromstring(mm[pos:pos + n * size], Numeric.Int16)
+			if not Numeric.LittleEndian:
+				a = a.byteswapped()
+			a = Numeric.reshape(a, (n, BLOCKHEADER + nw))
+			# the run ends at the first block of a different size
+			bad = Numeric.nonzero(Numeric.not_equal(
+				Numeric.maximum(a[:,6].astype(Numeric.Int) *
+								a[:,7].astype(Numeric.Int), 0), nw))
+			if len(bad):
+				n = max(1, bad[0])
+				a = a[:n]
+				guess[size] = max(16, 2 * n)
+			else:
+				guess[size] = min(2 * n, maxrows)
+			pos = pos + n * size
+			self.nblocks = self.nblocks + n
+			yield DataBlocks(a)
+
+	def trialdata(self, chunksize=CHUNKSIZE):
+		"""Spike and slow data blocks that fall in trials.
+
+		Generates (kind, trial, blocks, t) tuples for each run:
+		kind is PL_SPIKE or PL_SLOW, trial is the (1-based) trial
+		number for each block, blocks is the DataBlocks and t is
+		the time of each block in secs relative to the start of its
+		trial. For slow blocks, t is also shifted so the first slow
+		sample in the file is at time 0 (the a/d lags the MAP box a
+		bit, see plx2asc). Other block types are skipped.
+
+		"""
+		clock = self.clock = TrialClock()
+		freq = float(self.header.ADFrequency)
+		for b in self.blocks(chunksize):
+			(trial, t0) = clock.assign(b)
+			for kind in (PL_SPIKE, PL_SLOW):
+				ix = Numeric.nonzero(Numeric.logical_and(
+					Numeric.equal(b.type, kind), Numeric.greater(trial, 0)))
+				if len(ix) == 0:
+					continue
+				sub = _take(b, ix)
+				t = Numeric.take(t0, ix)
+				if kind == PL_SLOW:
+					if clock.adshift is None:
+						clock.adshift = sub.ts[0]
+					t = t + clock.adshift
+				yield (kind, Numeric.take(trial, ix), sub, (sub.ts - t) / freq)
+
+def _take(b, ix):
+	sub = DataBlocks()
+	for name in ('type', 'ts', 'channel', 'unit', 'waves'):
+		setattr(sub, name, Numeric.take(getattr(b, name), ix))
+	return sub
+
+class TrialClock:
+	"""Assign data blocks to trials (XSTART ... XSTOP).
+
+	assign() gets called with successive DataBlocks and returns
+	(trial, t0) arrays: trial is the trial number (1-based) each block
+	falls in (0 for blocks outside trials) and t0 the timestamp of the
+	trial's XSTART. State is carried over between calls.
+
+	Two XSTARTs without an XSTOP in between raise PlxError, like
+	plx2asc always has.
+
+	"""
+	def __init__(self):
+		self.trial = 0					# trials started so far
+		self.intrial = 0
+		self.t0 = 0.0
+		self.adshift = None				# see PlxFile.trialdata()
+
+	def assign(self, b):
+		n = len(b)
+		ix = Numeric.arange(n)
+		ev = Numeric.equal(b.type, PL_EVENT)
+		start = Numeric.logical_and(ev, Numeric.equal(b.channel, PL_XSTART))
+		stop = Numeric.logical_and(ev, Numeric.equal(b.channel, PL_XSTOP))
+		if not Numeric.sometrue(Numeric.logical_or(start, stop)):
+			trial = Numeric.zeros(n) + self.trial * self.intrial
+			return trial, Numeric.zeros(n, Numeric.Float) + self.t0
+
+		# state after each block: in a trial if the last start/stop
+		# at or before it was a start
+		marker = Numeric.logical_or(start, stop)
+		last = Numeric.maximum.accumulate(Numeric.where(marker, ix, -1))
+		intrial = Numeric.where(Numeric.greater_equal(last, 0),
+								Numeric.take(start, Numeric.maximum(last, 0)),
+								self.intrial)
+		# double starts: a start while already in a trial
+		before = Numeric.concatenate(([self.intrial], intrial[:-1]))
+		dbl = Numeric.nonzero(Numeric.logical_and(start, before))
+		if len(dbl):
+			raise PlxError, 'double XSTART: trial %d' % \
+				  (self.trial + Numeric.add.reduce(start[:dbl[0]]))
+		trial = self.trial + Numeric.add.accumulate(start.astype(Numeric.Int))
+		laststart = Numeric.maximum.accumulate(Numeric.where(start, ix, -1))
+		t0 = Numeric.where(Numeric.greater_equal(laststart, 0),
+						   Numeric.take(b.ts, Numeric.maximum(laststart, 0)),
+						   self.t0)
+		self.trial = int(trial[-1])
+		self.intrial = int(intrial[-1])
+		self.t0 = float(t0[-1])
+		return trial * intrial, t0
+
+class BinaryWriter:
+	"""Compact binary dump of trialdata() output.
+
+	Everything goes in directory 'dirname', one set of files per
+	channel (NNN is the 1-based channel number, as in the ascii files;
+	slow channels get +1 like plx2asc does). All files are plain
+	little-endian arrays, ready for matlab's fread():
+
+	  spkNNN.trial -- Int32 trial number (1-based) for each spike
+
+	  spkNNN.unit -- Int16 unit (0 is unsorted)
+
+	  spkNNN.time -- Float64 time (ms) re trial start
+
+	  spkNNN.wave -- Int16 raw waveforms, 'npw' points per spike
+
+	  lfpNNN.block -- Float64 (trial, start time (ms), nsamples)
+	  triples, one per slow a/d block
+
+	  lfpNNN.raw -- Int16 raw slow a/d samples (all blocks,
+	  back-to-back); sample k of a block is at
+	  start + 1000 * k / slowfreq ms
+
+	  info -- text, one 'name value' pair per line: adfreq, slowfreq,
+	  npw, and 'spkscaleNNN'/'lfpscaleNNN' to convert raw a/d values
+	  to mV for each channel
+
+	"""
+	def __init__(self, plx, dirname):
+		self.plx = plx
+		self.dirname = dirname
+		if not os.path.isdir(dirname):
+			os.makedirs(dirname)
+		self._files = {}
+		self.scales = {}
+		self.npw = 0
+
+	def _write(self, name, a, typecode):
+		try:
+			f = self._files[name]
+		except KeyError:
+			f = self._files[name] = open(os.path.join(self.dirname, name),
+										 'wb')
+		a = Numeric.array(a).astype(typecode)
+		if not Numeric.LittleEndian:
+			a = a.byteswapped()
+		f.write(a.tostring())
+
+	def write(self, kind, trial, b, t):
+		"""Save one trialdata() run."""
+		chans = Numeric.sort(b.channel)
+		chans = Numeric.compress(Numeric.concatenate(
+			([1], Numeric.not_equal(chans[1:], chans[:-1]))), chans)
+		for c in chans:
+			ix = Numeric.nonzero(Numeric.equal(b.channel, c))
+			if kind == PL_SPIKE:
+				name = 'spk%03d' % c
+				self.scales['spkscale%03d' % c] = self.plx.header.spikescale(c)
+				self.npw = b.waves.shape[1]
+				self._write(name + '.trial', Numeric.take(trial, ix),
+							Numeric.Int32)
+				self._write(name + '.unit', Numeric.take(b.unit, ix),
+							Numeric.Int16)
+				self._write(name + '.time', 1000.0 * Numeric.take(t, ix),
+							Numeric.Float64)
+				self._write(name + '.wave', Numeric.take(b.waves, ix),
+							Numeric.Int16)
+			else:
+				name = 'lfp%03d' % (c + 1)
+				self.scales['lfpscale%03d' % (c + 1)] = \
+							self.plx.header.slowscale(c)
+				n = Numeric.zeros(len(ix), Numeric.Float) + b.waves.shape[1]
+				self._write(name + '.block',
+							Numeric.transpose(Numeric.array(
+								(Numeric.take(trial, ix),
+								 1000.0 * Numeric.take(t, ix), n),
+								Numeric.Float)),
+							Numeric.Float64)
+				self._write(name + '.raw', Numeric.take(b.waves, ix),
+							Numeric.Int16)
+
+	def close(self):
+		for f in self._files.values():
+			f.close()
+		self._files = {}
+		h = self.plx.header
+		f = open(os.path.join(self.dirname, 'info'), 'w')
+		f.write('adfreq %d\n' % h.ADFrequency)
+		if len(h.slows):
+			f.write('slowfreq %d\n' % h.slow_adfreq)
+		f.write('npw %d\n' % self.npw)
+		names = self.scales.keys()
+		names.sort()
+		for name in names:
+			f.write('%s %.12g\n' % (name, self.scales[name]))
+		f.close()
@@ -0,0 +1,237 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**On-disk encoding of pype trial records**
+
+Originally each trial was written to the datafile as a single
+pickled list (see the rec[] layout in pypedata.PypeRecord). That
+means anything that just wants to look at the result code or the
+parameter table has to unpickle all the analog data (eye traces,
+raw photodiode/spike traces, c0..c4 and pupil data) too.
+
+Trials are now written as two separately addressable blocks:
+
+  - <<<encodeh>>> -- the record 'header'. This is the normal rec[]
+    list with all the bulk analog slots (see BULK_SLOTS) set to
+    None. Result code, rt, params, events, photo/spike times,
+    record_id and plexon data are all here.
+
+  - <<<bulk>>> -- the bulk analog data, pickled to a string and
+    then written with pype_aux.labeled_dumps(), so readers that
+    don't need the analog data can skip over it without unpickling.
+
+Old style <<<encode>>> records are still read without problems.
+
+The bulk block payload comes in two flavors:
+
+  - pickled tuple of the BULK_SLOTS contents (RECFORMAT=split)
+
+  - columnar binary (RECFORMAT=columnar, the default). Each analog
+    vector is stored as a contiguous, typed, little-endian block
+    that can be pulled straight out of a memory-mapped datafile
+    with Numeric.fromstring() -- no per-sample unpickling and no
+    int/float list objects on disk (~10x smaller than pickled lists).
+    Layout of the payload::
+
+       'PYCB'                   magic
+       int32                    number of columns (N)
+       N x 12 bytes             column table, one entry per column:
+                                 int8 slot, int8 subslot, char[2] type,
+                                 int32 count, int32 offset
+       ...padding...
+       column data              each column 8-byte aligned, offset
+                                is relative to start of payload
+
+    All integers are little endian. slot is the rec[] slot number,
+    subslot is the channel number for the rec[11] (c0..c6) tuple (-1
+    otherwise), type is one of 'f4', 'f8', 'i2' or 'i4'. Slots that
+    were None when written have no column.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Sun Oct 18 13:40:27 2026 mazer
+
+- created
+
+Sun Oct 18 16:05:52 2026 mazer
+
+- added columnar binary bulk encoding
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import cPickle, struct
+import Numeric
+
+from pype_aux import labeled_dump, labeled_dumps, unpickle
+
+LEGACY_LABEL = 'encode'				# old style single block records
+HEADER_LABEL = 'encodeh'			# record header (everything but bulk)
+BULK_LABEL = 'bulk'					# bulk analog data
+
+# slots in rec[] that hold bulk analog data:
+#   3=time, 4=eyex, 5=eyey, 9=raw photodiode, 10=raw spike,
+#   11=(c0..c6) tuple, 12=pupil area
+BULK_SLOTS = (3, 4, 5, 9, 10, 11, 12)
+CHANNEL_SLOT = 11					# tuple of raw analog channels
+
+COLUMN_MAGIC = 'PYCB'
+
+# portable column types -> Numeric typecodes
+_TYPES = {
+	'f4': Numeric.Float32,
+	'f8': Numeric.Float64,
+	'i2': Numeric.Int16,
+	'i4': Numeric.Int32,
+	}
+_SIZES = { 'f4': 4, 'f8': 8, 'i2': 2, 'i4': 4, }
+
+_DESC = '<bb2sii'					# column table entry
+_DESCSIZE = struct.calcsize(_DESC)
+
+def split_record(rec):
+	"""Split rec[] into (header, bulk).
+
+	header is a copy of rec with the BULK_SLOTS set to None,
+	bulk is a tuple of the contents of the BULK_SLOTS.
+
+	"""
+	header = list(rec)
+	bulk = []
+	for n in BULK_SLOTS:
+		if n < len(header):
+			bulk.append(header[n])
+			header[n] = None
+		else:
+			bulk.append(None)
+	return header, tuple(bulk)
+
+def merge_record(header, bulk):
+	"""Inverse of split_record(); returns full rec[] list."""
+	rec = list(header)
+	for n in range(len(BULK_SLOTS)):
+		if BULK_SLOTS[n] < len(rec):
+			rec[BULK_SLOTS[n]] = bulk[n]
+	return rec
+
+def strip_record(rec):
+	"""Header-only version of a (possibly full) rec[] list."""
+	return split_record(rec)[0]
+
+def listify(rec):
+	"""Convert bulk vectors in rec[] to lists (old style records)."""
+	rec = list(rec)
+	for n in BULK_SLOTS:
+		if n != CHANNEL_SLOT and n < len(rec) and rec[n] is not None:
+			rec[n] = list(rec[n])
+	return rec
+
+def dump_record(rec, f, columnar=1):
+	"""Write a trial record to open datafile f as header + bulk."""
+	header, bulk = split_record(rec)
+	labeled_dump(HEADER_LABEL, header, f, 1)
+	if columnar:
+		labeled_dumps(BULK_LABEL, encode_columns(bulk), f)
+	else:
+		labeled_dumps(BULK_LABEL, cPickle.dumps(bulk, 1), f)
+
+def _column(v):
+	"""Convert vector v to (type, little-endian string) pair."""
+	v = Numeric.asarray(v)
+	tc = v.typecode()
+	if len(v) == 0:
+		ctype = 'f8'
+	elif tc == Numeric.Float32:
+		ctype = 'f4'
+	elif tc in (Numeric.Int8, Numeric.UnsignedInt8, Numeric.Int16):
+		ctype = 'i2'
+	elif tc in (Numeric.Int, Numeric.Int32):
+		# native longs: a/d data always fits in 32bits
+		ctype = 'i4'
+	else:
+		ctype = 'f8'
+	v = v.astype(_TYPES[ctype])
+	if not Numeric.LittleEndian:
+		v = v.byteswapped()
+	return ctype, v.tostring()
+
+def encode_columns(bulk):
+	"""Encode a bulk tuple (from split_record) as columnar binary."""
+	cols = []
+	for n in range(len(BULK_SLOTS)):
+		slot = BULK_SLOTS[n]
+		if bulk[n] is None:
+			pass
+		elif slot == CHANNEL_SLOT:
+			for k in range(len(bulk[n])):
+				if bulk[n][k] is not None:
+					cols.append((slot, k, bulk[n][k]))
+		else:
+			cols.append((slot, -1, bulk[n]))
+
+	# data starts after the column table, 8-byte aligned
+	offset = len(COLUMN_MAGIC) + 4 + len(cols) * _DESCSIZE
+	offset = offset + (8 - offset % 8) % 8
+	desc = [COLUMN_MAGIC, struct.pack('<i', len(cols))]
+	data = []
+	for (slot, sub, v) in cols:
+		ctype, s = _column(v)
+		desc.append(struct.pack(_DESC, slot, sub, ctype,
+								len(s) / _SIZES[ctype], offset))
+		pad = (8 - len(s) % 8) % 8
+		data.append(s)
+		data.append('\0' * pad)
+		offset = offset + len(s) + pad
+	desc = ''.join(desc)
+	return desc + '\0' * ((8 - len(desc) % 8) % 8) + ''.join(data)
+
+def decode_columns(buf, base=0):
+	"""Decode columnar bulk payload starting at buf[base].
+
+	buf can be a string or anything supporting the buffer
+	interface (ie, an mmap of the datafile), in which case
+	the columns are copied directly out of the mapping.
+
+	"""
+	(ncols,) = struct.unpack('<i', buf[base+4:base+8])
+	bulk = [None] * len(BULK_SLOTS)
+	chans = None
+	p = base + 8
+	for n in range(ncols):
+		(slot, sub, ctype, count, offset) = \
+			   struct.unpack(_DESC, buf[p:p+_DESCSIZE])
+		p = p + _DESCSIZE
+		v = Numeric.fromstring(buffer(buf, base+offset,
+									  count * _SIZES[ctype]),
+							   _TYPES[ctype])
+		if not Numeric.LittleEndian:
+			v = v.byteswapped()
+		if slot == CHANNEL_SLOT:
+			if chans is None:
+				chans = [None] * 7
+			chans[sub] = v
+		else:
+			bulk[list(BULK_SLOTS).index(slot)] = v
+	if chans is not None:
+		bulk[list(BULK_SLOTS).index(CHANNEL_SLOT)] = tuple(chans)
+	return tuple(bulk)
+
+def decode_bulk(buf, base=0, length=None):
+	"""Decode the payload of a <<<bulk>>> block.
+
+	buf is either the payload string itself or a buffer (mmap)
+	containing the payload at buf[base:base+length].
+
+	"""
+	if buf[base:base+4] == COLUMN_MAGIC:
+		return decode_columns(buf, base)
+	elif length is None:
+		return unpickle(s=buf)
+	else:
+		return unpickle(s=buf[base:base+length])
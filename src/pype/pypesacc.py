@@ -0,0 +1,353 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Array based saccade and fixation detection**
+
+pypedata.find_saccades() and findfix() used to walk the eye velocity
+trace one sample at a time in python (with an extra look-ahead loop
+for every candidate fixation in find_saccades). saccades() and
+fixations() give exactly the same results, but find all the
+threshold crossings with Numeric array ops; python only gets involved
+once per saccade/fixation, not once per sample.
+
+The segmentation rules are unchanged (see pypedata.find_saccades for
+the gory details): the eye signal is decimated to ~120hz, velocity
+is smoothed, a saccade starts when velocity goes over thresh (and
+under maxthresh -- faster than that is assumed to be a blink) and
+the next fixation starts when velocity drops below thresh and stays
+there for mindur ms. State changes can only alternate (saccade,
+fixation, saccade..), so once the candidate saccade and fixation
+samples are known, the actual state changes are just the first
+sample in each run of same-type candidates.
+
+saccade_table() and fixation_table() run over a whole set of trials
+(a list of PypeRecords or a PypeFile) and collect everything into one
+table, with one Numeric column array per field::
+
+  >>> s = saccade_table(PypeFile('romeo0001.freeview.000'))
+  >>> s.fields
+  ('trial', 'recnum', 't0', 't1', 't2', 't3', ...)
+  >>> amp = s.t2 - s.t1
+  >>> s.rows(3)        # just like find_saccades() for trial 3
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Sat Oct 24 09:31:18 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import Numeric
+from vectorops import mean, diff, decimate, smooth
+
+# fields in a find_saccades() tuple
+SACCADE_FIELDS = ('t0', 't1', 't2', 't3', 't0i', 't1i', 't2i', 't3i',
+				  'fx', 'fy', 'fv', 'lfx', 'lfy', 'lfv')
+
+# fields in a findfix() tuple
+FIXATION_FIELDS = ('start_ix', 'stop_ix', 'start_ms', 'stop_ms',
+				   'xpos', 'ypos')
+
+def _valid(d, a, b):
+	# calibration state of eye position samples a..b (see find_saccades)
+	if d.eyevalid:
+		return (Numeric.sum(d.eyevalid[a:b]) == 0)
+	else:
+		return 1
+
+def saccades(d, thresh=2, mindur=25, maxthresh=None):
+	"""Find all saccades in a trial.
+
+	Drop-in replacement for pypedata.find_saccades(); same args and
+	same list of (t0,t1,t2,t3,t0i,t1i,t2i,t3i,fx,fy,fv,l_fx,l_fy,l_fv)
+	tuples. d must be compute()'d.
+
+	"""
+	# guess at sampling period in ms and decimate to ~120hz (8ms)
+	fs = mean(diff(d.eyet))
+	decimate_by = int(0.5 + (8.0 / fs))
+	t = decimate(d.eyet, decimate_by)
+	x = decimate(d.eyex, decimate_by)
+	y = decimate(d.eyey, decimate_by)
+
+	dx = x[1::] - x[0:-1:]
+	dy = y[1::] - y[0:-1:]
+	dt = t[1::] - t[0:-1:]
+
+	dxy = ((dx**2 + dy ** 2) ** .5) / dt
+	dxy = smooth(dxy, 2)
+
+	n = len(dxy)
+	if n == 0:
+		return []
+	if maxthresh is None:
+		# this will NEVER be exceeded..
+		maxthresh = Numeric.maximum.reduce(dxy) * 10
+
+	ix = Numeric.arange(n)
+	notblink = Numeric.less(dxy, maxthresh)
+	above = Numeric.greater(dxy, thresh)
+
+	# first fixation to get started..
+	ix0 = Numeric.nonzero(Numeric.logical_and(Numeric.less(dxy, thresh),
+											  notblink))
+	if len(ix0) == 0:
+		return []
+	ix0 = ix0[0]
+
+	# candidate saccade starts
+	sacc = Numeric.logical_and(above, notblink)
+
+	# candidate fixation starts: below thresh, unless velocity goes
+	# back over thresh in the next mindur ms
+	w = int(0.5 + float(mindur) / decimate_by)
+	nabove = Numeric.add.accumulate(above)
+	ahead = Numeric.minimum(Numeric.maximum(ix + w - 1, ix), n - 1)
+	skip = Numeric.logical_and(notblink,
+							   Numeric.greater(Numeric.take(nabove, ahead) -
+											   nabove, 0))
+	fix = Numeric.logical_and(Numeric.logical_not(above),
+							  Numeric.logical_not(skip))
+
+	# state changes: first of each run of same-type candidates,
+	# starting in a fixation
+	ev = Numeric.nonzero(Numeric.logical_or(sacc, fix)[ix0:]) + ix0
+	kind = Numeric.take(sacc, ev)
+	prev = Numeric.concatenate(([0], kind[:-1]))
+	ev = Numeric.take(ev, Numeric.nonzero(Numeric.not_equal(kind, prev)))
+
+	# sacc[k] ends fixation fixstart[k]
+	sacc = map(int, ev[0::2])
+	fixstart = [int(ix0)] + map(int, ev[1::2])
+
+	D = decimate_by
+	SList = []
+	fxs, fys, fvs = [None], [None], [None]
+	for k in range(len(sacc)):
+		(a, b) = (fixstart[k] * D, sacc[k] * D)
+		fxs.append(mean(d.eyex[a:b]))
+		fys.append(mean(d.eyey[a:b]))
+		fvs.append(_valid(d, a, b))
+		# the first saccade has no preceeding fixation on record
+		if k > 0 and (t[sacc[k]] - t[fixstart[k]]) > 0:
+			SList.append((t[fixstart[k-1]], t[sacc[k-1]],
+						  t[fixstart[k]], t[sacc[k]],
+						  fixstart[k-1] * D, sacc[k-1] * D,
+						  fixstart[k] * D, sacc[k] * D,
+						  fxs[k+1], fys[k+1], fvs[k+1],
+						  fxs[k], fys[k], fvs[k]))
+
+	# try to catch that last saccade that ran out..
+	m = len(sacc)
+	if m > 0 and len(fixstart) > m and dxy[n-1] <= thresh:
+		if (t[n-1] - t[fixstart[m]]) > 0:
+			# fixation position is still the last one calculated
+			SList.append((t[fixstart[m-1]], t[sacc[m-1]],
+						  t[fixstart[m]], t[n-1],
+						  fixstart[m-1] * D, sacc[m-1] * D,
+						  fixstart[m] * D, (n-1) * D,
+						  fxs[m], fys[m], fvs[m],
+						  fxs[m-1], fys[m-1], fvs[m-1]))
+	return SList
+
+def _fixvel(d, start=None, stop=None, kn=2):
+	# same as pypedata.fixvel()
+	if start is None:
+		start = 0
+	if stop is None:
+		stop = len(d.eyet)
+	dt = d.eyet[(start+1):stop] - d.eyet[start:(stop-1)]
+	dx = d.eyex[(start+1):stop] - d.eyex[start:(stop-1)]
+	dy = d.eyey[(start+1):stop] - d.eyey[start:(stop-1)]
+	dxy = (dx**2 + dy ** 2) ** .5
+	if kn:
+		return start, stop, smooth(dxy / dt, kn=kn)
+	else:
+		return start, stop, dxy / dt
+
+def fixations(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
+	"""Find fixation periods in trial.
+
+	Drop-in replacement for pypedata.findfix(); same args and
+	same list of (start_ix, stop_ix, start_ms, stop_ms, mean_xpos,
+	mean_ypos) tuples.
+
+	"""
+	start, stop, v = _fixvel(d, start=start, stop=stop)
+	n = len(v)
+
+	# in a fixation after sample i: valid and below threshold
+	# (samples outside the calibration range kill the fixation
+	# without ending it)
+	if d.eyevalid is None:
+		valid = Numeric.ones(n)
+	else:
+		valid = Numeric.not_equal(d.eyevalid[:n], 0)
+	infix = Numeric.logical_and(valid, Numeric.less_equal(v, thresh))
+
+	# runs of infix samples: [a, b)
+	edges = Numeric.concatenate(([0], infix, [0]))
+	edges = edges[1:] - edges[:-1]
+	a = Numeric.nonzero(Numeric.greater(edges, 0))
+	b = Numeric.nonzero(Numeric.less(edges, 0))
+
+	fix_ix = []
+	for k in range(len(a)):
+		(fa, fb) = (int(a[k]), int(b[k]))
+		if fb < n:
+			# ended by velocity going over thresh (or by an invalid
+			# sample, which doesn't count)
+			if not valid[fb]:
+				continue
+			fstop = start + fb - 1
+		elif fa < (n - 1):
+			# ran into the last sample
+			fstop = start + n - 2
+		else:
+			# started on the last sample, never ended
+			continue
+		fstart = start + fa
+		if (d.eyet[fstop]-d.eyet[fstart]) > dur:
+			fix_ix.append(fstart)
+			fix_ix.append(fstop)
+
+	if len(fix_ix) > 2:
+		merged = fix_ix[:1]
+		for i in range(2, len(fix_ix), 2):
+			if d.eyet[fix_ix[i]] - d.eyet[fix_ix[i-1]] > anneal:
+				merged.append(fix_ix[i-1])
+				merged.append(fix_ix[i])
+		merged.append(fix_ix[-1])
+		fix_ix = merged
+
+	result = []
+	for i in range(0, len(fix_ix), 2):
+		a = fix_ix[i]
+		b = fix_ix[i+1]
+		xp = Numeric.sum(d.eyex[a:b]) / float(len(d.eyex[a:b]))
+		yp = Numeric.sum(d.eyey[a:b]) / float(len(d.eyey[a:b]))
+		result.append((a, b, d.eyet[a], d.eyet[b], xp, yp))
+
+	return result
+
+class Table:
+	"""Table of per-trial results, stored as one array per field.
+
+	Each field is available as an attribute (or table['field']).
+	The 'trial' column is the trial's position in the list of trials
+	that went in, 'recnum' its record number in the datafile.
+
+	"""
+	def __init__(self, fields, types, rows):
+		self.fields = ('trial', 'recnum') + tuple(fields)
+		types = (Numeric.Int, Numeric.Int) + tuple(types)
+		self._types = types
+		for k in range(len(self.fields)):
+			col = [r[k] for r in rows]
+			setattr(self, self.fields[k], Numeric.array(col, types[k]))
+
+	def __len__(self):
+		return len(self.trial)
+
+	def __getitem__(self, field):
+		return getattr(self, field)
+
+	def __repr__(self):
+		return '<%s: %d rows>' % (self.__class__.__name__, len(self))
+
+	def select(self, trial):
+		"""Row numbers for one trial."""
+		return Numeric.nonzero(Numeric.equal(self.trial, trial))
+
+	def rows(self, trial):
+		"""One trial's rows as a list of tuples (without trial/recnum)."""
+		l = []
+		for r in self.select(trial):
+			l.append(self._row(r))
+		return l
+
+	def _row(self, r):
+		return tuple([self[f][r] for f in self.fields[2:]])
+
+class SaccadeTable(Table):
+	"""Session saccade table (see saccade_table).
+
+	Same fields as the find_saccades() tuples. The very first
+	saccade in a trial can come back with no previous fixation
+	(l_fx/l_fy/l_fv are None); in the table that's lfv == -1 (and
+	lfx/lfy == 0). rows() puts the None's back.
+
+	"""
+	def __init__(self, rows):
+		Table.__init__(self, SACCADE_FIELDS,
+					   (Numeric.Float,) * 4 + (Numeric.Int,) * 4 +
+					   (Numeric.Float, Numeric.Float, Numeric.Int) * 2,
+					   rows)
+
+	def _row(self, r):
+		row = Table._row(self, r)
+		if row[-1] < 0:
+			row = row[:-3] + (None, None, None)
+		return row
+
+class FixationTable(Table):
+	"""Session fixation table (see fixation_table)."""
+	def __init__(self, rows):
+		Table.__init__(self, FIXATION_FIELDS,
+					   (Numeric.Int,) * 2 + (Numeric.Float,) * 4,
+					   rows)
+
+def _trials(trials):
+	# list of records or PypeFile -> (n, record) pairs, compute()'d
+	if hasattr(trials, 'nth'):
+		n = 0
+		while 1:
+			p = trials.nth(n)
+			if p is None:
+				break
+			yield n, p.compute()
+			n = n + 1
+	else:
+		for n in range(len(trials)):
+			yield n, trials[n].compute()
+
+def saccade_table(trials, thresh=2, mindur=25, maxthresh=None):
+	"""Find saccades in a set of trials.
+
+	**trials** -- list of PypeRecords or a PypeFile
+
+	Other args are as for saccades(). Returns a SaccadeTable with
+	all the saccades from all the trials.
+
+	"""
+	rows = []
+	for (n, p) in _trials(trials):
+		for s in saccades(p, thresh=thresh, mindur=mindur,
+						  maxthresh=maxthresh):
+			if s[-1] is None:
+				s = s[:-3] + (0.0, 0.0, -1)
+			rows.append((n, p.recnum) + s)
+	return SaccadeTable(rows)
+
+def fixation_table(trials, thresh=2, dur=50, anneal=10):
+	"""Find fixations in a set of trials.
+
+	**trials** -- list of PypeRecords or a PypeFile
+
+	Other args are as for fixations(). Returns a FixationTable with
+	all the fixations from all the trials.
+
+	"""
+	rows = []
+	for (n, p) in _trials(trials):
+		for f in fixations(p, thresh=thresh, dur=dur, anneal=anneal):
+			rows.append((n, p.recnum) + f)
+	return FixationTable(rows)
@@ -0,0 +1,263 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Spike time queries and PSTH/raster construction**
+
+count_spikes() and extract_spikes() in pypedata.py look at every
+spike for every window, which gets quadratic fast when sweeping lots
+of windows (or bins) over lots of trials. This module provides:
+
+  - SpikeTimes: a sorted copy of a trial's spike times (spike_times,
+    plex_times or anything else) with window queries done by binary
+    search (Numeric.searchsorted) -- count(), window() and counts()
+    for many windows at once.
+
+  - integer unit codes: spike sorting (PlexNet or TDT) identifies
+    each spike by (channel, unit); these are packed into a single int
+    (channel * UNITBASE + unit) instead of the old '005a' style id
+    strings. UnitSelector compiles a spikepattern regexp into a lookup
+    table over unit codes, so the regexp only gets run once per
+    distinct unit and picking out a unit's spikes is one take().
+
+  - psth() and raster(): align a set of trials on an event (anything
+    find_events() can find, including 'foo*' wildcards), and bin the
+    spikes for all trials and all units in one vectorized pass.
+    psth() returns a (units x trials x bins) count matrix instead of
+    lists of lists.
+
+For example::
+
+  >>> pf = PypeFile('romeo0001.curvplay.000', filter='C')
+  >>> counts, edges, trials = psth(pf, 'flip_on', (-100, 400), 10,
+  ...                              units=('005a', '005b'))
+  >>> rate = sum(counts[0]) / (len(trials) * 10 / 1000.)
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Sun Oct 25 10:14:02 2026 mazer
+
+- created
+
+- integer unit codes and UnitSelector (spikepattern matching)
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import math, re
+import Numeric
+
+from pype_aux import find_events
+from pypesacc import _trials
+
+UNITBASE = 256						# unit code = channel*UNITBASE + unit
+
+def _int(v):
+	# Numeric won't do an unsafe (float -> int) cast in array(), and
+	# TDT hands back channels and sort codes as floats
+	return Numeric.around(Numeric.asarray(v)).astype(Numeric.Int)
+
+def unitcode(channels, units):
+	"""Pack channel and unit (sort code) arrays into unit codes.
+
+	Float channels/units (ie, from TDT) are rounded.
+
+	"""
+	return _int(channels) * UNITBASE + _int(units)
+
+def unitname(code):
+	"""Standard name for a unit code: '005a' is channel 5, unit 1."""
+	(c, u) = divmod(int(code), UNITBASE)
+	return '%03d%c' % (c, chr(ord('a') + u - 1))
+
+class UnitSelector:
+	"""Select spikes by unit name pattern (regexp, see unitname).
+
+	The pattern is matched against each distinct unit code once and
+	the result saved in a lookup table, so mask() is just a take()
+	no matter how many spikes there are.
+
+	"""
+	def __init__(self, pattern):
+		self.pattern = pattern
+		self._re = re.compile(pattern)
+		self._lut = Numeric.zeros(0)
+		self._known = Numeric.zeros(0)
+
+	def _learn(self, codes):
+		top = int(Numeric.maximum.reduce(codes)) + 1
+		if top > len(self._lut):
+			(lut, known) = (Numeric.zeros(top), Numeric.zeros(top))
+			lut[:len(self._lut)] = self._lut
+			known[:len(self._known)] = self._known
+			(self._lut, self._known) = (lut, known)
+		# distinct codes we haven't seen yet
+		new = Numeric.sort(Numeric.compress(
+			Numeric.logical_not(Numeric.take(self._known, codes)), codes))
+		if len(new) > 1:
+			new = Numeric.compress(Numeric.concatenate(
+				([1], Numeric.not_equal(new[1:], new[:-1]))), new)
+		for c in new:
+			self._known[c] = 1
+			self._lut[c] = (self._re.match(unitname(c)) is not None)
+
+	def mask(self, codes):
+		"""Boolean mask: which of these unit codes match the pattern."""
+		codes = Numeric.asarray(codes).astype(Numeric.Int)
+		if len(codes) == 0:
+			return Numeric.zeros(0)
+		if int(Numeric.maximum.reduce(codes)) >= len(self._lut) or \
+			   not Numeric.alltrue(Numeric.take(self._known, codes)):
+			self._learn(codes)
+		return Numeric.take(self._lut, codes)
+
+	def select(self, codes, times):
+		"""Times (times[]) of the spikes whose codes match."""
+		return Numeric.compress(self.mask(codes), times)
+
+class SpikeTimes:
+	"""Sorted spike times with binary search window queries.
+
+	Windows are half open: start <= t < stop, same as count_spikes().
+
+	"""
+	def __init__(self, times):
+		t = Numeric.array(times, Numeric.Float)
+		if len(t) > 1 and Numeric.sometrue(Numeric.less(t[1:], t[:-1])):
+			t = Numeric.sort(t)
+		self.times = t
+
+	def __len__(self):
+		return len(self.times)
+
+	def _bounds(self, start, stop):
+		return Numeric.searchsorted(self.times, [start, stop])
+
+	def count(self, start, stop):
+		"""Number of spikes in [start, stop)."""
+		(a, b) = self._bounds(start, stop)
+		return max(0, int(b - a))
+
+	def window(self, start, stop, fromzero=None, offset=0):
+		"""Spike times in [start, stop) (see extract_spikes)."""
+		(a, b) = self._bounds(start, stop)
+		b = max(a, b)
+		if fromzero:
+			return self.times[a:b] - start + offset
+		return self.times[a:b]
+
+	def counts(self, starts, stops):
+		"""Spike counts for many windows at once (Int array)."""
+		a = Numeric.searchsorted(self.times, starts)
+		b = Numeric.searchsorted(self.times, stops)
+		return Numeric.maximum(b - a, 0).astype(Numeric.Int)
+
+	def bincounts(self, edges):
+		"""Histogram of spike times between successive bin edges."""
+		ix = Numeric.searchsorted(self.times, edges)
+		return (ix[1:] - ix[:-1]).astype(Numeric.Int)
+
+def _edges(window, binsize):
+	(lo, hi) = window
+	nbins = int(math.ceil(float(hi - lo) / binsize))
+	return lo + binsize * Numeric.arange(nbins + 1).astype(Numeric.Float)
+
+def _aligned(trials, event, units, occurrence):
+	"""Collect spikes relative to event for each (trial, unit).
+
+	Returns (trials, tix, uix, times, nunits): trial numbers used
+	(the ones where the event occurred) and, for every spike, its row
+	in the trial list, unit number and aligned time.
+
+	"""
+	if units is None:
+		units = (None,)
+	used = []
+	tix, uix, times = [], [], []
+	for (n, p) in _trials(trials):
+		t = find_events(p.events, event)
+		if len(t) <= occurrence:
+			continue
+		t0 = t[occurrence]
+		row = len(used)
+		used.append(n)
+		for u in range(len(units)):
+			ts = Numeric.array(p.spikes(units[u])[1], Numeric.Float)
+			if len(ts):
+				times.append(ts - t0)
+				tix.append(Numeric.zeros(len(ts)) + row)
+				uix.append(Numeric.zeros(len(ts)) + u)
+	if len(times):
+		times = Numeric.concatenate(times)
+		tix = Numeric.concatenate(tix)
+		uix = Numeric.concatenate(uix)
+	else:
+		times = Numeric.array([], Numeric.Float)
+		tix = Numeric.array([], Numeric.Int)
+		uix = Numeric.array([], Numeric.Int)
+	return Numeric.array(used, Numeric.Int), tix, uix, times, len(units)
+
+def psth(trials, event, window, binsize, units=None, occurrence=0):
+	"""Event aligned spike counts for many trials and units.
+
+	**trials** -- list of PypeRecords or a PypeFile
+
+	**event** -- event to align on (see find_events)
+
+	**window** -- (start, stop) in ms relative to the event
+
+	**binsize** -- bin width in ms
+
+	**units** -- list of spike patterns (see PypeRecord.spikes); the
+	default is the standard spike channel
+
+	**occurrence** -- which occurrence of event to align on (trials
+	with fewer are skipped)
+
+	Returns (counts, edges, trials): counts is an Int array of
+	shape (units, trials, bins), edges has the (nbins+1) bin edges and
+	trials gives the trial number (position in the list/file) for each
+	row.
+
+	"""
+	(used, tix, uix, times, nunits) = _aligned(trials, event, units,
+											   occurrence)
+	edges = _edges(window, binsize)
+	nbins = len(edges) - 1
+	ntrials = len(used)
+	keep = Numeric.nonzero(Numeric.logical_and(
+		Numeric.greater_equal(times, edges[0]),
+		Numeric.less(times, window[1])))
+	b = ((Numeric.take(times, keep) - edges[0]) / binsize).astype(Numeric.Int)
+	# one flat (unit, trial, bin) cell number per spike; counting
+	# them is a sort and a binary search
+	cell = (Numeric.take(uix, keep) * ntrials +
+			Numeric.take(tix, keep)) * nbins + b
+	ncells = nunits * ntrials * nbins
+	ix = Numeric.searchsorted(Numeric.sort(cell.astype(Numeric.Int)),
+							  Numeric.arange(ncells + 1))
+	counts = Numeric.reshape(ix[1:] - ix[:-1], (nunits, ntrials, nbins))
+	return counts.astype(Numeric.Int), edges, used
+
+def raster(trials, event, window, units=None, occurrence=0):
+	"""Event aligned spike rasters for many trials and units.
+
+	Same args as psth(). Returns (trials, tix, uix, times): trial
+	numbers used, and for every spike in the window its row (index
+	into trials), unit number and time relative to the event.
+
+	"""
+	(used, tix, uix, times, nunits) = _aligned(trials, event, units,
+											   occurrence)
+	keep = Numeric.nonzero(Numeric.logical_and(
+		Numeric.greater_equal(times, window[0]),
+		Numeric.less(times, window[1])))
+	return (used,
+			Numeric.take(tix, keep).astype(Numeric.Int),
+			Numeric.take(uix, keep).astype(Numeric.Int),
+			Numeric.take(times, keep))
@@ -0,0 +1,151 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Array based TTL pulse detection**
+
+Replaces the sample-by-sample loop in pype._find_ttl(), which used
+to get run over the photodiode and spike channels at the end of
+every trial (and on every get_spikes_now() call). Threshold
+crossings are found with Numeric array ops over the whole channel
+at once; only the (few) pulse onsets ever get looked at in python.
+
+Same basic rules as the old code, including the backwards polarity
+convention: with polarity > 0, a pulse starts at the first sample
+below threshold, with polarity <= 0 at the first sample above
+threshold. In addition:
+
+  - **hysteresis** -- once a pulse has started, the signal has to go
+    past thresh by this much (in the other direction) before the
+    pulse is over. Keeps noisy edges from being counted as multiple
+    pulses. 0 (the default) is the old behavior.
+
+  - **refractory** -- onsets less than this many ms after the last
+    reported onset are dropped. 0 (default) means no dead time.
+
+find_ttl() does one channel, find_ttl_channels() does a list of
+channels (ie, the c0..c4 a/d channels saved in rec[11]) against the
+same timebase, with per-channel or shared settings. TTLDetector
+does the same thing incrementally, for data that's arriving in
+chunks (see dacqstream.py).
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Fri Oct 23 10:05:51 2026 mazer
+
+- created (TTLDetector moved here from dacqstream.py)
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+from types import *
+from Numeric import *
+
+class TTLDetector:
+	"""Incremental TTL pulse detector.
+
+	**thresh** -- detection threshold (a/d units)
+
+	**polarity** -- > 0 for pulses that go below thresh, <= 0 for
+	pulses that go above
+
+	**hysteresis** -- extra distance past thresh needed to end a pulse
+
+	**refractory** -- min ms between reported onsets
+
+	The in-pulse state (and time of the last onset, for the
+	refractory period) is carried over between feed() calls, so a
+	signal can be fed in arbitrary chunks and gives the same
+	results as doing it all at once.
+
+	"""
+	def __init__(self, thresh=500, polarity=1, hysteresis=0, refractory=0):
+		self.thresh = thresh
+		self.polarity = polarity
+		self.hysteresis = abs(hysteresis)
+		self.refractory = refractory
+		self.reset()
+
+	def reset(self):
+		self.inpulse = 0
+		self.lastonset = None
+
+	def feed(self, t, x):
+		"""Process new samples; returns array of pulse onset times."""
+		if len(x) == 0:
+			return array([], Float32)
+		if self.polarity > 0:
+			on = less(x, self.thresh)
+			off = greater(x, self.thresh + self.hysteresis)
+		else:
+			on = greater(x, self.thresh)
+			off = less(x, self.thresh - self.hysteresis)
+		# only samples that are clearly on or off can change state
+		ix = nonzero(logical_or(on, off))
+		if len(ix) == 0:
+			return array([], Float32)
+		state = take(on, ix)
+		prev = concatenate(([self.inpulse], state[:-1]))
+		self.inpulse = int(state[-1])
+		onsets = take(ix, nonzero(logical_and(state, logical_not(prev))))
+		times = take(t, onsets)
+		if self.refractory > 0 and len(times) > 0:
+			times = self._refractory(times)
+		return times
+
+	def _refractory(self, times):
+		# greedy: each kept onset starts a new dead time. Only loops
+		# over onsets, not samples.
+		keep = []
+		last = self.lastonset
+		for k in range(len(times)):
+			if last is None or (times[k] - last) >= self.refractory:
+				keep.append(k)
+				last = times[k]
+		self.lastonset = last
+		return take(times, keep)
+
+def find_ttl(t, x, thresh=500, polarity=1, hysteresis=0, refractory=0):
+	"""Find TTL pulse onsets in x (sampled at times t).
+
+	Returns an array of onset times (see module docs for the
+	detection rules).
+
+	"""
+	return TTLDetector(thresh, polarity, hysteresis, refractory).feed(t, x)
+
+def _perchan(v, k):
+	if type(v) in (TupleType, ListType):
+		return v[k]
+	return v
+
+def find_ttl_channels(t, channels, thresh=500, polarity=1,
+					  hysteresis=0, refractory=0):
+	"""Find TTL pulse onsets on several channels at once.
+
+	**channels** -- sequence of channel vectors (or 2D array, one row
+	per channel) all sampled at times t; None entries are skipped
+
+	thresh, polarity, hysteresis and refractory can be single values
+	or tuples/lists with one value per channel.
+
+	Returns a list of onset time arrays, one per channel (None for
+	None channels).
+
+	"""
+	result = []
+	for k in range(len(channels)):
+		if channels[k] is None:
+			result.append(None)
+		else:
+			result.append(find_ttl(t, channels[k],
+								   _perchan(thresh, k),
+								   _perchan(polarity, k),
+								   _perchan(hysteresis, k),
+								   _perchan(refractory, k)))
+	return result
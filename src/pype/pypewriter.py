@@ -0,0 +1,201 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**Background datafile writer**
+
+PypeApp.record_write() used to open the datafile, pickle the whole
+trial and close the file again -- all inside the inter-trial
+interval. On NFS mounted data directories that can easily take tens
+of ms per trial. RecordWriter moves the serialization and disk i/o
+into a dedicated writer thread:
+
+  - trials and notes are queued (in order) and written by the
+    writer thread, which keeps the datafile open between writes.
+
+  - the queue is bounded (RECQUEUE in the config file); if the disk
+    falls that far behind, record_write() blocks until there's room
+    again instead of eating up memory. RECQUEUE=0 means write
+    synchronously, just like the old code.
+
+  - sync() is a barrier: it waits for everything queued to hit the
+    datafile, closes it and (if RECFSYNC is set) fsync()s it.
+    PypeApp calls this at the end of every run (record_done), so
+    once a run's stopped, the data's on disk.
+
+  - errors in the writer thread (disk full etc) are kept and
+    re-raised (as IOError) in the main thread on the next write or
+    sync(), so they can't go unnoticed.
+
+status() returns a one-line summary of queue depth and durability
+state for the GUI.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Wed Oct 21 11:02:45 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import os, time, threading, Queue
+
+from pype_aux import labeled_dump
+import pyperecord
+
+def dump(f, rec, recformat=None):
+	"""Write a trial (ENCODE) record to open file f.
+
+	recformat is the RECFORMAT config setting (see pyperecord.py).
+
+	"""
+	if recformat == 'pickle':
+		# old style single block record (vectors as lists)
+		labeled_dump('encode', pyperecord.listify(rec), f, 1)
+	else:
+		# header + bulk analog data
+		pyperecord.dump_record(rec, f, columnar=(recformat != 'split'))
+
+class RecordWriter:
+	"""Queue trial records and notes for writing by a writer thread.
+
+	**maxqueue** -- max number of pending writes (0 for synchronous)
+
+	**fsync** -- fsync() datafile on sync() (otherwise it's just
+	flushed to the OS)
+
+	"""
+	def __init__(self, maxqueue=50, fsync=1):
+		self.maxqueue = maxqueue
+		self.fsync = fsync
+		self.written = 0				# total blocks written
+		self.synced = 1					# everything written is on disk
+		self.lastsync = None			# time of last sync()
+		self.maxdepth = 0				# queue high-water mark
+		self.stalls = 0					# times a write had to wait
+		self._error = None
+		self._fname = None
+		self._f = None
+		self._lock = threading.Lock()
+		if maxqueue > 0:
+			self._q = Queue.Queue(maxqueue)
+			self._thread = threading.Thread(target=self._run)
+			self._thread.setDaemon(1)
+			self._thread.start()
+		else:
+			self._q = None
+
+	def depth(self):
+		"""Number of writes still waiting in the queue."""
+		if self._q is None:
+			return 0
+		return self._q.qsize()
+
+	def record(self, fname, rec, recformat=None):
+		"""Queue trial record rec[] for writing to datafile fname."""
+		self._put((fname, 'record', rec, recformat))
+
+	def note(self, fname, label, rec):
+		"""Queue labeled (note) record for writing to datafile fname."""
+		self._put((fname, 'note', rec, label))
+
+	def sync(self):
+		"""Wait for all queued writes to complete, then close and
+		flush/fsync the datafile.
+
+		"""
+		if self._q is not None:
+			self._q.join()
+		self._lock.acquire()
+		try:
+			self._close()
+		finally:
+			self._lock.release()
+		self.lastsync = time.time()
+		self._check()
+
+	def close(self):
+		self.sync()
+
+	def status(self):
+		"""One line summary of writer state (for the GUI)."""
+		if self._error:
+			return 'disk: ERROR'
+		elif self.depth() > 0:
+			return 'disk: %d queued' % self.depth()
+		elif self.synced:
+			return 'disk: synced'
+		else:
+			return 'disk: unsynced'
+
+	def _check(self):
+		if self._error:
+			e = self._error
+			self._error = None
+			raise IOError, 'datafile write failed: %s' % e
+
+	def _put(self, job):
+		self._check()
+		self.synced = 0
+		if self._q is None:
+			self._write(job)
+			self._check()
+		else:
+			if self._q.full():
+				self.stalls = self.stalls + 1
+			self._q.put(job)
+			self.maxdepth = max(self.maxdepth, self._q.qsize())
+
+	def _run(self):
+		while 1:
+			job = self._q.get()
+			try:
+				self._write(job)
+			finally:
+				self._q.task_done()
+
+	def _write(self, job):
+		(fname, kind, rec, arg) = job
+		self._lock.acquire()
+		try:
+			try:
+				if fname != self._fname:
+					self._close()
+					self._f = open(fname, 'a')
+					self._fname = fname
+				if kind == 'record':
+					dump(self._f, rec, arg)
+				else:
+					labeled_dump(arg, rec, self._f, 1)
+				# flush (but don't fsync) so anyone reading the
+				# datafile while it's being written sees whole records
+				self._f.flush()
+				self.written = self.written + 1
+			except (IOError, OSError), e:
+				self._error = '%s: %s' % (fname, e)
+				self._f = None
+				self._fname = None
+		finally:
+			self._lock.release()
+
+	def _close(self):
+		# lock must be held
+		if self._f is not None:
+			try:
+				try:
+					self._f.flush()
+					if self.fsync:
+						os.fsync(self._f.fileno())
+				finally:
+					self._f.close()
+			except (IOError, OSError), e:
+				self._error = '%s: %s' % (self._fname, e)
+			self._f = None
+			self._fname = None
+		self.synced = (self._error is None)
@@ -0,0 +1,374 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+**In-process decompression for pype datafiles**
+
+Replaces the old 'gunzip | ...' and 'cat a b c | ...' pipes that
+PypeFile used for compressed and composite ('a+b+c') datafiles:
+
+  - Stream() decodes one or more files (compressed or not) in worker
+    threads, one worker per file, and feeds the results, in order,
+    into a single pipe. The consumer end of the pipe is a real file
+    object, so cPickle still gets to use its fast file i/o path.
+    zlib releases the GIL while inflating, so composite files are
+    effectively decoded in parallel. Decoding errors are kept in
+    Stream.error instead of disappearing into /dev/null.
+
+  - Block gzip files: normal gzip files (gunzip and zcat still work on
+    them) made up of a series of independent gzip members, each
+    holding a whole number of <<<label>>> blocks (~1MB uncompressed).
+    Each member header carries a 'PB' extra field with the member's
+    compressed and uncompressed sizes, so the member table can be
+    built by hopping from header to header without inflating
+    anything. Combined with the record index (pypeindex.py), this
+    gives true random access into compressed datafiles -- only the
+    member holding the record gets inflated. Use compress() (or the
+    pypegzip tool) to convert existing datafiles.
+
+  - RandomReader() hides the differences between plain, gzip and
+    block gzip files for random access via the record index.
+
+Author -- James A. Mazer (james.mazer@yale.edu)
+
+**Revision History**
+
+Mon Oct 19 09:12:40 2026 mazer
+
+- created
+
+"""
+
+__author__   = '$Author$'
+__date__     = '$Date$'
+__revision__ = '$Revision$'
+__id__       = '$Id$'
+
+import sys, os, string, struct, zlib, gzip, time, bisect
+import threading, Queue, cStringIO
+
+BLOCKSIZE = 1 << 20					# target uncompressed bytes/member
+CHUNKSIZE = 1 << 18					# read size for streaming decode
+MAXCHUNKS = 64						# per-file read-ahead (chunks)
+
+_GZMAGIC = '\x1f\x8b\x08'
+_FEXTRA = 0x04
+_PBDATA = '<II'						# member size, uncompressed size
+_PBLEN = 4 + 8						# PB subfield: id, length, _PBDATA
+
+def _iscompressed(fname):
+	return fname[-3:] == '.gz'
+
+class _Stop(Exception):
+	pass
+
+def _finished(d):
+	"""Has decompressor d seen the end of its gzip member?
+
+	Once the member's trailer's been read, anything else fed to the
+	decompressor comes back as unused_data; if the stream's been cut
+	short it gets eaten (or rejected) instead.
+
+	"""
+	try:
+		d = d.copy()
+		d.decompress('\0')
+	except (zlib.error, ValueError):
+		return 0
+	return d.unused_data == '\0'
+
+class Stream:
+	"""Decode a list of (possibly compressed) files into one stream.
+
+	Stream.fp is a regular (pipe) file object that returns the
+	concatenated, decompressed contents of all the files in order.
+	Each file gets its own decoder thread so they're decompressed
+	concurrently; a feeder thread writes the decoded chunks into
+	the pipe in file order. Per-file read-ahead is bounded by
+	MAXCHUNKS*CHUNKSIZE bytes.
+
+	If something goes wrong (missing file, corrupt data etc) the
+	stream ends early and the error message is left in Stream.error.
+
+	"""
+	def __init__(self, flist):
+		self.flist = flist
+		self.error = None
+		self._stop = 0
+		r, w = os.pipe()
+		self.fp = os.fdopen(r, 'r')
+		self._w = w
+		self._queues = []
+		for fname in flist:
+			q = Queue.Queue(MAXCHUNKS)
+			self._queues.append(q)
+			t = threading.Thread(target=self._decode, args=(fname, q))
+			t.setDaemon(1)
+			t.start()
+		t = threading.Thread(target=self._feed)
+		t.setDaemon(1)
+		t.start()
+
+	def close(self):
+		self._stop = 1
+		try:
+			self.fp.close()
+		except IOError:
+			pass
+
+	def _put(self, q, x):
+		while 1:
+			if self._stop:
+				raise _Stop
+			try:
+				q.put(x, 1, 0.25)
+				return
+			except Queue.Full:
+				pass
+
+	def _decode(self, fname, q):
+		try:
+			try:
+				f = open(fname, 'rb')
+				try:
+					if _iscompressed(fname):
+						self._inflate(f, q)
+					else:
+						while 1:
+							s = f.read(CHUNKSIZE)
+							if not s:
+								break
+							self._put(q, s)
+				finally:
+					f.close()
+			except _Stop:
+				return
+			except (IOError, OSError, zlib.error), e:
+				self.error = '%s: %s' % (fname, e)
+		finally:
+			try:
+				self._put(q, None)
+			except _Stop:
+				pass
+
+	def _inflate(self, f, q):
+		# gzip files can be made of multiple members (block gzip
+		# files always are) -- start a new decompressor every time
+		# one runs out
+		d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		while 1:
+			s = f.read(CHUNKSIZE)
+			if not s:
+				break
+			while s:
+				x = d.decompress(s)
+				if x:
+					self._put(q, x)
+				s = d.unused_data
+				if s:
+					x = d.flush()
+					if x:
+						self._put(q, x)
+					d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		finished = _finished(d)
+		x = d.flush()
+		if x:
+			self._put(q, x)
+		if not finished:
+			raise IOError, 'truncated gzip file'
+
+	def _feed(self):
+		try:
+			try:
+				for q in self._queues:
+					while 1:
+						s = q.get()
+						if s is None:
+							break
+						while s:
+							n = os.write(self._w, s)
+							s = s[n:]
+					if self.error:
+						break
+			except OSError:
+				# reader went away (EPIPE)
+				pass
+		finally:
+			self._stop = 1
+			os.close(self._w)
+
+def _readmember(f, coffset):
+	"""Read member header at coffset; returns (size, usize, hdrlen).
+
+	Returns None if there's no PB field (or no member) there.
+
+	"""
+	f.seek(coffset)
+	h = f.read(12)
+	if len(h) < 12 or h[:3] != _GZMAGIC or not (ord(h[3]) & _FEXTRA):
+		return None
+	(xlen,) = struct.unpack('<H', h[10:12])
+	x = f.read(xlen)
+	p = 0
+	while p + 4 <= len(x):
+		(si1, si2, slen) = struct.unpack('<BBH', x[p:p+4])
+		if (chr(si1), chr(si2)) == ('P', 'B') and slen == 8:
+			(size, usize) = struct.unpack(_PBDATA, x[p+4:p+12])
+			return size, usize, 12 + xlen
+		p = p + 4 + slen
+	return None
+
+def block_table(fname):
+	"""Member table for a block gzip file.
+
+	Returns list of (coffset, size, uoffset, usize, hdrlen) tuples,
+	one per gzip member, or None if fname isn't a block gzip file.
+
+	"""
+	try:
+		f = open(fname, 'rb')
+	except IOError:
+		return None
+	try:
+		fsize = os.fstat(f.fileno()).st_size
+		table = []
+		coffset, uoffset = 0, 0
+		while coffset < fsize:
+			m = _readmember(f, coffset)
+			if m is None:
+				return None
+			(size, usize, hdrlen) = m
+			table.append((coffset, size, uoffset, usize, hdrlen))
+			coffset = coffset + size
+			uoffset = uoffset + usize
+		if len(table) == 0:
+			return None
+		return table
+	finally:
+		f.close()
+
+def _member(fname, f, m):
+	(coffset, size, uoffset, usize, hdrlen) = m
+	f.seek(coffset)
+	s = f.read(size)
+	try:
+		data = zlib.decompress(s[hdrlen:-8], -zlib.MAX_WBITS)
+	except zlib.error, e:
+		raise IOError, '%s: member at %d: %s' % (fname, coffset, e)
+	(crc, isize) = struct.unpack('<iI', s[-8:])
+	if len(data) != usize or zlib.crc32(data) != crc:
+		raise IOError, '%s: member at %d: bad crc/size' % (fname, coffset)
+	return data
+
+def _member_header(size, usize):
+	# fixed 10 byte gzip header (FEXTRA set, OS=unknown) + XLEN +
+	# the single PB subfield
+	return _GZMAGIC + chr(_FEXTRA) + struct.pack('<I', int(time.time())) + \
+		   '\x00\xff' + struct.pack('<H', _PBLEN) + \
+		   'PB' + struct.pack('<H', 8) + struct.pack(_PBDATA, size, usize)
+
+def _write_member(out, data, level):
+	c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+	z = c.compress(data) + c.flush()
+	size = 12 + _PBLEN + len(z) + 8
+	out.write(_member_header(size, len(data)))
+	out.write(z)
+	out.write(struct.pack('<iI', zlib.crc32(data), len(data) & 0xffffffffL))
+
+def compress(src, dst=None, blocksize=BLOCKSIZE, level=6):
+	"""Compress datafile src into block gzip file dst (src.gz).
+
+	Member boundaries are always placed between <<<label>>> blocks
+	(using the record index), so every record can be loaded by
+	inflating just one member.
+
+	"""
+	import pypeindex
+
+	if dst is None:
+		dst = src + '.gz'
+	ix = pypeindex.RecordIndex(src, save=0, quiet=1)
+	ends = []
+	for n in range(1, len(ix.entries)):
+		ends.append(ix.offset(n))
+	ends.append(os.stat(src).st_size)
+
+	f = open(src, 'rb')
+	out = open(dst + '.tmp', 'wb')
+	try:
+		start = 0
+		for n in range(len(ends)):
+			end = ends[n]
+			if (end - start) >= blocksize or n == (len(ends) - 1):
+				f.seek(start)
+				_write_member(out, f.read(end - start), level)
+				start = end
+	finally:
+		f.close()
+		out.close()
+	os.rename(dst + '.tmp', dst)
+	return dst
+
+class RandomReader:
+	"""Random access to a plain, gzip or block gzip datafile.
+
+	at(offset) returns a file-like object positioned at 'offset'
+	in the uncompressed stream. For block gzip files that's an
+	in-memory copy of the member holding 'offset' (so a full
+	<<<label>>> block can always be read from it); for plain
+	gzip files it's a (slow) gzip.GzipFile; plain files just
+	get seek()'d.
+
+	segments(start) yields (base, file) pairs covering the
+	uncompressed stream from 'start' onward, where file.tell()+base
+	is the offset in the uncompressed stream. This is what the
+	record index uses to scan datafiles.
+
+	"""
+	def __init__(self, source):
+		self.source = source
+		self.table = None
+		self._uoffsets = None
+		self._cur = None
+		if _iscompressed(source):
+			self.table = block_table(source)
+			if self.table is None:
+				self.fp = gzip.open(source, 'rb')
+			else:
+				self.fp = open(source, 'rb')
+				self._uoffsets = [m[2] for m in self.table]
+		else:
+			self.fp = open(source, 'rb')
+
+	def close(self):
+		self.fp.close()
+		self._cur = None
+
+	def blocked(self):
+		return self.table is not None
+
+	def _load(self, k):
+		if self._cur is None or self._cur[0] != k:
+			self._cur = (k, cStringIO.StringIO(_member(self.source, self.fp,
+													   self.table[k])))
+		return self._cur[1]
+
+	def at(self, offset):
+		if self.table is None:
+			self.fp.seek(offset)
+			return self.fp
+		k = bisect.bisect_right(self._uoffsets, offset) - 1
+		f = self._load(k)
+		f.seek(offset - self.table[k][2])
+		return f
+
+	def segments(self, start=0):
+		if self.table is None:
+			self.fp.seek(start)
+			yield 0, self.fp
+		else:
+			for m in self.table:
+				if (m[2] + m[3]) > start:
+					f = cStringIO.StringIO(_member(self.source, self.fp, m))
+					if start > m[2]:
+						f.seek(start - m[2])
+					yield m[2], f
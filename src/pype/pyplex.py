@@ -45,6 +45,10 @@ Sun Sep 22 17:58:00 2002 mazer ::
 
 - Extensive revision (almost rewrote from scratch).
 
+Wed Oct 28 10:17:52 2026 mazer
+
+- load_plx() reads data blocks in bulk with pypeplx.PlxFile
+
 """
 
 __author__   = '$Author$'
@@ -58,6 +62,7 @@ import cPickle
 import Numeric
 
 from pype import *
+import pypeplx
 
 # GLOBALS
 # Definitions for start and stop event channels on Mazer rig.
@@ -165,36 +170,50 @@ class Plexondata:
 				print self.trialdata[n][chn]
 
 	def load_plx(self, filename):
+		# Wed Oct 28 10:17:52 2026 mazer
+		#   data blocks are decoded in bulk by pypeplx.PlxFile;
+		#   only the spikes themselves get looked at one by one
 		self.filename = filename
 		fp = open(self.filename, 'r')
 		self.header = Header(fp)
+		fp.close()
 		self.trialdata = {}
 		self.channellist = {}
 
+		plx = pypeplx.PlxFile(self.filename)
+		freq = float(self.header.freq)
 		trialno = -1
-		while 1:
-			try:
-				r = PlexonRecord(fp, waveforms=None)
-			except EOFError:
-				break
-
-			if r.typecode == Plexondata.EVENT_CODE:
-				if r.channel == Plexondata.STARTCHANNEL:
-					t0 = r.timestamp
-					trialno = trialno + 1
-					self.trialdata[trialno] = {}
-					sys.stderr.write('.')
-					sys.stderr.flush()
-			else:
-				chn = 'sig%02d%c' % (r.channel, ord('a')+r.unit)
-				# compute timestamp in integral ms
-				ts = int(0.5 + 1000.0 *
-						 float(r.timestamp - t0) / float(self.header.freq))
+		t0 = None
+		for b in plx.blocks():
+			ev = Numeric.equal(b.type, Plexondata.EVENT_CODE)
+			start = Numeric.logical_and(ev, Numeric.equal(
+				b.channel, Plexondata.STARTCHANNEL)).astype(Numeric.Int)
+			trial = trialno + Numeric.add.accumulate(start)
+			for k in range(trialno + 1, trial[-1] + 1):
+				self.trialdata[k] = {}
+				sys.stderr.write('.')
+				sys.stderr.flush()
+			# timestamp of the START for each block's trial
+			last = Numeric.maximum.accumulate(
+				Numeric.where(start, Numeric.arange(len(b)), -1))
+			if t0 is None:
+				t0 = b.ts[0]
+			tstart = Numeric.where(Numeric.greater_equal(last, 0),
+								   Numeric.take(b.ts, Numeric.maximum(last, 0)),
+								   t0)
+			# compute timestamp in integral ms
+			ms = 0.5 + 1000.0 * (b.ts - tstart) / freq
+			for i in Numeric.nonzero(Numeric.logical_and(
+				Numeric.logical_not(ev), Numeric.greater_equal(trial, 0))):
+				chn = 'sig%02d%c' % (b.channel[i], ord('a')+b.unit[i])
 				try:
-					self.trialdata[trialno][chn].append(ts)
+					self.trialdata[trial[i]][chn].append(int(ms[i]))
 				except KeyError:
-					self.trialdata[trialno][chn] = [ts]
+					self.trialdata[trial[i]][chn] = [int(ms[i])]
 				self.channellist[chn] = 1
+			trialno = int(trial[-1])
+			t0 = tstart[-1]
+		plx.close()
 		self.neurons = self.channellist.keys()
 		sys.stderr.write('\n')
 		sys.stderr.flush()
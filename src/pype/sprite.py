@@ -92,6 +92,32 @@ Fri Apr 17 10:45:46 2009 mazer
   - FrameBuffer.syncinfo is stashed to allow UserDisplay to automatically
     mark the sync spot location on the screen..
 
+Fri Oct 30 10:21:16 2026 mazer
+
+- Sprite coordinate axes (.ax, .ay, .xx, .yy) are no longer built for
+  every new sprite -- they're looked up on first use in the shared
+  grid cache (spritetools.GridCache).
+
+Sat Oct 31 16:02:48 2026 mazer
+
+- DisplayList(incremental=1): dirty rectangle updates -- only the
+  screen regions damaged since the last update(s) get cleared and
+  redrawn, with a full redraw fallback. New Sprite.touch() marks
+  in-place image changes; DisplayList.stats() has pixel counters.
+
+Sun Nov  1 14:36:20 2026 mazer
+
+- OpenGL mode: render() uploads the sprite into a texture once and
+  blit()/fastblit() draw a textured quad instead of glDrawPixels'ing
+  the whole image every frame. Sprite.texangle and Sprite.texscale
+  rotate/scale rendered sprites on the GL side. Texture memory is
+  managed by fb.textures (see pypegl.py).
+
+Mon Nov  2 11:28:05 2026 mazer
+
+- render() is now prerender() (image conversion, ok in a background
+  thread) + upload() (GL texture load, main thread only).
+
 """
 
 __author__   = '$Author$'
@@ -144,6 +170,7 @@ from rootperm import root_take, root_drop
 from guitools import Logger
 from stats import mean, stdev
 from spritetools import *
+import pypegl
 
 try:
 	# Shinji added 17-Jan-2006:
@@ -431,6 +458,12 @@ class FrameBuffer:
 			glOrtho(0.0, self.w, 0.0, self.h, 0.0, 1.0)
 			glEnable(GL_BLEND)
 			glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+			# new GL context; textures from an old one (hide/show)
+			# are gone and sprites have to re-upload
+			try:
+				self.textures.lost()
+			except AttributeError:
+				self.textures = pypegl.TextureManager()
 		else:
 			# set (0,0,0) to be transparent/colorkey
 			self.screen.set_colorkey((0,0,0,0))
@@ -1072,6 +1105,7 @@ class _SurfArrayAccess:
 		self.im  = im
 		self.getfn = get
 		self.setfn = set
+		self.serial = 0					# bumped on every write
 
 	def refresh(self, im):
 		"""
@@ -1085,6 +1119,7 @@ class _SurfArrayAccess:
 		return array[idx]
 
 	def __setitem__(self, idx, value):
+		self.serial = self.serial + 1
 		array = self.setfn(self.im)
 		if type(value) is arraytype:
 			array[idx] = value.astype(array.typecode())
@@ -1177,6 +1212,13 @@ class Sprite(_ImageBase):
 		self.fb = fb
 		self._on = on
 		self.icolor = icolor
+		self._serial = 0
+
+		# OpenGL only: rotation (deg CCW) and scale factor applied
+		# to rendered (texture) sprites at blit time
+		self.texangle = 0
+		self.texscale = 1.0
+		self._tex = None
 
 		# almost right: new sprites are good, but sprites
 		# sourced from files or images (other sprites) don't
@@ -1231,8 +1273,8 @@ class Sprite(_ImageBase):
 		self.ih = self.h
 		self.centerorigin = centerorigin
 
-		self.ax, self.ay = genaxes(self.w, self.h, inverty=0)
-		self.xx, self.yy = genaxes(self.w, self.h, inverty=1)
+		# coordinate axes (.ax, .ay, .xx, .yy) come from the shared
+		# grid cache on demand, see __getattr__
 
 		# make sure every sprite gets a name for debugging
 		# purposes..
@@ -1272,6 +1314,26 @@ class Sprite(_ImageBase):
 		self.render(clear=1)
 		Sprite.__list__.remove(self._id)
 
+	def __getattr__(self, name):
+		"""INTERNAL
+
+		Coordinate axes for the sprite's current size, looked up in
+		the shared grid cache (spritetools.cachedaxes) only when
+		needed: .ax, .ay are matrix coords (y increases going down),
+		.xx, .yy world coords. These are shared with other sprites
+		of the same size, so don't modify them in place.
+
+		"""
+		if name == 'ax':
+			return cachedaxes(self.w, self.h, inverty=0)[0]
+		elif name == 'ay':
+			return cachedaxes(self.w, self.h, inverty=0)[1]
+		elif name == 'xx':
+			return cachedaxes(self.w, self.h, inverty=1)[0]
+		elif name == 'yy':
+			return cachedaxes(self.w, self.h, inverty=1)[1]
+		raise AttributeError, name
+
 	def __repr__(self):
 		"""INTERNAL
 		Print method. Return printable string composed of
@@ -1314,6 +1376,7 @@ class Sprite(_ImageBase):
 
 		"""
 		(x, y) = self.XY((key[0], key[1]))
+		self.touch()
 		return self.im.set_at((x, y), value)
 
 	def asPhotoImage(self, alpha=None):
@@ -1340,6 +1403,19 @@ class Sprite(_ImageBase):
 		#       on the PhotoImage to prevent GC..
 		return self.pim
 
+	def touch(self):
+		"""Mark sprite image data as changed
+
+		DisplayLists in incremental mode only redraw sprites that
+		moved or changed. Sprite methods and writes to .array/.alpha
+		take care of this, but if you draw into .im directly (pygame
+		calls, surfarray.pixels3d() etc), call touch() afterwards.
+
+		**returns** - None
+
+		"""
+		self._serial = self._serial + 1
+
 	def set_alpha(self, a):
 		"""Set global alpha value
 
@@ -1376,6 +1452,7 @@ class Sprite(_ImageBase):
 		y1 = self.Y(y1)
 		y2 = self.Y(y2)
 		pygame.draw.line(self.im, color, (x1, y1), (x2, y2), width)
+		self.touch()
 
 	def clear(self, color=(1,1,1)):
 		"""Clear sprite to specified color
@@ -1390,6 +1467,7 @@ class Sprite(_ImageBase):
 		"""
 		color = _C(color)
 		self.im.fill(color)
+		self.touch()
 
 	def fill(self, color):
 		"""Fill sprite with specficied color
@@ -1403,6 +1481,7 @@ class Sprite(_ImageBase):
 		"""
 		color = _C(color)
 		self.im.fill(color)
+		self.touch()
 
 	def noise(self, thresh=0.5, color=None):
 		"""Fill sprite with noise
@@ -1462,6 +1541,7 @@ class Sprite(_ImageBase):
 			y = self.Y(y)
 
 		pygame.draw.circle(self.im, color, (x, y), r, width)
+		self.touch()
 
 	def circle(self, color, r=None, x=None, y=None):
 		"""Draw circlular mask into sprite
@@ -1507,6 +1587,7 @@ class Sprite(_ImageBase):
 		pygame.surfarray.blit_array(surf, mask)			#apply circle data
 		surf.set_colorkey(0, RLEACCEL)					#make transparent
 		self.im.blit(surf, (x - r, y - r))
+		self.touch()
 
 	def rect(self, x, y, w, h, color):
 		"""Draw a *filled* rectangle of the specifed color on a sprite.
@@ -1529,6 +1610,7 @@ class Sprite(_ImageBase):
 		x = self.X(x) - (w/2)
 		y = self.Y(y) - (h/2)
 		self.im.fill(color, (x, y, w, h))
+		self.touch()
 
 	def pix(self, x, y, val=None):
 		"""DO NOT USE
@@ -1565,6 +1647,7 @@ class Sprite(_ImageBase):
 			return self.im.get_at(x, y)
 		else:
 			self.im.set_at((x, y), val)
+			self.touch()
 			return val
 
 	def pix_rc(self, x, y, val=None):
@@ -1589,6 +1672,7 @@ class Sprite(_ImageBase):
 			return self.im.get_at(x, y)
 		else:
 			self.im.set_at((x, y), val)
+			self.touch()
 			return val
 
 	def axisflip(self, xaxis, yaxis):
@@ -1615,6 +1699,7 @@ class Sprite(_ImageBase):
 		self.h = self.im.get_height()
 		self.iw = self.w
 		self.ih = self.h
+		self.touch()
 
 	def rotateCCW(self, angle, preserve_size=1, trim=0):
 		self.rotate(-angle, preserve_size=preserve_size, trim=trim)
@@ -1666,6 +1751,7 @@ class Sprite(_ImageBase):
 		self.h = self.im.get_height()
 		self.iw = self.w
 		self.ih = self.h
+		self.touch()
 
 	def scale(self, new_width, new_height):
 		"""Resize this sprite (fast).
@@ -1700,9 +1786,7 @@ class Sprite(_ImageBase):
 		self.h = self.im.get_height()
 		self.iw = self.w
 		self.ih = self.h
-
-		self.ax, self.ay = genaxes(self.w, self.h, inverty=0)
-		self.xx, self.yy = genaxes(self.w, self.h, inverty=1)
+		self.touch()
 
 	def rotozoom(self, scale=1.0, angle=0.0):
 		"""Resize this sprite using rotozoom
@@ -1734,15 +1818,14 @@ class Sprite(_ImageBase):
 		self.h = self.im.get_height()
 		self.iw = self.w
 		self.ih = self.h
-
-		self.ax, self.ay = genaxes(self.w, self.h, inverty=0)
-		self.xx, self.yy = genaxes(self.w, self.h, inverty=1)
+		self.touch()
 
 	def circmask(self, x, y, r):
 		"""hard vignette in place - was image_circmask"""
 		mask = where(less(((((self.ax-x)**2)+((self.ay+y)**2)))**0.5, r), 1, 0)
 		a = pygame.surfarray.pixels2d(self.im)
 		a[::] = mask * a
+		self.touch()
 
 	def alpha_aperture(self, r, x=0, y=0):
 		"""Hard vignette
@@ -1813,6 +1896,7 @@ class Sprite(_ImageBase):
 			bgi = bg
 		i[::] = ((alpha * i.astype(Float)) +
 				((1.0-alpha) * bgi)).astype(UnsignedInt8)
+		self.touch()
 		self.alpha[::] = 255;
 
 	def dim(self, mult, meanval=128.0):
@@ -1836,6 +1920,7 @@ class Sprite(_ImageBase):
 		pixs = pygame.surfarray.pixels3d(self.im)
 		pixs[::] = (float(meanval) + ((1.0-mult) * \
 			   (pixs.astype(Float)-float(meanval)))).astype(UnsignedInt8)
+		self.touch()
 
 	def thresh(self, threshval):
 		"""Threshold sprite image data
@@ -1850,6 +1935,7 @@ class Sprite(_ImageBase):
 		"""
 		pixs = pygame.surfarray.pixels3d(self.im)
 		pixs[::] = where(less(pixs, threshval), 1, 255).astype(UnsignedInt8)
+		self.touch()
 
 	def on(self):
 		"""Turn sprite on
@@ -1957,16 +2043,11 @@ class Sprite(_ImageBase):
 		# blit and optional page flip..
 		if fb.opengl:
 			scy = fb.hh + y - (self.h / 2)
-			_pygl_setxy(scx, scy)
-			try:
-				# fastim precomputed by render()?
-				glDrawPixels(self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE,
-							 self._fastim)
-			except AttributeError:
-				# nope, go ahead and render then blit..
-				blitstr = pygame.image.tostring(self.im, 'RGBA', 1)
-				glDrawPixels(self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE,
-							 blitstr)
+			if self._gltex(fb):
+				fb.textures.draw(self._tex, scx, scy,
+								 self.texangle, self.texscale)
+			else:
+				self._gldrawpixels(scx, scy)
 		else:
 			fb.screen.blit(self.im, (scx, scy))
 
@@ -1980,6 +2061,39 @@ class Sprite(_ImageBase):
 		self.y = self.y + self.dy
 		return 1
 
+	def _gltex(self, fb):
+		"""INTERNAL
+
+		Make sure the texture made by render() is still loaded
+		(re-upload if it's been evicted). Returns false for sprites
+		that don't have a texture and have to use glDrawPixels.
+
+		"""
+		tex = self._tex
+		if tex is None:
+			return 0
+		if tex.id is None:
+			self._tex = fb.textures.upload(self._fastim, self.w, self.h, tex)
+		return self._tex is not None
+
+	def _gldrawpixels(self, scx, scy):
+		"""INTERNAL
+
+		Old style OpenGL blit (sprite not rendered or too big for a
+		texture).
+
+		"""
+		_pygl_setxy(scx, scy)
+		try:
+			# fastim precomputed by render()?
+			glDrawPixels(self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE,
+						 self._fastim)
+		except AttributeError:
+			# nope, go ahead and render then blit..
+			blitstr = pygame.image.tostring(self.im, 'RGBA', 1)
+			glDrawPixels(self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE,
+						 blitstr)
+
 	def fastblit(self):
 		"""Accelerated blit.
 
@@ -1993,6 +2107,9 @@ class Sprite(_ImageBase):
 		fastblit() method does **NOT** support alpha channel in the
 		SDL mode. (OpenGL mode support alpha).
 
+		In OpenGL mode this draws the texture made by render()
+		(with texangle/texscale applied), same as blit().
+
 		"""
 		if not self._on:
 			return
@@ -2002,9 +2119,13 @@ class Sprite(_ImageBase):
 			# 12-jan-2006 shinji
 			x = self.fb.hw + self.x - (self.w / 2)
 			y = self.fb.hh + self.y - (self.h / 2)
-			_pygl_setxy(x, y)
-			glDrawPixels(self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE,
-						 self._fastim)
+			if self._gltex(self.fb):
+				self.fb.textures.draw(self._tex, x, y,
+									  self.texangle, self.texscale)
+			else:
+				_pygl_setxy(x, y)
+				glDrawPixels(self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE,
+							 self._fastim)
 		else:
 			x = self.fb.hw + self.x - (self.w / 2)
 			y = self.fb.hh - self.y - (self.h / 2)
@@ -2021,20 +2142,54 @@ class Sprite(_ImageBase):
 		This may cause the bitmap to move to video memory, which is
 		going to be limited!!
 
+		In OpenGL mode the image is loaded into a texture (see
+		pypegl.py) that's reused by every blit until the next
+		render(); render(clear=1) gives the texture back.
+
 		"""
 		if clear:
 			try:
 				del self._fastim
 			except AttributeError:
 				pass
+			if self._tex is not None:
+				try:
+					self.fb.textures.release(self._tex)
+				except:
+					# display's already gone
+					pass
+				self._tex = None
 			return
 
+		self.prerender()
+		self.upload()
+
+		#added opengl convert 12-jan-2006 shinji
+
+	def prerender(self):
+		"""First half of render(): convert the image data.
+
+		In OpenGL mode this makes the RGBA string that upload() loads
+		into the texture; otherwise it's all of render(). Doesn't
+		make any GL calls, so it's ok to call from a background thread
+		(ie, for prefetching, see movie.MovieStream).
+
+		"""
 		if self.fb.opengl:
 			self._fastim = pygame.image.tostring(self.im,'RGBA', 1)
 		else:
 			self._fastim = self.im.convert()
 
-		#added opengl convert 12-jan-2006 shinji
+	def upload(self):
+		"""Second half of render(): load prerender()'d data into a texture.
+
+		OpenGL mode only (no-op otherwise); has to be called from the
+		thread that owns the GL context.
+
+		"""
+		if self.fb.opengl:
+			self._tex = self.fb.textures.upload(self._fastim,
+												self.w, self.h, self._tex)
 
 	def subimage(self, x, y, w, h, center=None):
 		"""Extract sub-region of sprite into new sprite
@@ -2095,16 +2250,22 @@ class Sprite(_ImageBase):
 		s.depth = self.depth
 		s.fb = self.fb
 		s._on = self._on
-
-		try:
-			s._fastim = self._fastim
-		except AttributeError:
-			# not accelerated..
-			pass
+		s.texangle = self.texangle
+		s.texscale = self.texscale
 
 		# copy the alpha mask too..
 		s.alpha[::] = self.alpha[::]
 
+		if self._tex is not None:
+			# clones get their own texture
+			s.render()
+		else:
+			try:
+				s._fastim = self._fastim
+			except AttributeError:
+				# not accelerated..
+				pass
+
 		s.userdict = copy.copy(self.userdict)
 
 		return s
@@ -2387,9 +2548,26 @@ class DisplayList:
 	Sprites are only drawn when they are *on* (see on() and off()
 	methods for Sprites).
 
+	**Incremental updates:**
+	With incremental=1, update() keeps track of where each sprite was
+	drawn and only repaints the damaged parts of the screen: the
+	previous and current rectangles of sprites that moved, changed
+	(see Sprite.touch()), turned on/off or were added/deleted. Damaged
+	rectangles are cleared to the background and the sprites that
+	overlap them are re-blitted, clipped to the damage. Since the
+	framebuffer is double buffered, the damage from the last
+	*nbuffers* frames gets repainted. Falls back to a full redraw when
+	the damage covers more than *maxdamage* of the screen, in OpenGL
+	mode, and when the list contains anything other than Sprites on
+	this list's framebuffer. If you draw on the framebuffer yourself
+	between updates, call invalidate().
+
+	stats() reports how many pixels were touched (cleared or blitted)
+	per frame.
+
 	"""
 
-	def __init__(self, fb, bg=None):
+	def __init__(self, fb, bg=None, incremental=0):
 		"""Instantiation method
 
 		**fb** - framebuffer associated with this list. This is sort of
@@ -2399,11 +2577,26 @@ class DisplayList:
 
 		**bg** - optional background color
 
+		**incremental** - boolean; only redraw damaged regions (see
+		above)
+
 		"""
 
 		self.sprites = []
 		self.fb = fb
 		self.bg = bg
+		self.incremental = incremental
+		self.nbuffers = 2				# frames of damage to repaint
+		self.maxdamage = 0.5			# max fraction before full redraw
+
+		self._drawn = None				# id(sprite) -> (sprite, rect, sig)
+		self._damage = []				# damage rects for recent frames
+
+		# counters (see stats())
+		self.frames = 0
+		self.fullframes = 0
+		self.pixels = 0
+		self.totalpixels = 0
 
 	def __del__(self):
 		"""INTERNAL
@@ -2464,6 +2657,10 @@ class DisplayList:
 		"""
 		self.delete(None)
 
+	def invalidate(self):
+		"""Force full redraw on the next (incremental) update."""
+		self._drawn = None
+
 	def update(self, flip=None, preclear=1):
 		"""Draw sprites on framebuffer
 
@@ -2473,21 +2670,150 @@ class DisplayList:
 
 		- Optionally do a page flip.
 
+		In incremental mode (and with preclear set) only the damaged
+		parts of the screen are cleared and redrawn.
+
+		"""
+		if self.incremental and preclear and self._canincr():
+			self._update_damaged()
+		else:
+			self._update_full(preclear)
+
+		# possibly flip screen..
+		if flip:
+			self.fb.flip()
+
+	def stats(self):
+		"""Update counters: dict with keys
+
+		  - frames: number of updates
+
+		  - fullframes: number of full (not incremental) redraws
+
+		  - pixels: pixels touched (cleared + blitted) by the last update
+
+		  - meanpixels: average pixels touched per update
+
+		  - screen: pixels on the screen (for comparison)
+
 		"""
+		return {
+			'frames': self.frames,
+			'fullframes': self.fullframes,
+			'pixels': self.pixels,
+			'meanpixels': float(self.totalpixels) / max(1, self.frames),
+			'screen': self.fb.w * self.fb.h,
+			}
+
+	def _count(self, pixels, full):
+		self.frames = self.frames + 1
+		self.fullframes = self.fullframes + full
+		self.pixels = pixels
+		self.totalpixels = self.totalpixels + pixels
+
+	def _canincr(self):
+		if self.fb.opengl:
+			return 0
+		for s in self.sprites:
+			if not isinstance(s, Sprite) or not s.fb is self.fb:
+				return 0
+		return 1
+
+	def _state(self, s):
+		# (screen rect, image signature) for sprite, same coords as blit()
+		if s._on:
+			rect = (int(self.fb.hw + s.x - (s.w / 2)),
+					int(self.fb.hh - s.y - (s.h / 2)), s.w, s.h)
+		else:
+			rect = None
+		return (rect, (s._serial, s.array.serial, s.alpha.serial))
+
+	def _update_full(self, preclear, damaged=None):
+		# damaged is set if _update_damaged() gave up (so the damage
+		# history is still good), otherwise assume everything changed
+		screen = (0, 0, self.fb.w, self.fb.h)
+
 		# clear screen to background..
 		if preclear:
 			if self.bg:
 				self.fb.clear(color=self.bg)
 			else:
 				self.fb.clear()
+			pixels = self.fb.w * self.fb.h
+		else:
+			pixels = 0
 
 		# draw sprites in depth order
+		drawn = {}
 		for s in self.sprites:
+			if isinstance(s, Sprite):
+				(rect, sig) = self._state(s)
+				drawn[id(s)] = (s, rect, sig)
+				if rect and s.fb is not None:
+					pixels = pixels + _rectarea(_rectclip(rect, screen))
 			s.blit()
 
-		# possibly flip screen..
-		if flip:
-			self.fb.flip()
+		if self.incremental:
+			self._drawn = drawn
+			if not damaged:
+				self._damage = [[screen]]
+		self._count(pixels, 1)
+
+	def _update_damaged(self):
+		fb = self.fb
+		screen = (0, 0, fb.w, fb.h)
+		if self._drawn is None:
+			self._update_full(1)
+			return
+
+		# what changed since the last update?
+		drawn = {}
+		damage = []
+		for s in self.sprites:
+			(rect, sig) = self._state(s)
+			drawn[id(s)] = (s, rect, sig)
+			try:
+				(olds, oldrect, oldsig) = self._drawn[id(s)]
+			except KeyError:
+				(oldrect, oldsig) = (None, None)
+			if oldrect != rect or (rect and oldsig != sig):
+				damage.extend([r for r in (oldrect, rect) if r])
+		for (k, (s, rect, sig)) in self._drawn.items():
+			if rect and not drawn.has_key(k):
+				damage.append(rect)
+
+		damage = [r for r in [_rectclip(r, screen) for r in damage] if r]
+		self._damage = (self._damage + [damage])[-self.nbuffers:]
+		repaint = _rectreduce(reduce(lambda a, b: a+b, self._damage, []))
+		area = reduce(lambda a, b: a+b, map(_rectarea, repaint), 0)
+		if area > (self.maxdamage * fb.w * fb.h):
+			self._update_full(1, damaged=1)
+			return
+
+		if self.bg:
+			bg = _C(self.bg)
+		else:
+			bg = _C(fb.bg)
+		pixels = area
+		sprites = [drawn[id(s)] for s in self.sprites]
+		for r in repaint:
+			fb.screen.fill(bg, r)
+			for (s, rect, sig) in sprites:
+				c = rect and _rectclip(rect, r)
+				if c:
+					# blit just the damaged part of the sprite
+					fb.screen.blit(s.im, c[:2],
+								   (c[0]-rect[0], c[1]-rect[1], c[2], c[3]))
+					pixels = pixels + _rectarea(c)
+
+		# sprites that are on keep moving, just like blit()
+		for (s, rect, sig) in sprites:
+			if rect:
+				s.x = s.x + s.dx
+				s.y = s.y + s.dy
+
+		self._drawn = drawn
+		self._count(pixels, 0)
 
 	def _print(self):
 		"""INTERNAL - for debugging only"""
@@ -2498,6 +2824,33 @@ def _is_seq(x):
 	"""INTERNAL"""
 	return (type(x) is types.ListType) or (type(x) is types.TupleType)
 
+def _rectclip(a, b):
+	"""INTERNAL - intersection of two (x, y, w, h) rects (None if empty)"""
+	x1 = max(a[0], b[0])
+	y1 = max(a[1], b[1])
+	x2 = min(a[0]+a[2], b[0]+b[2])
+	y2 = min(a[1]+a[3], b[1]+b[3])
+	if x2 <= x1 or y2 <= y1:
+		return None
+	return (x1, y1, x2-x1, y2-y1)
+
+def _rectarea(r):
+	"""INTERNAL"""
+	if r is None:
+		return 0
+	return r[2] * r[3]
+
+def _rectreduce(rects):
+	"""INTERNAL - drop duplicate rects and rects inside other rects"""
+	keep = []
+	for r in rects:
+		for k in keep:
+			if _rectclip(r, k) == r:
+				break
+		else:
+			keep = [k for k in keep if _rectclip(k, r) != k] + [r]
+	return keep
+
 def barsprite(w, h, angle, color, **kw):
 	"""Make a bar
 
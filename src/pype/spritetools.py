@@ -64,6 +64,13 @@ Fri May 22 15:27:42 2009 mazer
 
 - added simple_rdp() function for Random Dot Patterns
 
+Fri Oct 30 10:21:16 2026 mazer
+
+- added GridCache: sprite axes and the full size radius/theta maps
+  the grating and envelope generators use are computed once per
+  sprite size and shared (see cachedaxes() and cachedgrid()), instead
+  of being rebuilt for every sprite and every generator call.
+
 """
 
 __author__   = '$Author$'
@@ -71,7 +78,7 @@ __date__     = '$Date$'
 __revision__ = '$Revision$'
 __id__       = '$Id$'
 
-import math, sys
+import math, sys, types, threading
 from Numeric import *
 import pygame.surfarray
 from pygame.constants import *
@@ -161,6 +168,141 @@ def genaxes(w, h=None, typecode=Float64, inverty=0):
 		y = arange(0, h) - ((h - 1) / 2.0)
 	return x.astype(typecode)[:,NewAxis],y.astype(typecode)[NewAxis,:]
 
+# named full size grids GridCache knows how to build from the axes
+# (x, y); the n* versions are normalized by sprite width/height
+_GRIDS = {
+	'r':		lambda x, y, w, h: ((x**2)+(y**2))**0.5,
+	'theta':	lambda x, y, w, h: arctan2(y, x),
+	'nr':		lambda x, y, w, h: (((x / w)**2) + ((y / h)**2))**0.5,
+	'nhypot':	lambda x, y, w, h: hypot(x / w, y / h),
+	'ntheta':	lambda x, y, w, h: arctan2(y / h, x / w),
+	'-ntheta':	lambda x, y, w, h: arctan2(y / h, -x / w),
+	}
+
+class GridCache:
+	"""Shared coordinate grids, keyed by sprite size.
+
+	Entries are keyed by (w, h, inverty, typecode) and hold the
+	genaxes() vectors plus any of the full size grids in _GRIDS that
+	have been asked for -- everything is computed on first access.
+	Least recently used sizes get evicted once the grids add up to
+	more than maxbytes.
+
+	**NOTE:**
+	Everything this hands out is shared by all sprites of the same
+	size -- don't modify the arrays in place!
+
+	Thread safe (sprites get built by background loaders, ie,
+	movie.MovieStream); grids are computed with the lock held, so
+	two threads asking for the same grid only compute it once.
+
+	"""
+	def __init__(self, maxbytes=64<<20):
+		self.maxbytes = maxbytes
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self._entries = {}
+		self._lru = []
+		self._lock = threading.RLock()
+
+	def _size(self, v, typecode):
+		if type(v) is types.TupleType:
+			return self._size(v[0], typecode) + self._size(v[1], typecode)
+		return len(ravel(v)) * len(zeros(1, typecode).tostring())
+
+	def get(self, name, w, h, inverty, typecode):
+		self._lock.acquire()
+		try:
+			return self._get(name, w, h, inverty, typecode)
+		finally:
+			self._lock.release()
+
+	def _get(self, name, w, h, inverty, typecode):
+		key = (w, h, inverty, typecode)
+		try:
+			e = self._entries[key]
+			self._lru.remove(key)
+		except KeyError:
+			e = self._entries[key] = {}
+		self._lru.append(key)
+		try:
+			v = e[name]
+			self.hits = self.hits + 1
+			return v
+		except KeyError:
+			self.misses = self.misses + 1
+		if name == 'axes':
+			v = genaxes(w, h, typecode=typecode, inverty=inverty)
+		else:
+			(x, y) = self._get('axes', w, h, inverty, typecode)
+			v = _GRIDS[name](x, y, w, h).astype(typecode)
+		e[name] = v
+		self.nbytes = self.nbytes + self._size(v, typecode)
+		self._evict(key)
+		return v
+
+	def _evict(self, keep):
+		while self.nbytes > self.maxbytes and self._lru[0] != keep:
+			key = self._lru.pop(0)
+			for v in self._entries[key].values():
+				self.nbytes = self.nbytes - self._size(v, key[3])
+			del self._entries[key]
+
+	def setmax(self, maxbytes):
+		"""Change the size limit (evicts right away if needed)."""
+		self._lock.acquire()
+		try:
+			self.maxbytes = maxbytes
+			self._evict(None)
+		finally:
+			self._lock.release()
+
+	def clear(self):
+		self._lock.acquire()
+		try:
+			self._entries = {}
+			self._lru = []
+			self.nbytes = 0
+		finally:
+			self._lock.release()
+
+_gridcache = GridCache()
+
+def cachedaxes(w, h=None, typecode=Float64, inverty=0):
+	"""Shared (cached) version of genaxes() - same args.
+
+	The returned vectors are shared with every other sprite of the
+	same size, don't modify them in place!
+
+	"""
+	if h is None:
+		(w, h) = w
+	return _gridcache.get('axes', w, h, inverty, typecode)
+
+def cachedgrid(name, w, h, typecode=Float64, inverty=1):
+	"""Shared (cached) full size coordinate grid.
+
+	**name** - 'r' (radius), 'theta' (arctan2(y,x)), 'nr' (radius
+	with x and y normalized by w and h), 'nhypot' (same, but using
+	hypot()), 'ntheta' (theta of normalized coords) or '-ntheta' (same
+	with x flipped)
+
+	**w, h** - sprite size
+
+	**typecode, inverty** - see genaxes(); note inverty defaults to
+	world coords here (same as sprite .xx, .yy)
+
+	**returns** - (w, h) array; shared, don't modify in place!
+
+	"""
+	return _gridcache.get(name, w, h, inverty, typecode)
+
+def gridcache(maxbytes=None):
+	"""Get the GridCache, optionally setting its size limit (bytes)."""
+	if maxbytes is not None:
+		_gridcache.setmax(maxbytes)
+	return _gridcache
 
 def genrad(w, h=None, typecode=Float64):
 	"""Replaces old gend() function.
@@ -173,7 +315,7 @@ def genrad(w, h=None, typecode=Float64):
 
 	"""
 
-	x, y = genaxes(w, h)
+	x, y = cachedaxes(w, h)
 	return (((x**2)+(y**2))**0.5).astype(typecode)
 
 def gend(w, h=None, typecode=Float64):
@@ -199,7 +341,7 @@ def gentheta(w, h=None, typecode=Float64, degrees=None):
 	useful!
 
 	"""
-	x, y = genaxes(w, h)
+	x, y = cachedaxes(w, h)
 	t = arctan2(y, x)
 	if degrees:
 		t = 180.0 * t / pi
@@ -250,8 +392,8 @@ def singrat(s, frequency, phase_deg, ori_deg, R=1.0, G=1.0, B=1.0,
 		R, G, B = color
 	else:
 		R, G, B = _unpack_rgb(R, G, B)
-	r = (((s.xx / s.w)**2) + ((s.yy / s.h)**2))**0.5
-	t = arctan2(s.yy, s.xx) - (pi * ori_deg) / 180.
+	r = cachedgrid('nr', s.w, s.h)
+	t = cachedgrid('theta', s.w, s.h) - (pi * ori_deg) / 180.
 	x, y = (r * cos(t), r * sin(t))
 
 	i = moddepth * sin((2.0 * pi * frequency * x) - (pi * phase_deg / 180.0))
@@ -301,8 +443,8 @@ def cosgrat(s, frequency, phase_deg, ori_deg, R=1.0, G=1.0, B=1.0,
 		R, G, B = color
 	else:
 		R, G, B = _unpack_rgb(R, G, B)
-	r = (((s.xx / s.w)**2) + ((s.yy / s.h)**2))**0.5
-	t = arctan2(s.yy, s.xx) - (pi * ori_deg) / 180.0
+	r = cachedgrid('nr', s.w, s.h)
+	t = cachedgrid('theta', s.w, s.h) - (pi * ori_deg) / 180.0
 	x, y = (r * cos(t), r * sin(t))
 
 	i = moddepth * cos((2.0 * pi * frequency * x) - (pi * phase_deg / 180.0))
@@ -360,12 +502,16 @@ def polargrat(s, cfreq, rfreq, phase_deg, polarity,
 		polarity = -1.0
 	else:
 		polarity = 1.0
-	x, y = (polarity * s.xx/s.w, s.yy/s.h)
+	r = cachedgrid('nhypot', s.w, s.h)
+	if polarity < 0:
+		t = cachedgrid('-ntheta', s.w, s.h)
+	else:
+		t = cachedgrid('ntheta', s.w, s.h)
 
 	if logpolar:
-		z = (log(hypot(x,y)) * cfreq) + (arctan2(y,x) * rfreq / (2.0 * pi))
+		z = (log(r) * cfreq) + (t * rfreq / (2.0 * pi))
 	else:
-		z = (hypot(x,y) * cfreq) + (arctan2(y,x) * rfreq / (2.0 * pi))
+		z = (r * cfreq) + (t * rfreq / (2.0 * pi))
 	i = moddepth * cos((2.0 * pi * z) - (pi * phase_deg / 180.0))
 	s.array[::] = transpose((array((R*i,G*i,B*i))+meanlum).astype(UnsignedInt8),
 						   axes=[1,2,0])
@@ -459,8 +605,8 @@ def hypergrat(s, freq, phase_deg, ori_deg,
 		R, G, B = color
 	else:
 		R, G, B = _unpack_rgb(R, G, B)
-	r = (((s.xx / s.w)**2) + ((s.yy / s.h)**2))**0.5
-	t = arctan2(s.yy, s.xx) - (pi * ori_deg) / 180.0
+	r = cachedgrid('nr', s.w, s.h)
+	t = cachedgrid('theta', s.w, s.h) - (pi * ori_deg) / 180.0
 	x, y = (r * cos(t), r * sin(t))
 
 	z = sqrt(fabs((x * freq) ** 2 - (y * freq) ** 2))
@@ -513,8 +659,8 @@ def alphabar(s, bw, bh, ori_deg, R=1.0, G=1.0, B=1.0):
 
 	"""
 	R, G, B = (array(_unpack_rgb(R, G, B)) * 255.0).astype(Int)
-	r = sprite.genrad(s.w, s.h)
-	t = sprite.gentheta(s.w, s.h) + (pi * ori_deg / 180.0)
+	r = cachedgrid('r', s.w, s.h, inverty=0)
+	t = cachedgrid('theta', s.w, s.h, inverty=0) + (pi * ori_deg / 180.0)
 	x = r * cos(t)
 	y = r * sin(t)
 	s.fill((R,G,B))
@@ -533,7 +679,7 @@ def alphaGaussian(s, sigma):
 	depends on sigma
 
 	"""
-	r = ((s.xx**2) + (s.yy**2))**0.5
+	r = cachedgrid('r', s.w, s.h)
 	i = 255.0 * exp(-((r) ** 2) / (2 * sigma**2))
 	s.alpha[::] = i[::].astype(UnsignedInt8)
 
@@ -552,16 +698,15 @@ def alphaGaussian2(s, xsigma, ysigma, ori_deg):
 	depends on sigma
 
 	"""
-	r = ((s.xx**2) + (s.yy**2))**0.5
-	t = arctan2(s.yy, s.xx) - (pi * ori_deg) / 180.0
+	r = cachedgrid('r', s.w, s.h)
+	t = cachedgrid('theta', s.w, s.h) - (pi * ori_deg) / 180.0
 	x, y = (r * cos(t), r * sin(t))
 	i = 255.0 * exp(-(x**2) / (2*xsigma**2)) * exp(-(y**2) / (2*ysigma**2))
 	s.alpha[::] = i[::].astype(UnsignedInt8)
 
 def gaussianEnvelope(s, sigma):
 	w, h = s.im.get_size()
-	x, y = sprite.genaxes(w, h, Float)
-	r = ((x**2)+(y**2))**0.5
+	r = cachedgrid('r', w, h, Float, inverty=0)
 	g = exp(-((r) ** 2) / (2 * sigma**2)) / sqrt(2 * pi * sigma**2);
 
 	# note: sum(z(:)) = 1.0
@@ -570,9 +715,10 @@ def gaussianEnvelope(s, sigma):
 	gmax = max(reshape(g, [multiply.reduce(g.shape), 1]))
 	g = array(255.0 * g / gmax).astype('b')
 	pygame.surfarray.pixels_alpha(s.im)[::] = g
+	s.touch()
 
 def image_circmask(im, x, y, r, apply):
-	(ax, ay) = sprite.genaxes(im.get_width(), im.get_height())
+	(ax, ay) = cachedaxes(im.get_width(), im.get_height())
 	mask = where(less(((((ax-x)**2)+((ay-y)**2)))**0.5, r), 1, 0)
 	if apply:
 		a = pygame.surfarray.pixels2d(im)
@@ -6,6 +6,28 @@
 Module lets you Retrieve spike timestamps from tdt datatank using
 the ttank.py network API.
 
+Mon Oct 26 11:05:37 2026 mazer
+
+- Spikes.query() sorts spikes into trials by binary search on the
+  trial boundaries instead of masking every spike for every trial;
+  getwaves=1 also partitions the snippet waveforms by trial
+  (Spikes.wdata). 'tdtspikes.py bench' times it on a synthetic
+  1e6 spike tank against the old code (see benchmark()).
+
+Sun Oct 25 20:12:44 2026 mazer
+
+- added a local on-disk cache of Spikes.query() results (see
+  pull()). Cache files live in $TTANKCACHE (default
+  ~/.pyperc/ttcache; TTANKCACHE=0 disables caching), one per
+  (server, tank, block, chan, unit), in a compact binary format.
+  Entries are tagged with the tank block's modification time if the
+  tank directory is visible from this machine ($TTANKLOCAL is the
+  local mount point of the tank directory), otherwise with the pype
+  datafile's (the block can only grow while the datafile's being
+  written). Once cached, loading is completely offline.
+
+- fixed os.envrion typo in TTANKDIR/TTANKSERVER handling
+
 """
 
 __author__   = '$Author$'
@@ -15,8 +37,8 @@ __id__       = '$Id$'
 
 import sys
 import Numeric
-import pypedata, ttank
-import time, os, string
+import pypedata, ttank, pypespikes
+import time, os, string, struct, glob, hashlib
 
 from pypedebug import keyboard
 
@@ -27,7 +49,7 @@ class TDTBaseClass:
     """
         
     def __init__(self, rec=None, pypefile=None,
-                 server=None, tank=None, block=None):
+                 server=None, tank=None, block=None, connect=1):
 
         # NOTE: Just look at the first pype record (or the
         # user-specified 'rec') to get the necessary tank info. The
@@ -51,10 +73,15 @@ class TDTBaseClass:
         # in the datafile:
         if os.environ.has_key('TTANKDIR'):
             # this one should probably have a trailing '\', e.g. 'T:\'
-            self.tank = os.envrion['TTANKDIR'] + \
+            self.tank = os.environ['TTANKDIR'] + \
                         string.split(self.tank, '\\')[-1]
         if os.environ.has_key('TTANKSERVER'):
-            self.server = os.envrion['TTANKSERVER']
+            self.server = os.environ['TTANKSERVER']
+
+        if not connect:
+            # offline (ie, loaded from cache)
+            self.tt = None
+            return
 
         self.tt = ttank.TTank(self.server)
         if self.tt.invoke('OpenTank', self.tank, 'R'):
@@ -81,24 +108,45 @@ class TDTBaseClass:
         self.trl1 = trl1
         self.trl2 = trl2
 
+def _partition(tall, trl1, trl2):
+    """Find each trial's spikes in a sorted timestamp vector.
+
+    Returns (lo, hi) arrays: trial k's spikes are tall[lo[k]:hi[k]],
+    ie trl1[k] <= t <= trl2[k]. Two binary searches per trial instead
+    of a full pass over all the spikes.
+
+    """
+    lo = Numeric.searchsorted(tall, trl1)
+    # searchsorted() finds the first t >= x; the inclusive upper bound
+    # needs the first t > x, which is the same search on the reversed,
+    # negated vector
+    hi = len(tall) - Numeric.searchsorted(-tall[::-1],
+                                          -Numeric.array(trl2, Numeric.Float))
+    return lo, Numeric.maximum(hi, lo)
+
+def _waveforms(w, n):
+    # ParseEvV gives (npts x nevents); want one row per event
+    w = Numeric.array(w, Numeric.Float32)
+    if len(w.shape) == 2 and w.shape[0] != n and w.shape[1] == n:
+        w = Numeric.transpose(w)
+    return w
+
 class Spikes(TDTBaseClass):
     # get all spikes at once, then sort into trials locally..
     # this is much faster -- seems about 1-2 secs to get all the
     # spikes, even for big datasets. Danger is if there's more than
     # 1e6 spikes...
+    #
+    # Mon Oct 26 11:05:37 2026 mazer
+    #   trials are partitioned by binary search on the sorted spike
+    #   times (see _partition) instead of a full mask per trial.
+    #   getwaves=1 also gets the snippet waveforms for the same
+    #   spikes, partitioned the same way (self.wdata[k] is trial k's
+    #   waveforms, one row per spike). See benchmark().
     
     def query(self, chan=0, unit=0, getwaves=None):
         tt = self.tt
         
-        if getwaves:
-            # pull down the analog snipet waveform data: still needs
-            # to be massaged to adjust timestmps..
-            nsnip = tt.invoke('ReadEventsV', 1e6, 'Snip', 0, 0, 0.0, 0.0, 'ALL')
-            self.waves = tt.invoke('ParseEvV', 0, nsnip)
-            self.channel = tt.invoke('ParseEvInfoV', 0, nsnip, ttank.CHANNUM)
-            self.sortnum = tt.invoke('ParseEvInfoV', 0, nsnip, ttank.SORTNUM)
-            self.ts = tt.invoke('ParseEvInfoV', 0, nsnip, ttank.TIME)
-
         start, stop = self.trl1[0], self.trl2[-1]
         # get number of spike/snip's between start and stop
         #   chan=0 for any channel
@@ -107,33 +155,53 @@ class Spikes(TDTBaseClass):
                       chan, unit, start, stop, 'ALL')
 
         # get timestamps, channel (electrode), sortnum (unit) for spikes
-        tall = Numeric.array(tt.invoke('ParseEvInfoV', 0, n,  ttank.TIME))
+        tall = Numeric.array(tt.invoke('ParseEvInfoV', 0, n,  ttank.TIME),
+                             Numeric.Float)
         call = Numeric.array(tt.invoke('ParseEvInfoV', 0, n,  ttank.CHANNUM))
         sall = Numeric.array(tt.invoke('ParseEvInfoV', 0, n,  ttank.SORTNUM))
-        
+        if getwaves:
+            # analog snippet for each of the same n events
+            waves = _waveforms(tt.invoke('ParseEvV', 0, n), n)
+
+        # tank should hand them back in time order, but make sure
+        if len(tall) > 1 and Numeric.sometrue(Numeric.less(tall[1:],
+                                                           tall[:-1])):
+            order = Numeric.argsort(tall)
+            tall = Numeric.take(tall, order)
+            call = Numeric.take(call, order)
+            sall = Numeric.take(sall, order)
+            if getwaves:
+                waves = Numeric.take(waves, order)
+
+        # packed (channel, unit) codes -- see pypespikes.unitname()
+        codes = pypespikes.unitcode(Numeric.around(call), Numeric.around(sall))
+
+        (lo, hi) = _partition(tall, self.trl1, self.trl2)
         self.sdata = []
+        self.wdata = []
         for k in range(len(self.trl1)):
-            mask = Numeric.logical_and(Numeric.greater_equal(tall,
-                                                             self.trl1[k]),
-                                       Numeric.less_equal(tall,
-                                                          self.trl2[k]))
-            t = (Numeric.compress(mask, tall) - self.trl1[k]) * 1000.0
-            c = Numeric.compress(mask, call)
-            s = Numeric.compress(mask, sall)
-            sigs = []
-            for j in range(len(s)):
-                sigs.append('%03d%c' % (c[j], chr(int(s[j])+ord('a')-1),))
-            self.sdata.append((t, c, s, sigs,))
+            (a, b) = (lo[k], hi[k])
+            t = (tall[a:b] - self.trl1[k]) * 1000.0
+            self.sdata.append((t, call[a:b], sall[a:b], codes[a:b],))
+            if getwaves:
+                self.wdata.append(waves[a:b])
+
+        if getwaves:
+            # everything, in the same order as the spikes
+            self.waves = waves
+            self.channel = call
+            self.sortnum = sall
+            self.ts = tall
             
         self.ntrials = len(self.trl1)
 
     def dump(self, out):
         #out.write('#tnum time chan unit\n')
         for k in range(self.ntrials):
-            (t, c, s, sigs) = self.sdata[k]
+            (t, c, s, codes) = self.sdata[k]
             for j in range(len(t)):
                 out.write('%d\t%.1f\t%.0f\t%.0f\n' % (k, t[j], c[j], s[j],))
-                #out.write('%d\t%.1f\t%s\n' % (k, t[j], int(c[j]), sigs[j].))
+                #out.write('%d\t%.1f\t%s\n' % (k, t[j], pypespikes.unitname(codes[j])))
 
     def info(self, out):
         out.write('server=%s\n' % self.server)
@@ -142,14 +210,188 @@ class Spikes(TDTBaseClass):
         out.write('channels with spikes:\n')
         units = {}
         for k in range(self.ntrials):
-            (t, c, s, sigs) = self.sdata[k]
-            for j in range(len(t)):
-                if s[j]:
-                    units[sigs[j]] = 1
+            (t, c, s, codes) = self.sdata[k]
+            for code in Numeric.compress(s, codes):
+                units[int(code)] = 1
         k = units.keys()
         k.sort()
-        for sig in k:
-            out.write(' %s\n' % sig)
+        for code in k:
+            out.write(' %s\n' % pypespikes.unitname(code))
+
+_CACHEMAGIC = 'PTTC'
+_CACHEVERSION = 1
+_CACHEHDR = '<4siiid'            # magic, version, ntrials, nspikes, stamp
+
+def cachedir():
+    """Directory for cached tank pulls (None if caching is disabled)."""
+    d = os.environ.get('TTANKCACHE', pypedata.pyperc('ttcache'))
+    if d in ('', '0'):
+        return None
+    return d
+
+def tankstamp(tank, block, datafile=None):
+    """Modification time for a tank block (None if unknown).
+
+    Uses the block directory if the tank's visible under $TTANKLOCAL,
+    otherwise the pype datafile's mtime.
+
+    """
+    if os.environ.has_key('TTANKLOCAL'):
+        local = os.path.join(os.environ['TTANKLOCAL'],
+                             string.split(tank, '\\')[-1])
+        files = glob.glob(os.path.join(local, block, '*'))
+        if len(files) == 0:
+            files = glob.glob(os.path.join(local, '*'))
+        if len(files):
+            return max([os.path.getmtime(f) for f in files])
+    if datafile and os.path.exists(datafile):
+        return os.path.getmtime(datafile)
+    return None
+
+def _tostring(v, tc):
+    # astype() rather than array(v, tc): Numeric won't do unsafe
+    # (ie, float -> int) casts in array(); round first if needed
+    v = Numeric.asarray(v).astype(tc)
+    if not Numeric.LittleEndian:
+        v = v.byteswapped()
+    return v.tostring()
+
+def _fromstring(s, tc):
+    v = Numeric.fromstring(s, tc)
+    if not Numeric.LittleEndian:
+        v = v.byteswapped()
+    return v
+
+class SpikeCache:
+    """Cached Spikes.query() results for one tank block/selection.
+
+    Cache file layout (little endian)::
+
+      header         '<4siiid': 'PTTC', version, ntrials, nspikes, stamp
+      int32 + str    repr() of the cache key
+      f8 x ntrials   trl1 (secs)
+      f8 x ntrials   trl2 (secs)
+      i4 x ntrials+1 offset of each trial's first spike
+      f8 x nspikes   spike times (ms, relative to trial's trl1)
+      i4 x nspikes   channel
+      i4 x nspikes   sort code (unit)
+
+    """
+    def __init__(self, server, tank, block, chan=0, unit=0, stamp=None):
+        self.key = repr((server, tank, block, chan, unit))
+        self.stamp = stamp
+        d = cachedir()
+        if d is None:
+            self.fname = None
+        else:
+            self.fname = os.path.join(d, hashlib.md5(self.key).hexdigest() +
+                                      '.ttc')
+
+    def load(self):
+        """Returns (trl1, trl2, sdata) or None if not (validly) cached."""
+        if self.fname is None:
+            return None
+        try:
+            s = open(self.fname, 'rb').read()
+        except IOError:
+            return None
+        try:
+            p = struct.calcsize(_CACHEHDR)
+            (magic, version, ntrials, nspikes, stamp) = \
+                    struct.unpack(_CACHEHDR, s[:p])
+            if magic != _CACHEMAGIC or version != _CACHEVERSION:
+                return None
+            if self.stamp is not None and stamp != self.stamp:
+                # tank's changed since this was cached
+                return None
+            (n,) = struct.unpack('<i', s[p:p+4])
+            if s[p+4:p+4+n] != self.key:
+                return None
+            p = p + 4 + n
+            cols = []
+            for (tc, count) in ((Numeric.Float64, ntrials),
+                                (Numeric.Float64, ntrials),
+                                (Numeric.Int32, ntrials + 1),
+                                (Numeric.Float64, nspikes),
+                                (Numeric.Int32, nspikes),
+                                (Numeric.Int32, nspikes)):
+                nb = count * len(Numeric.zeros(1, tc).tostring())
+                if len(s) < p + nb:
+                    return None
+                cols.append(_fromstring(s[p:p+nb], tc))
+                p = p + nb
+        except struct.error:
+            return None
+        (trl1, trl2, offsets, t, c, u) = cols
+        sdata = []
+        for k in range(ntrials):
+            (a, b) = (offsets[k], offsets[k+1])
+            sdata.append((t[a:b], c[a:b], u[a:b],
+                          pypespikes.unitcode(c[a:b], u[a:b])))
+        return (list(trl1), list(trl2), sdata)
+
+    def save(self, trl1, trl2, sdata):
+        if self.fname is None:
+            return
+        offsets = [0]
+        for x in sdata:
+            offsets.append(offsets[-1] + len(x[0]))
+        if len(sdata):
+            (t, c, u) = [Numeric.concatenate([x[k] for x in sdata])
+                         for k in range(3)]
+        else:
+            (t, c, u) = ([], [], [])
+        stamp = self.stamp
+        if stamp is None:
+            stamp = 0.0
+        data = [struct.pack(_CACHEHDR, _CACHEMAGIC, _CACHEVERSION,
+                            len(sdata), offsets[-1], stamp),
+                struct.pack('<i', len(self.key)), self.key,
+                _tostring(trl1, Numeric.Float64),
+                _tostring(trl2, Numeric.Float64),
+                _tostring(offsets, Numeric.Int32),
+                _tostring(t, Numeric.Float64),
+                _tostring(Numeric.around(c), Numeric.Int32),
+                _tostring(Numeric.around(u), Numeric.Int32)]
+        try:
+            d = os.path.dirname(self.fname)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            tmp = '%s.%d' % (self.fname, os.getpid())
+            f = open(tmp, 'wb')
+            f.write(''.join(data))
+            f.close()
+            os.rename(tmp, self.fname)
+        except (IOError, OSError), e:
+            sys.stderr.write('Warning: can\'t cache tank data: %s\n' % e)
+
+def pull(rec, chan=0, unit=0, datafile=None):
+    """Spikes for rec's tank block, from the local cache if possible.
+
+    **rec** -- any PypeRecord from the datafile (for the tank info)
+
+    **datafile** -- the pype datafile (for cache invalidation if the
+    tank isn't visible locally, see tankstamp())
+
+    Returns a Spikes object that's already been query()'d. If it
+    came out of the cache, no connection to the tank server is made
+    (obj.tt is None) and obj.cached is true.
+
+    """
+    s = Spikes(rec=rec, connect=0)
+    cache = SpikeCache(s.server, s.tank, s.block, chan, unit,
+                       tankstamp(s.tank, s.block, datafile))
+    x = cache.load()
+    if x is not None:
+        (s.trl1, s.trl2, s.sdata) = x
+        s.ntrials = len(s.sdata)
+        s.cached = 1
+        return s
+    s = Spikes(rec=rec)
+    s.query(chan=chan, unit=unit)
+    s.cached = 0
+    cache.save(s.trl1, s.trl2, s.sdata)
+    return s
 
 class Raw(TDTBaseClass):
     def query(self, tnum, chan=0):
@@ -182,7 +424,111 @@ class Raw(TDTBaseClass):
                                   (tnum+1, t[j]-t[0], k+1, w[j,k]))
             sys.stderr.write('%d samples/sec\n' % (w.shape[0]*w.shape[1]/toc))
 
+class _SyntheticTank:
+    """Fake ttank.TTank with n random spikes (for benchmark())."""
+    def __init__(self, nspikes, ntrials, nchans=16, npts=0):
+        import random
+        r = random.Random(1)
+        # trials are 1.5s gates every 2s
+        self.trl1 = [2.0 * k for k in range(ntrials)]
+        self.trl2 = [2.0 * k + 1.5 for k in range(ntrials)]
+        tmax = 2.0 * ntrials
+        self.t = Numeric.sort(Numeric.array([r.uniform(0, tmax)
+                                             for i in range(nspikes)]))
+        self.chan = Numeric.array([r.randint(1, nchans)
+                                   for i in range(nspikes)], Numeric.Float)
+        self.sort = Numeric.array([r.randint(0, 4)
+                                   for i in range(nspikes)], Numeric.Float)
+        self.npts = npts
+
+    def invoke(self, method, *args):
+        # only knows about the 'Snip' queries Spikes.query() makes
+        if method == 'ReadEventsV':
+            return len(self.t)
+        elif method == 'ParseEvInfoV':
+            return {ttank.TIME: self.t,
+                    ttank.CHANNUM: self.chan,
+                    ttank.SORTNUM: self.sort}[args[2]]
+        elif method == 'ParseEvV':
+            # npts x nevents, like the real thing
+            return Numeric.reshape(Numeric.arange(self.npts * len(self.t)),
+                                   (self.npts, len(self.t)))
+
+def _query_masked(s, tall, call, sall):
+    # the old per-trial full mask version of query(), for comparison
+    sdata = []
+    for k in range(len(s.trl1)):
+        mask = Numeric.logical_and(Numeric.greater_equal(tall, s.trl1[k]),
+                                   Numeric.less_equal(tall, s.trl2[k]))
+        sdata.append(((Numeric.compress(mask, tall) - s.trl1[k]) * 1000.0,
+                      Numeric.compress(mask, call),
+                      Numeric.compress(mask, sall)))
+    return sdata
+
+def benchmark(nspikes=1000000, ntrials=1000, out=sys.stderr):
+    """Time Spikes.query() on a synthetic tank (and check results)."""
+    tank = _SyntheticTank(nspikes, ntrials)
+    s = Spikes(server='synthetic', tank='synthetic', block='synthetic',
+               connect=0)
+    (s.tt, s.trl1, s.trl2) = (tank, tank.trl1, tank.trl2)
+
+    tic = time.time()
+    s.query()
+    tpart = time.time() - tic
+    out.write('partitioned: %d spikes, %d trials: %.2fs\n' %
+              (nspikes, ntrials, tpart))
+
+    tic = time.time()
+    old = _query_masked(s, tank.t, tank.chan, tank.sort)
+    tmask = time.time() - tic
+    out.write('masked:      %d spikes, %d trials: %.2fs (%.0fx)\n' %
+              (nspikes, ntrials, tmask, tmask / max(tpart, 1e-6)))
+
+    for k in range(ntrials):
+        for j in range(3):
+            if len(old[k][j]) != len(s.sdata[k][j]) or \
+                   not Numeric.alltrue(Numeric.equal(old[k][j],
+                                                     s.sdata[k][j])):
+                raise ValueError, 'benchmark: mismatch in trial %d' % k
+
+    # cache round trip (TDT channels/sort codes are floats)
+    import tempfile, shutil
+    d = tempfile.mkdtemp()
+    try:
+        cache = SpikeCache('synthetic', 'synthetic', 'synthetic', stamp=1.0)
+        cache.fname = os.path.join(d, 'bench.ttc')
+        tic = time.time()
+        cache.save(s.trl1, s.trl2, s.sdata)
+        tsave = time.time() - tic
+        tic = time.time()
+        (trl1, trl2, sdata) = cache.load()
+        out.write('cache:       save %.2fs, load %.2fs\n' %
+                  (tsave, time.time() - tic))
+    finally:
+        shutil.rmtree(d)
+    for k in range(ntrials):
+        for j in range(3):
+            if not Numeric.alltrue(Numeric.equal(sdata[k][j],
+                                                 s.sdata[k][j])):
+                raise ValueError, 'benchmark: bad cache data in trial %d' % k
+
+    # snippets (smaller, they're big)
+    tank = _SyntheticTank(nspikes / 20, ntrials / 20, npts=30)
+    (s.tt, s.trl1, s.trl2) = (tank, tank.trl1, tank.trl2)
+    tic = time.time()
+    s.query(getwaves=1)
+    out.write('waveforms:   %d spikes, %d trials: %.2fs\n' %
+              (len(tank.t), len(tank.trl1), time.time() - tic))
+    for k in range(len(s.trl1)):
+        if s.wdata[k].shape != (len(s.sdata[k][0]), 30):
+            raise ValueError, 'benchmark: bad waveforms in trial %d' % k
+    return tpart, tmask
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
+        sys.exit(0)
+
     f = '/auto/data/critters/flea/2008/2008-02-08/flea0137.spotmap.005.gz'
     x = Raw(pypefile=f)
     x.dump(sys.stdout)
@@ -18,6 +18,10 @@ Author -- James A. Mazer (james.mazer@yale.edu)
 - Sat Apr 14 14:00:12 2001 mazer
 
  - added sparseness()
+
+- Sat Oct 24 09:31:18 2026 mazer
+
+ - smooth() is vectorized (same results, no per-sample loop)
  
 """
 
@@ -100,19 +104,41 @@ def smooth1(yi, ksize=3):
 	return yo
 
 def smooth(v, kn=1):
-	"""Smooth vector kn=1 --> 3pt average."""
+	"""Smooth vector kn=1 --> 3pt average.
+
+	Each output point is the mean of v[ix-kn:ix+kn] (clipped at the
+	ends). Note that the result is stored in an Int array (Numeric's
+	zeros() default), so the smoothed values are truncated.
+
+	"""
 	if not type(v) == Numeric.ArrayType:
 		v = Numeric.array(v, 'f')
 	n = len(v)
 	vout = Numeric.zeros(v.shape)
-	for ix in range(0, n):
-		a = ix - kn
-		if a < 0:
-			a = 0
-		b = ix + kn
-		if b > n:
-			b = n
-		vout[ix] = mean(v[a:b])
+	if kn < 1 or len(v.shape) != 1:
+		# degenerate window or not a vector -- do it the slow way
+		for ix in range(0, n):
+			a = ix - kn
+			if a < 0:
+				a = 0
+			b = ix + kn
+			if b > n:
+				b = n
+			vout[ix] = mean(v[a:b])
+		return vout
+	if n == 0:
+		return vout
+	# sum the 2*kn shifted copies of v (zero padded at the ends); the
+	# additions happen in the same order and precision as sum() on
+	# each window would do them, so the results are identical
+	z = Numeric.zeros((kn,), v.typecode())
+	p = Numeric.concatenate((z, v, z))
+	acc = p[0:n]
+	for k in range(1, 2 * kn):
+		acc = acc + p[k:k+n]
+	ix = Numeric.arange(n)
+	count = Numeric.minimum(ix + kn, n) - Numeric.maximum(ix - kn, 0)
+	vout[:] = acc / count.astype(Numeric.Float)
 	return vout
 
 def decimate(v, n):
@@ -11,7 +11,7 @@ from pype import *
 from pypedata import *
 
 def count(fname):
-	pf = PypeFile(fname)
+	pf = PypeFile(fname, headers=1)
 	n = 0
 	while 1:
 		d = pf.nth(n)
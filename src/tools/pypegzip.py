@@ -0,0 +1,25 @@
+#!/usr/bin/env pypenv
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""
+Compress pype datafiles into block gzip format (see pypezip.py).
+
+The resulting foo.gz file is a perfectly normal gzip file (gunzip
+and zcat still work), but PypeFile can seek directly to any record
+in it using the record index instead of decompressing everything
+up to that record. The original datafile is left alone.
+
+Usage:  pypegzip.py datafile [datafile...]
+"""
+
+import sys
+
+from pype import *
+import pypezip
+
+if len(sys.argv) < 2:
+	sys.stderr.write('usage: pypegzip.py datafile [datafile...]\n')
+	sys.exit(1)
+
+for f in sys.argv[1:]:
+	sys.stderr.write('%s -> %s\n' % (f, pypezip.compress(f)))
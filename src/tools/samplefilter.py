@@ -22,7 +22,7 @@ while 1:
 	label, obj = labeled_load(sys.stdin)
 	if label is None:
 		break
-	if label == 'encode':
+	if label in ('encode', 'encodeh'):
 		(result, rt, P, taskinfo) = obj[1]
 		#...
 		# change P[] or anything else in obj[1] here
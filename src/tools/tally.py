@@ -12,7 +12,7 @@ from pype import *
 from pypedata import *
 
 def dump(fname):
-	pf = PypeFile(fname)
+	pf = PypeFile(fname, headers=1)
 
 	N = {}
 	ncorr = 0